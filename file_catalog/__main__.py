@@ -7,9 +7,12 @@ import argparse
 import asyncio
 import logging
 from pprint import pprint
-from typing import cast, Optional
+import socket
+from typing import cast, List, Optional
 
 import coloredlogs  # type: ignore[import]
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes
 
 from file_catalog.config import Config
 from file_catalog.mongo import Mongo
@@ -18,27 +21,74 @@ from file_catalog.server import create
 logger = logging.getLogger(__name__)
 
 
-async def main(config: Config) -> None:
-    """Create and run the File Catalog service."""
-    mongo = Mongo(host       = cast(str,           config.get('MONGODB_HOST',      None)),  # noqa: E221, E241, E251
-                  port       = cast(int,           config.get('MONGODB_PORT',      None)),  # noqa: E221, E241, E251
-                  authSource = cast(str,           config['MONGODB_AUTH_SOURCE_DB']),       # noqa: E221, E241, E251
-                  username   = cast(Optional[str], config.get('MONGODB_AUTH_USER', None)),  # noqa: E221, E241, E251
-                  password   = cast(Optional[str], config.get('MONGODB_AUTH_PASS', None)),  # noqa: E221, E241, E251
-                  uri        = cast(Optional[str], config.get('MONGODB_URI',       None)))  # noqa: E221, E241, E251
+async def main(config: Config, sockets: Optional[List[socket.socket]] = None) -> None:
+    """Create and run the File Catalog service.
+
+    If `sockets` are given, serve on those (see `main_sync()`).
+    """
+    mongo = Mongo(host                  = cast(str,           config.get('MONGODB_HOST',      None)),       # noqa: E221, E241, E251
+                  port                  = cast(int,           config.get('MONGODB_PORT',      None)),       # noqa: E221, E241, E251
+                  authSource            = cast(str,           config['MONGODB_AUTH_SOURCE_DB']),            # noqa: E221, E241, E251
+                  username              = cast(Optional[str], config.get('MONGODB_AUTH_USER', None)),       # noqa: E221, E241, E251
+                  password              = cast(Optional[str], config.get('MONGODB_AUTH_PASS', None)),       # noqa: E221, E241, E251
+                  uri                   = cast(Optional[str], config.get('MONGODB_URI',       None)),       # noqa: E221, E241, E251
+                  count_cache_ttl       = cast(int,           config['FC_COUNT_CACHE_TTL']),                # noqa: E221, E241, E251
+                  file_cache_ttl        = cast(int,           config['FC_FILE_CACHE_TTL']),                 # noqa: E221, E241, E251
+                  file_cache_bytes      = cast(int,           config['FC_FILE_CACHE_BYTES']),               # noqa: E221, E241, E251
+                  collection_cache_ttl  = cast(int,           config['FC_COLLECTION_CACHE_TTL']),           # noqa: E221, E241, E251
+                  read_preference       = cast(str,           config['MONGODB_READ_PREFERENCE']),           # noqa: E221, E241, E251
+                  max_staleness_seconds = cast(int,           config['MONGODB_MAX_STALENESS_SECONDS']),     # noqa: E221, E241, E251
+                  max_pool_size         = cast(int,           config['MONGODB_MAX_POOL_SIZE']),             # noqa: E221, E241, E251
+                  min_pool_size         = cast(int,           config['MONGODB_MIN_POOL_SIZE']),             # noqa: E221, E241, E251
+                  max_idle_time_ms      = cast(int,           config['MONGODB_MAX_IDLE_TIME_MS']) or None,  # noqa: E221, E241, E251
+                  slow_query_ms         = cast(int,           config['FC_SLOW_QUERY_MS']),                  # noqa: E221, E241, E251
+                  slow_query_explain_percent = cast(int,      config['FC_SLOW_QUERY_EXPLAIN_PERCENT']),     # noqa: E221, E241, E251
+                  slow_queries_bytes    = cast(int,           config['FC_SLOW_QUERIES_BYTES']),             # noqa: E221, E241, E251
+                  slow_query_explain_max_ms = cast(int,       config['FC_SLOW_QUERY_EXPLAIN_MAX_MS']))      # noqa: E221, E241, E251
 
     await mongo.create_indexes()
 
-    create(config = config,                         # noqa: E221, E241, E251
-           port   = cast(int,  config['FC_PORT']),  # noqa: E221, E241, E251
-           debug  = cast(bool, config['DEBUG']),    # noqa: E221, E241, E251
-           mongo  = mongo)                          # noqa: E221, E241, E251
+    create(config  = config,                         # noqa: E221, E241, E251
+           port    = cast(int,  config['FC_PORT']),  # noqa: E221, E241, E251
+           debug   = cast(bool, config['DEBUG']),    # noqa: E221, E241, E251
+           mongo   = mongo,                          # noqa: E221, E241, E251
+           sockets = sockets)                        # noqa: E221, E241, E251
+
+    # background tasks (referenced, so they aren't garbage-collected)
+    tasks = []
+    if cast(int, config['FC_COLLECTION_REFRESH_SECONDS']) > 0:
+        tasks.append(asyncio.create_task(refresh_collections(config, mongo)))
+    if cast(int, config['FC_SNAPSHOT_STALE_SECONDS']) > 0:
+        tasks.append(asyncio.create_task(fail_stale_snapshots(config, mongo)))
 
     while True:
         logger.info("Will sleep for 60 seconds")
         await asyncio.sleep(60)
 
 
+async def refresh_collections(config: Config, mongo: Mongo) -> None:
+    """Keep materialized collections up to date, every `FC_COLLECTION_REFRESH_SECONDS`."""
+    while True:
+        await asyncio.sleep(cast(int, config['FC_COLLECTION_REFRESH_SECONDS']))
+        try:
+            count = await mongo.refresh_materialized_collections(cast(int, config['FC_CHANGES_SETTLE_SECONDS']))
+            logger.debug(f"Refreshed materialized collections: {count} changed files")
+        except Exception:
+            logger.exception("Failed to refresh materialized collections")
+
+
+async def fail_stale_snapshots(config: Config, mongo: Mongo) -> None:
+    """Fail snapshots left pending (by dead processes), every minute."""
+    while True:
+        try:
+            count = await mongo.fail_stale_snapshots(cast(int, config['FC_SNAPSHOT_STALE_SECONDS']))
+            if count:
+                logger.warning(f"Failed {count} stale pending snapshot(s)")
+        except Exception:
+            logger.exception("Failed to fail stale snapshots")
+        await asyncio.sleep(60)
+
+
 def main_sync() -> None:
     """Do synchronous setup for the File Catalog service."""
     parser = argparse.ArgumentParser(description='File catalog')
@@ -55,8 +105,18 @@ def main_sync() -> None:
 
     coloredlogs.install(level=('DEBUG' if config['DEBUG'] else 'INFO'))
 
+    # pre-fork worker processes, which share the listening socket
+    # NOTE: each worker creates its own MongoClient & event loop (neither survive a fork)
+    sockets = None
+    if config['FC_WORKERS'] != 1:
+        sockets = bind_sockets(cast(int, config['FC_PORT']),
+                               address=cast(str, config['FC_HOST']),
+                               family=socket.AF_INET)
+        task_id = fork_processes(cast(int, config['FC_WORKERS']))
+        logger.info(f"Started worker process #{task_id}")
+
     try:
-        asyncio.run(main(config))
+        asyncio.run(main(config, sockets))
     except Exception:
         logging.fatal('Server error', exc_info=True)
         raise
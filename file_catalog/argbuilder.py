@@ -5,7 +5,15 @@ from typing import Any, Dict, Optional, Union
 
 from tornado.escape import json_decode
 
-from file_catalog.mongo import AllKeys
+from file_catalog import metrics
+from file_catalog.mongo import (
+    AGGREGATE_GROUP_BY_FIELDS,
+    AllKeys,
+    decode_changes_token,
+    decode_continuation_token,
+    decode_snapshot_token,
+)
+from file_catalog.utils import escape_regex
 
 
 def build_limit(kwargs: Dict[str, Any], config: Dict[str, Any]) -> None:
@@ -31,10 +39,46 @@ def build_start(kwargs: Dict[str, Any]) -> None:
             raise Exception("start is negative")
 
 
+def build_after(kwargs: Dict[str, Any]) -> None:
+    """Build the `"after"` argument (keyset pagination), if given.
+
+    An empty value requests the first page.
+    """
+    if "after" in kwargs:
+        if "start" in kwargs:
+            raise Exception("start and after are mutually exclusive")
+        if kwargs["after"] is not None:
+            kwargs["after"] = decode_continuation_token(str(kwargs["after"]))
+
+
+def build_snapshot_after(kwargs: Dict[str, Any]) -> None:
+    """Build the `"after"` argument (a snapshot position), if given.
+
+    An empty value requests the first page (position 0).
+    """
+    if "after" in kwargs:
+        if "start" in kwargs:
+            raise Exception("start and after are mutually exclusive")
+        if kwargs["after"] is None:
+            kwargs["after"] = 0
+        else:
+            kwargs["after"] = decode_snapshot_token(str(kwargs["after"]))
+
+
+def build_since(kwargs: Dict[str, Any]) -> None:
+    """Build the `"since"` argument (changes feed position), if given.
+
+    An empty value requests the first page.
+    """
+    if kwargs.get("since") is not None:
+        kwargs["since"] = decode_changes_token(str(kwargs["since"]))
+
+
 def _resolve_name_args(kwargs: Dict[str, Any]) -> Optional[Union[Dict[str, Any], str]]:
     """Resolve the name-type shortcut arguments by precedence.
 
-    Pop each key from `kwargs`, even if it's not used.
+    Pop each key from `kwargs`, even if it's not used. Empty
+    `directory` & `filename` values don't filter by name at all.
     """
     arg: Optional[Union[Dict[str, Any], str]] = None
 
@@ -47,16 +91,21 @@ def _resolve_name_args(kwargs: Dict[str, Any]) -> Optional[Union[Dict[str, Any],
         arg = kwargs.pop("logical_name")
 
     # directory & filename
+    # NOTE - anchor the directory, so the ascending `logical_name` index is range-scanned
     if "directory" in kwargs or "filename" in kwargs:
-        if not (directory := kwargs.pop("directory", "").rstrip("/")):
-            directory = r".*"
-        if not (fname := kwargs.pop("filename", "").lstrip("/")):
-            fname = r".*"
-        arg = {"$regex": rf"^{directory}/(.*/)?{fname}$"}
+        directory = escape_regex(str(kwargs.pop("directory", None) or "").rstrip("/"))
+        fname = escape_regex(str(kwargs.pop("filename", None) or "").lstrip("/"))
+        if directory and fname:
+            arg = {"$regex": rf"^{directory}/(.*/)?{fname}$"}
+        elif directory:
+            arg = {"$regex": rf"^{directory}/"}
+        elif fname:
+            arg = {"$regex": rf"/{fname}$"}
 
     return arg
 
 
+@metrics.timed(metrics.PHASE_PARSE)
 def build_files_query(kwargs: Dict[str, Any]) -> None:
     """Build `"query"` dict with formatted/fully-named arguments.
 
@@ -104,3 +153,15 @@ def build_keys(kwargs: Dict[str, Any]) -> None:
         kwargs["keys"] = AllKeys()
     elif "keys" in kwargs:
         kwargs["keys"] = kwargs["keys"].split("|")
+
+
+def build_exact(kwargs: Dict[str, Any]) -> None:
+    """Build the `"exact"` argument (defaults to `True`)."""
+    kwargs["exact"] = kwargs.pop("exact", None) not in ["False", "false", 0]
+
+
+def build_group_by(kwargs: Dict[str, Any]) -> None:
+    """Build the `"group_by"` argument, which must be a whitelisted field (or omitted)."""
+    if kwargs.get("group_by") is not None:
+        if kwargs["group_by"] not in AGGREGATE_GROUP_BY_FIELDS:
+            raise Exception(f"cannot group by {kwargs['group_by']}")
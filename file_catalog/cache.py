@@ -0,0 +1,77 @@
+# cache.py
+"""In-process caches with hit/miss statistics."""
+
+import time
+from typing import Any, Dict, Generic, Hashable, MutableMapping, Optional, TypeVar
+
+import cachetools
+
+V = TypeVar("V")
+
+
+class StatsCache(Generic[V]):
+    """Wrap a `cachetools` cache and keep hit/miss statistics."""
+
+    def __init__(self, cache: MutableMapping[Hashable, V]) -> None:
+        self._cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Return the cached value (or `None`), and count the hit/miss."""
+        value = self._cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        """Cache `value` (unless it alone is bigger than the cache)."""
+        try:
+            self._cache[key] = value
+        except ValueError:  # "value too large"
+            self._cache.pop(key, None)
+
+    def pop(self, key: Hashable) -> None:
+        """Evict `key`, if it's cached."""
+        self._cache.pop(key, None)
+
+    def clear(self) -> None:
+        """Evict everything."""
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the cache's statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._cache),
+            "currsize": getattr(self._cache, "currsize", len(self._cache)),
+            "maxsize": getattr(self._cache, "maxsize", None),
+        }
+
+
+def ttl_cache(maxsize: int, ttl: float) -> "StatsCache[Any]":
+    """Create a `StatsCache` whose entries expire after `ttl` seconds."""
+    cache: "cachetools.TTLCache[Hashable, Any, float]" = cachetools.TTLCache(maxsize=maxsize, ttl=ttl, timer=time.monotonic)
+    return StatsCache(cache)
+
+
+def bytes_ttl_cache(maxbytes: int, ttl: float) -> "StatsCache[bytes]":
+    """Create a least-recently-used `StatsCache` of `bytes` values, bounded by their total length.
+
+    Entries also expire after `ttl` seconds.
+    """
+    cache: "cachetools.TTLCache[Hashable, bytes, float]" = cachetools.TTLCache(
+        maxsize=maxbytes, ttl=ttl, timer=time.monotonic, getsizeof=len
+    )
+    return StatsCache(cache)
+
+
+def lru_cache(maxsize: int) -> "StatsCache[Any]":
+    """Create a `StatsCache` that evicts the least-recently used entry when full."""
+    cache: "cachetools.LRUCache[Hashable, Any]" = cachetools.LRUCache(maxsize=maxsize)
+    return StatsCache(cache)
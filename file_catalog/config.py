@@ -25,12 +25,65 @@ class Config(Dict[str, Optional[Union[bool, int, str]]]):
         'DEBUG': ConfigParamSpec(
             False, bool, 'debug mode (set to "" or unset to disable)'
         ),
+        'FC_BULK_LIMIT': ConfigParamSpec(
+            10000,
+            int,
+            'Maximal number of files that can be sent in one bulk request',
+        ),
+        'FC_CHANGES_SETTLE_SECONDS': ConfigParamSpec(
+            10,
+            int,
+            'Seconds before a modification is listed by /api/files/changes '
+            '(covers clock skew between servers & writes in flight, which would otherwise be skipped)',
+        ),
+        'FC_COLLECTION_CACHE_TTL': ConfigParamSpec(
+            60,
+            int,
+            'Seconds that a cached collection definition is served (this bounds staleness from writes by other File Catalog instances)',
+        ),
+        'FC_COLLECTION_REFRESH_SECONDS': ConfigParamSpec(
+            30,
+            int,
+            'Seconds between bringing materialized collections up to date with file changes (0 to disable)',
+        ),
         'FC_COOKIE_SECRET': ConfigParamSpec(
             None, str, 'Value of cookie_secret argument for tornado.web.Application'
         ),
+        'FC_COUNT_CACHE_TTL': ConfigParamSpec(
+            60,
+            int,
+            'Seconds that a cached file count is served to inexact (exact=false) count requests',
+        ),
+        'FC_FILE_CACHE_BYTES': ConfigParamSpec(
+            0,
+            int,
+            'Size limit (bytes, as BSON) of the in-process cache of file records looked up by uuid (0 to disable)',
+        ),
+        'FC_FILE_CACHE_TTL': ConfigParamSpec(
+            60,
+            int,
+            'Seconds that a cached file record is served (this bounds staleness from writes by other File Catalog instances)',
+        ),
         'FC_HOST': ConfigParamSpec(
             'localhost', str, 'Address for File Catalog server to bind for listening (default: localhost)'
         ),
+        'FC_INDEX_ENFORCEMENT': ConfigParamSpec(
+            'off',
+            str,
+            'What to do with a file query that needs a collection scan: '
+            '"off", "flag" (log it), "limit" (cap its limit at FC_UNINDEXED_QUERY_LIMIT), or "reject" (400)',
+        ),
+        'FC_JSON_ENCODER': ConfigParamSpec(
+            'auto',
+            str,
+            'JSON encoder for responses: "json" (stdlib), "orjson", or "auto" (orjson, if installed)',
+        ),
+        'FC_METRICS': ConfigParamSpec(
+            True,
+            bool,
+            'Record request metrics (by handler, method & status; in-flight; phases; response sizes) '
+            'and serve them, unauthenticated, at /metrics in the Prometheus text format (set to "" to disable)',
+        ),
         'FC_PORT': ConfigParamSpec(
             8888, int, 'Port for File Catalog server to listen on'
         ),
@@ -42,6 +95,75 @@ class Config(Dict[str, Optional[Union[bool, int, str]]]):
             int,
             'Maximal number of files that are returned in the file list by the server',
         ),
+        'FC_RAW_BSON_JSON': ConfigParamSpec(
+            False,
+            bool,
+            'Encode file listings straight from raw BSON, without decoding documents (requires python-bsonjs; set to "" or unset to disable)',
+        ),
+        'FC_REQUEST_TIME_BUDGET_MS': ConfigParamSpec(
+            0,
+            int,
+            'Milliseconds that the database reads of one request may take in total, '
+            'after which it fails with 504 (0 for no budget; each read is still limited to 10 minutes)',
+        ),
+        'FC_REQUEST_TIME_BUDGETS_MS': ConfigParamSpec(
+            '',
+            str,
+            'Per-handler overrides of FC_REQUEST_TIME_BUDGET_MS, like "FilesCountHandler=30000,FilesHandler=5000"',
+        ),
+        'FC_SLOW_QUERIES_BYTES': ConfigParamSpec(
+            16 * 2**20,
+            int,
+            'Size (bytes) of the capped "slow_queries" collection, where slow operations are recorded',
+        ),
+        'FC_SLOW_QUERY_EXPLAIN_MAX_MS': ConfigParamSpec(
+            60000,
+            int,
+            'Milliseconds that explaining (re-running) a slow file query may take, after which only its plan is recorded',
+        ),
+        'FC_SLOW_QUERY_EXPLAIN_PERCENT': ConfigParamSpec(
+            10,
+            int,
+            'Percent of slow file queries that are explained (re-run) for their plan & documents examined',
+        ),
+        'FC_SLOW_QUERY_MS': ConfigParamSpec(
+            0,
+            int,
+            'Milliseconds from which a database operation is recorded as slow (0 to disable); see /api/slow_queries',
+        ),
+        'FC_SNAPSHOT_STALE_SECONDS': ConfigParamSpec(
+            3600,
+            int,
+            'Seconds after which a snapshot still pending (being created in the background) is marked failed, '
+            'as the process creating it has likely died (0 to disable)',
+        ),
+        'FC_SNAPSHOT_SYNC_LIMIT': ConfigParamSpec(
+            100000,
+            int,
+            'Maximal number of files in a snapshot created within its request; larger snapshots are created '
+            'in the background (202), with progress at /api/snapshots/{uuid}/status',
+        ),
+        'FC_STREAM_BATCH_SIZE': ConfigParamSpec(
+            1000,
+            int,
+            'Number of files fetched from MongoDB & flushed to the client per batch in streaming mode',
+        ),
+        'FC_UNANCHORED_REGEX_MAX_FILES': ConfigParamSpec(
+            1000000,
+            int,
+            'Reject a query with an unanchored $regex (no literal "^/prefix") if there are more files than this (0 to disable)',
+        ),
+        'FC_UNINDEXED_QUERY_LIMIT': ConfigParamSpec(
+            100,
+            int,
+            'Maximal number of files returned for a query that needs a collection scan (FC_INDEX_ENFORCEMENT="limit")',
+        ),
+        'FC_WORKERS': ConfigParamSpec(
+            1,
+            int,
+            'Number of server processes, pre-forked & sharing the listening socket (0 for one per CPU core); '
+            'caches are per process',
+        ),
         'MONGODB_AUTH_PASS': ConfigParamSpec(
             None, str, 'MongoDB authentication password'
         ),
@@ -52,7 +174,28 @@ class Config(Dict[str, Optional[Union[bool, int, str]]]):
             None, str, 'MongoDB authentication username'
         ),
         'MONGODB_HOST': ConfigParamSpec('localhost', str, 'MongoDB host'),
+        'MONGODB_MAX_IDLE_TIME_MS': ConfigParamSpec(
+            0, int, 'Milliseconds a pooled MongoDB connection may stay idle before it is closed (0 for no limit)'
+        ),
+        'MONGODB_MAX_POOL_SIZE': ConfigParamSpec(
+            100, int, 'Maximal number of MongoDB connections per server (per process)'
+        ),
+        'MONGODB_MAX_STALENESS_SECONDS': ConfigParamSpec(
+            -1,
+            int,
+            'Maximal replication lag of a secondary used by read-only queries (-1 for no maximum, otherwise at least 90)',
+        ),
+        'MONGODB_MIN_POOL_SIZE': ConfigParamSpec(
+            0, int, 'Minimal number of MongoDB connections kept per server (per process)'
+        ),
         'MONGODB_PORT': ConfigParamSpec(27017, int, 'MongoDB port'),
+        'MONGODB_READ_PREFERENCE': ConfigParamSpec(
+            'primary',
+            str,
+            'Read preference of read-only queries (file listings & counts, collection & snapshot listings): '
+            '"primary", "primaryPreferred", "secondary", "secondaryPreferred", or "nearest"; '
+            'writes & their deconfliction always use the primary',
+        ),
         'MONGODB_URI': ConfigParamSpec(None, str, 'MongoDB URI'),
         'ROUTESTATS_WINDOW_SIZE': ConfigParamSpec(
             1000,
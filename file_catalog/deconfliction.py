@@ -1,10 +1,11 @@
 """Utility functions for avoiding conflicts in the FC."""
 
 import os
-from typing import Any, AsyncGenerator, List, Optional, Tuple
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, cast
 
 from wipac_telemetry import tracing_tools as wtt
 
+from . import metrics
 from .mongo import Mongo
 from .schema import types
 
@@ -36,83 +37,226 @@ class FileVersion:
         except KeyError as e:
             raise IndeterminateFileVersionError() from e
 
-    @wtt.spanned(all_args=True)
-    async def is_in_db(self, apihandler: Any, skip: Optional[str] = None) -> bool:
-        """Return whether the file-version is already in the database.
+    def conflict_reason(self) -> str:
+        """Get the standard error message for a file-version conflict."""
+        return (
+            f"Conflict with existing file-version"
+            f" ('logical_name' + 'checksum.sha512' already exists:"
+            f"`{self.logical_name}` + `{self.checksum_sha512}`)"
+        )
 
-        A "file-version" is defined as the unique combination of a
-        `logical_name` and a `checksum.sha512`.
 
-        Pass in `skip` to disregard matches (records) with this uuid.
+UUID_CONFLICT_REASON = 'Conflict with existing file (uuid already exists)'
 
-        If it is found to already be in the DB, send 409 error.
-        """
-        # try to load a file by that file-version
-        from_db = await apihandler.db.get_file(
-            {"logical_name": self.logical_name, "checksum.sha512": self.checksum_sha512}
-        )
-        # if we got a file by that file-version
-        if _is_conflict(skip, from_db):
-            # then that file-version belongs to another file (already exists)
-            apihandler.send_error(
-                409,
-                reason=(
-                    f"Conflict with existing file-version"
-                    f" ('logical_name' + 'checksum.sha512' already exists:"
-                    f"`{self.logical_name}` + `{self.checksum_sha512}`)"
-                ),
-                file=os.path.join(apihandler.files_url, from_db["uuid"]),
-            )
-            return True
 
-        return False
+def location_conflict_reason(loc: types.LocationEntry) -> str:
+    """Get the standard error message for a location conflict."""
+    return f"Conflict with existing file (location already exists `{loc['path']}`)"
 
 
-@wtt.spanned(all_args=True)
-async def find_each_location_in_db(
-    db: Mongo,
-    locations: List[types.LocationEntry],
-) -> AsyncGenerator[Tuple[types.LocationEntry, Optional[types.Metadata]], None]:
-    """Yield each location entry with its database metadata file (or `None`)."""
-    for loc in locations:
-        # try to load a file by that location
-        from_db = await db.get_file({"locations": {"$elemMatch": loc}})
-        yield loc, from_db
-
-
-def send_location_conflict_error(
-    apihandler: Any, loc: types.LocationEntry, uuid: str
-) -> None:
-    """Send standard error message for a location conflict."""
+class Conflict(NamedTuple):
+    """A conflict with an existing record."""
+
+    reason: str
+    record: types.Metadata
+    location: Optional[types.LocationEntry] = None
+
+
+def send_conflict_error(apihandler: Any, conflict: Conflict) -> None:
+    """Send standard error message (409) for a conflict."""
+    kwargs: Dict[str, Any] = {}
+    if conflict.location:
+        kwargs["location"] = conflict.location
     apihandler.send_error(
         409,
-        reason=f"Conflict with existing file (location already exists `{loc['path']}`)",
-        file=os.path.join(apihandler.files_url, uuid),
-        location=loc,
+        reason=conflict.reason,
+        file=os.path.join(apihandler.files_url, conflict.record["uuid"]),
+        **kwargs,
     )
 
 
+# the fields needed to detect any kind of conflict
+CONFLICT_KEYS = ["uuid", "logical_name", "checksum.sha512", "locations"]
+
+
+def _location_key(loc: types.LocationEntry) -> Tuple[Any, Any]:
+    return loc.get("site"), loc.get("path")
+
+
+def _is_location_match(loc: types.LocationEntry, entry: types.LocationEntry) -> bool:
+    """Return whether `entry` matches `loc`, like `{"$elemMatch": loc}`."""
+    return all(entry.get(k) == v for k, v in loc.items())
+
+
+class ConflictIndex:
+    """An in-memory index of (partial) records, for detecting conflicts.
+
+    Records are added from one set-based query (see `find_conflicts()`),
+    and can be added as they're accepted, to detect conflicts within a
+    batch of new records.
+    """
+
+    def __init__(self) -> None:
+        self.by_uuid: Dict[str, types.Metadata] = {}
+        self.by_file_version: Dict[Tuple[str, str], types.Metadata] = {}
+        self.by_location: Dict[Tuple[Any, Any], List[types.Metadata]] = {}
+
+    def add(self, record: types.Metadata) -> None:
+        """Index `record` by uuid, file-version, & each location."""
+        self.by_uuid[record["uuid"]] = record
+        try:
+            version = FileVersion(record)
+            self.by_file_version[(version.logical_name, version.checksum_sha512)] = record
+        except IndeterminateFileVersionError:
+            pass
+        for entry in record.get("locations", []):
+            self.by_location.setdefault(_location_key(entry), []).append(record)
+
+    def get_uuid_conflict(self, uuid: str) -> Optional[types.Metadata]:
+        """Return the record that already has this uuid, or `None`."""
+        return self.by_uuid.get(uuid)
+
+    def get_file_version_conflict(
+        self, version: "FileVersion", skip: Optional[str] = None
+    ) -> Optional[types.Metadata]:
+        """Return the (other) record that already has this file-version, or `None`."""
+        record = self.by_file_version.get((version.logical_name, version.checksum_sha512))
+        if _is_conflict(skip, record):
+            return record
+        return None
+
+    def get_location_matches(self, loc: types.LocationEntry) -> List[types.Metadata]:
+        """Return each record with a location entry matching `loc`."""
+        if not isinstance(loc, dict):
+            return []
+        return [
+            record for record in self.by_location.get(_location_key(loc), [])
+            if any(_is_location_match(loc, e) for e in record.get("locations", []))
+        ]
+
+    def get_location_conflict(
+        self, locations: Optional[List[types.LocationEntry]], skip: Optional[str] = None
+    ) -> Optional[Conflict]:
+        """Return the conflict for the first location that belongs to another record."""
+        for loc in locations or []:
+            for record in self.get_location_matches(loc):
+                if _is_conflict(skip, record):
+                    return Conflict(location_conflict_reason(loc), record, loc)
+        return None
+
+    def get_creation_conflict(self, metadata: types.Metadata) -> Optional[Conflict]:
+        """Return the first conflict for a new record, or `None`.
+
+        A new record should not conflict with any existing record:
+        by uuid, by existing file-version, or by existing location(s).
+        """
+        if record := self.get_uuid_conflict(metadata["uuid"]):
+            return Conflict(UUID_CONFLICT_REASON, record)
+
+        version = FileVersion(metadata)
+        if record := self.get_file_version_conflict(version):
+            return Conflict(version.conflict_reason(), record)
+
+        if conflict := self.get_location_conflict(metadata.get("locations")):
+            return conflict
+
+        return None
+
+    def get_modification_conflict(
+        self, uuid: str, metadata: types.Metadata
+    ) -> Optional[Conflict]:
+        """Return the first conflict for a modified record, or `None`.
+
+        A modified record should not conflict with any other existing
+        record: by existing location(s) or by existing file-version (if
+        `metadata` has one).
+        """
+        if conflict := self.get_location_conflict(metadata.get("locations"), skip=uuid):
+            return conflict
+
+        try:
+            version = FileVersion(metadata)
+        except IndeterminateFileVersionError:
+            return None
+        if record := self.get_file_version_conflict(version, skip=uuid):
+            return Conflict(version.conflict_reason(), record)
+
+        return None
+
+
+@metrics.timed(metrics.PHASE_VALIDATION)
+@wtt.spanned()
+async def find_conflicts(
+    db: Mongo,
+    uuids: Optional[List[str]] = None,
+    file_versions: Optional[List["FileVersion"]] = None,
+    locations: Optional[List[types.LocationEntry]] = None,
+) -> ConflictIndex:
+    """Find every record that could conflict, in one round trip.
+
+    Candidates are matched by `$in` on uuid, logical_name, and location
+    path; the exact checks are done by the returned `ConflictIndex`.
+    """
+    index = ConflictIndex()
+
+    clauses: List[Dict[str, Any]] = []
+    if uuids:
+        clauses.append({"uuid": {"$in": list(set(uuids))}})
+    if file_versions:
+        names = list(set(v.logical_name for v in file_versions))
+        clauses.append({"logical_name": {"$in": names}})
+    if locations:
+        paths = list(set(
+            loc["path"] for loc in locations if isinstance(loc, dict) and "path" in loc
+        ))
+        clauses.append({"locations.path": {"$in": paths}})
+    if not clauses:
+        return index
+
+    records = await db.find_files({"$or": clauses}, CONFLICT_KEYS)
+    for record in records:
+        index.add(cast(types.Metadata, record))
+
+    return index
+
+
+@metrics.timed(metrics.PHASE_VALIDATION)
 @wtt.spanned(all_args=True)
-async def any_location_in_db(
-    apihandler: Any,
-    locations: Optional[List[types.LocationEntry]],
-    skip: Optional[str] = None,
-) -> bool:
-    """Return whether any of the given locations are already in the database.
+async def find_creation_conflict(db: Mongo, metadata: types.Metadata) -> Optional[Conflict]:
+    """Return the first conflict for a new record, or `None`.
 
-    Pass in `skip` to disregard matches (records) with this uuid.
+    All the checks (uuid, file-version, & each location) are done with
+    one database query.
 
-    If any are found to already be in the DB, send 409 error.
+    Raises `IndeterminateFileVersionError` if `metadata` has no file-version.
     """
-    if not locations:
-        return False
+    version = FileVersion(metadata)
+    index = await find_conflicts(
+        db,
+        uuids=[metadata["uuid"]],
+        file_versions=[version],
+        locations=metadata.get("locations"),
+    )
+    return index.get_creation_conflict(metadata)
+
 
-    # for each location provided
-    async for loc, from_db in find_each_location_in_db(apihandler.db, locations):
-        # if we got a file by that location
-        if from_db and _is_conflict(skip, from_db):
-            # then that location belongs to another file (already exists)
-            send_location_conflict_error(apihandler, loc, from_db["uuid"])
-            return True
+@metrics.timed(metrics.PHASE_VALIDATION)
+@wtt.spanned(all_args=True)
+async def find_modification_conflict(
+    db: Mongo, uuid: str, metadata: types.Metadata
+) -> Optional[Conflict]:
+    """Return the first conflict for the record `uuid` being modified, or `None`.
 
-    return False
+    All the checks (file-version & each location) are done with one
+    database query.
+    """
+    try:
+        file_versions = [FileVersion(metadata)]
+    except IndeterminateFileVersionError:
+        file_versions = []
+    index = await find_conflicts(
+        db,
+        file_versions=file_versions,
+        locations=metadata.get("locations"),
+    )
+    return index.get_modification_conflict(uuid, metadata)
@@ -0,0 +1,86 @@
+# encoding.py
+"""JSON encoders for responses, with optional fast implementations."""
+
+import json
+import logging
+from typing import Any, Callable, Iterable
+
+from bson.raw_bson import RawBSONDocument  # type: ignore[import]
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import bsonjs  # type: ignore[import]
+    HAS_BSONJS = True
+except ImportError:
+    HAS_BSONJS = False
+
+logger = logging.getLogger(__name__)
+
+JSONEncoder = Callable[[Any], bytes]
+
+ENCODER_AUTO = "auto"
+ENCODER_JSON = "json"
+ENCODER_ORJSON = "orjson"
+ENCODERS = [ENCODER_AUTO, ENCODER_JSON, ENCODER_ORJSON]
+
+
+def stdlib_encode(value: Any) -> bytes:
+    """Encode `value` like `tornado.escape.json_encode()`, with the stdlib `json`."""
+    return json.dumps(value).replace("</", "<\\/").encode("utf-8")
+
+
+def orjson_encode(value: Any) -> bytes:
+    """Encode `value` with `orjson`, falling back to the stdlib for what it can't encode.
+
+    (ex: integers beyond 64 bits)
+
+    Like `stdlib_encode()`, "</" is escaped (so the JSON can't close a
+    `<script>` element). Unlike it, non-ASCII characters are UTF-8
+    (not `\\u` escapes), and NaN & (-)Infinity are `null` -- valid
+    JSON, where the stdlib writes bare `NaN` & `Infinity`.
+    """
+    try:
+        return orjson.dumps(value).replace(b"</", b"<\\/")
+    except orjson.JSONEncodeError:
+        return stdlib_encode(value)
+
+
+def get_encoder(name: str) -> JSONEncoder:
+    """Get the JSON encoder by name (see `ENCODERS`).
+
+    "auto" is `orjson`, if it's installed, otherwise the stdlib.
+
+    Raises:
+        ValueError - if the encoder is unknown or not installed
+    """
+    if name == ENCODER_JSON:
+        return stdlib_encode
+    if name == ENCODER_ORJSON:
+        if not HAS_ORJSON:
+            raise ValueError("JSON encoder 'orjson' is not installed")
+        return orjson_encode
+    if name == ENCODER_AUTO:
+        return orjson_encode if HAS_ORJSON else stdlib_encode
+    raise ValueError(f"unknown JSON encoder: {name} (choose from {ENCODERS})")
+
+
+def has_raw_bson_encoder() -> bool:
+    """Return whether raw BSON can be encoded straight to JSON (`python-bsonjs`)."""
+    return HAS_BSONJS
+
+
+def encode_raw_bson_list(docs: Iterable[RawBSONDocument], sep: bytes = b", ") -> bytes:
+    """Encode raw BSON documents as JSON objects joined by `sep`, without decoding to dicts.
+
+    Uses `python-bsonjs` (relaxed extended JSON, so numbers are plain
+    numbers). File documents only hold JSON types, so the output matches
+    the other encoders' (with "</" escaped, too).
+    """
+    return sep.join(
+        bsonjs.dumps(doc.raw, mode=bsonjs.RELAXED).replace("</", "<\\/").encode("utf-8") for doc in docs
+    )
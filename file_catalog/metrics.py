@@ -0,0 +1,277 @@
+# metrics.py
+"""Request metrics (latency by phase, in-flight requests, response sizes), in Prometheus format.
+
+Each request gets a `RequestTimer` (in a context variable), and the
+time spent in each phase -- argument parsing, the database,
+validation/deconfliction, serialization, and writing the response --
+is accumulated by `phase()` or the `timed*()` decorators. Phases nest
+(ex: deconfliction queries the database), and time is only counted
+towards the innermost phase. Outside a request, timing is a no-op.
+"""
+
+import bisect
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+PHASE_PARSE = "parse"
+PHASE_DB = "db"
+PHASE_VALIDATION = "validation"
+PHASE_SERIALIZE = "serialize"
+PHASE_WRITE = "write"
+PHASE_OTHER = "other"  # the rest of the handler (not in any phase)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+)
+SIZE_BUCKETS = tuple(float(4**i) for i in range(4, 14))  # 256 B ... 64 MiB
+
+F = TypeVar("F", bound=Callable[..., Any])
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = [
+        f'{n}="' + str(v).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n") + '"'
+        for n, v in zip(names, values)
+    ]
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Gauge:
+    """A value that goes up & down, by label values."""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str]) -> None:
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, labels: LabelValues, amount: float = 1) -> None:
+        """Increase the value for `labels` by `amount`."""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, labels: LabelValues, amount: float = 1) -> None:
+        """Decrease the value for `labels` by `amount`."""
+        self.inc(labels, -amount)
+
+    def render(self) -> List[str]:
+        """Get the lines of the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Observations counted in cumulative buckets, by label values."""
+
+    def __init__(
+        self, name: str, description: str, labels: Sequence[str], buckets: Sequence[float]
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # by labels: [count in each bucket (non-cumulative; the last is +Inf), sum]
+        self.series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, labels: LabelValues, value: float) -> None:
+        """Count `value` for `labels`."""
+        try:
+            counts, total = self.series[labels]
+        except KeyError:
+            counts, total = self.series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        """Get the lines of the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for le, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labels + ("le",), labels + (_format_value(le),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+IN_FLIGHT = Gauge(
+    "file_catalog_requests_in_flight",
+    "Requests being handled",
+    ["handler", "method"],
+)
+REQUEST_DURATION = Histogram(
+    "file_catalog_request_duration_seconds",
+    "Time to handle a request",
+    ["handler", "method", "status"],
+    LATENCY_BUCKETS,
+)
+PHASE_DURATION = Histogram(
+    "file_catalog_request_phase_duration_seconds",
+    "Time spent in each phase of handling a request",
+    ["handler", "method", "phase"],
+    LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "file_catalog_response_size_bytes",
+    "Size of a response body",
+    ["handler", "method"],
+    SIZE_BUCKETS,
+)
+METRICS: List[Any] = [IN_FLIGHT, REQUEST_DURATION, PHASE_DURATION, RESPONSE_SIZE]
+
+
+def render() -> str:
+    """Get all the metrics, in the Prometheus text format."""
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+# --------------------------------------------------------------------------------------
+# Request Timing
+# --------------------------------------------------------------------------------------
+
+
+class RequestTimer:
+    """Time a request, and the phases within it.
+
+    If not `record`, nothing is recorded (but the request is still
+    known to `current_route()`).
+    """
+
+    def __init__(self, handler: str, method: str, record: bool = True) -> None:
+        self.labels = (handler, method)
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.stack: List[List[Any]] = []  # [phase, start of its running time]
+        self.record = record
+        self.done = not record
+        if record:
+            IN_FLIGHT.inc(self.labels)
+
+    def push(self, phase: str) -> None:
+        """Enter `phase`, pausing the phase it's within."""
+        now = time.perf_counter()
+        if self.stack:
+            outer = self.stack[-1]
+            self.phases[outer[0]] = self.phases.get(outer[0], 0.0) + now - outer[1]
+        self.stack.append([phase, now])
+
+    def pop(self) -> None:
+        """Exit the innermost phase, resuming the phase it's within."""
+        now = time.perf_counter()
+        phase, start = self.stack.pop()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - start
+        if self.stack:
+            self.stack[-1][1] = now
+
+    def finish(self, status: int, size: int) -> None:
+        """Record the request's metrics (once)."""
+        if self.done:
+            return
+        self.done = True
+        IN_FLIGHT.dec(self.labels)
+
+        elapsed = time.perf_counter() - self.start
+        REQUEST_DURATION.observe(self.labels + (str(status),), elapsed)
+        RESPONSE_SIZE.observe(self.labels, size)
+        for phase, seconds in self.phases.items():
+            PHASE_DURATION.observe(self.labels + (phase,), seconds)
+        PHASE_DURATION.observe(self.labels + (PHASE_OTHER,), max(0.0, elapsed - sum(self.phases.values())))
+
+
+_current: ContextVar[Optional[RequestTimer]] = ContextVar("file_catalog_request_timer", default=None)
+
+
+def start_request(handler: str, method: str, record: bool = True) -> RequestTimer:
+    """Start timing a request (in the current context)."""
+    timer = RequestTimer(handler, method, record)
+    _current.set(timer)
+    return timer
+
+
+def current_route() -> Optional[str]:
+    """Get the current request's method & handler (ex: "GET FilesHandler"), or `None`."""
+    timer = _current.get()
+    if timer is None:
+        return None
+    return f"{timer.labels[1]} {timer.labels[0]}"
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Count the time within, towards the current request's `name` phase."""
+    timer = _current.get()
+    if timer is None or timer.done:
+        yield
+        return
+    timer.push(name)
+    try:
+        yield
+    finally:
+        timer.pop()
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorate a function (or coroutine/async generator function) to count its time towards phase `name`.
+
+    For an async generator, only the time getting each item is counted.
+    """
+    def make_wrapper(func: F) -> F:
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args: Any, **kwargs: Any) -> Any:
+                agen = func(*args, **kwargs)
+                try:
+                    while True:
+                        with phase(name):
+                            try:
+                                item = await agen.__anext__()
+                            except StopAsyncIteration:
+                                return
+                        yield item
+                finally:
+                    await agen.aclose()
+            return async_gen_wrapper  # type: ignore[return-value]
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with phase(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return make_wrapper
+
+
+def timed_coroutines(name: str) -> Callable[[type], type]:
+    """Decorate a class to count the time of its public coroutine (& async generator) methods towards phase `name`."""
+    def decorate(cls: type) -> type:
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_"):
+                continue
+            if inspect.iscoroutinefunction(value) or inspect.isasyncgenfunction(value):
+                setattr(cls, attr, timed(name)(value))
+        return cls
+    return decorate
@@ -1,30 +1,290 @@
 # mongo.py
 """File Catalog MongoDB Interface."""
 
+import asyncio
+import base64
+import binascii
+import copy
 import datetime
+import functools
+import heapq
+import inspect
+import json
 import logging
+import random
+import secrets
+import time
 from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Dict, List, Optional, Union, cast
-
+from contextvars import Context, ContextVar
+from typing import Any, AsyncIterator, Coroutine, Dict, List, NamedTuple, Optional, Set, Tuple, Union, cast
+
+import bson  # type: ignore[import]
+from bson.errors import InvalidId  # type: ignore[import]
+from bson.codec_options import CodecOptions  # type: ignore[import]
+from bson.objectid import ObjectId  # type: ignore[import]
+from bson.raw_bson import RawBSONDocument  # type: ignore[import]
 from motor.motor_tornado import MotorClient, MotorCursor  # type: ignore[import]
 import pymongo  # type: ignore[import]
+from pymongo.errors import BulkWriteError, CollectionInvalid, ExecutionTimeout, OperationFailure  # type: ignore[import]
+from pymongo.read_preferences import (  # type: ignore[import]
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
 from pymongo.results import InsertOneResult  # type: ignore[import]
 from wipac_telemetry import tracing_tools as wtt
 
+from . import metrics
+from .cache import StatsCache, bytes_ttl_cache, ttl_cache
 from .schema.types import Metadata
+from .utils import query_shape
 
 logger = logging.getLogger(__name__)
 
 
 DEFAULT_MAX_TIME_MS = 10 * 60 * 1000  # 10 minutes
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_COUNT_CACHE_TTL = 60  # seconds
+DEFAULT_COUNT_CACHE_SIZE = 1024
+DEFAULT_PLAN_CACHE_TTL = 60 * 60  # 1 hour
+DEFAULT_PLAN_CACHE_SIZE = 1024
+DEFAULT_FILE_CACHE_TTL = 60  # seconds
+DEFAULT_FILE_CACHE_BYTES = 0  # disabled
+DEFAULT_COLLECTION_CACHE_TTL = 60  # seconds
+DEFAULT_COLLECTION_CACHE_SIZE = 1024
+
+DEFAULT_SLOW_QUERY_MS = 0  # disabled
+DEFAULT_SLOW_QUERY_EXPLAIN_PERCENT = 10
+DEFAULT_SLOW_QUERY_EXPLAIN_MAX_MS = 60 * 1000  # 1 minute
+DEFAULT_SLOW_QUERIES_BYTES = 16 * 2**20
+
+DEFAULT_READ_PREFERENCE = "primary"
+DEFAULT_MAX_POOL_SIZE = 100
+DEFAULT_MIN_POOL_SIZE = 0
+
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+# uuids per snapshot membership document ('snapshot_files')
+SNAPSHOT_CHUNK_SIZE = 10000
+
+# snapshot "status" values
+SNAPSHOT_PENDING = "pending"
+SNAPSHOT_COMPLETE = "complete"
+SNAPSHOT_FAILED = "failed"
+
+# the first MongoDB version with $setWindowFields (for building snapshots in the database)
+WINDOW_FIELDS_VERSION = (5, 0)
+# the first MongoDB version with $merge (for building materialized collections in the database)
+MERGE_VERSION = (4, 2)
+
+# changed files re-evaluated per query, when refreshing a materialized collection
+MATERIALIZED_REFRESH_BATCH_SIZE = 1000
+# how long one process may hold a materialized collection's refresh (if it dies mid-refresh)
+MATERIALIZED_REFRESH_LEASE = datetime.timedelta(minutes=10)
+
+# the fields that files can be aggregated (grouped) by
+AGGREGATE_GROUP_BY_FIELDS = [
+    "processing_level",
+    "offline_processing_metadata.season",
+    "run.run_number",
+    "iceprod.dataset",
+    "locations.site",
+    "data_type",
+]
+
+# slow operations whose query (on 'files') can be explained, by the argument holding it
+SLOW_QUERY_EXPLAINABLE = {
+    "find_files": "query",
+    "find_files_after": "query",
+    "count_files": "query",
+    "aggregate_files": "query",
+}
+# slow operations being recorded at once, beyond which more are dropped (ex: during an outage)
+SLOW_QUERY_MAX_PENDING = 10
+# operations that are never recorded as slow
+SLOW_QUERY_UNTIMED = {"create_indexes", "find_slow_queries", "kill_request_ops", "server_version"}
+
+# read preference modes, by their MongoDB (URI) name
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+class RequestScope(NamedTuple):
+    """The database operations of one request."""
+
+    comment: str  # tags the request's reads (so they can be found & killed)
+    deadline: Optional[float]  # `time.monotonic()` by which the request's reads must finish
+
+
+_request_scope: ContextVar[Optional[RequestScope]] = ContextVar("file_catalog_request_scope", default=None)
+
+
+def start_request_scope(name: str, time_budget_ms: Optional[int] = None) -> RequestScope:
+    """Scope the database reads made in the current context to a request.
+
+    Each read is tagged with the request's comment (see
+    `Mongo.kill_request_ops()`), and its `maxTimeMS` is capped by the
+    time left of `time_budget_ms` (if given).
+    """
+    deadline = time.monotonic() + time_budget_ms / 1000 if time_budget_ms else None
+    scope = RequestScope(f"file_catalog {name} {secrets.token_hex(8)}", deadline)
+    _request_scope.set(scope)
+    return scope
+
+
+def create_background_task(coro: Coroutine[Any, Any, None]) -> "asyncio.Task[None]":
+    """Create a task outside of the current request's scope (& metrics), which outlives the request."""
+    return Context().run(asyncio.create_task, coro)
+
+
+class PreconditionFailedError(Exception):
+    """Raised when a conditional write's record was modified (or removed) in the meantime."""
 
 
 class AllKeys:  # pylint: disable=R0903
     """Include all keys in MongoDB find*() methods."""
 
 
+# the prefix versions the token & keeps urlargparse from decoding it as a number
+CONTINUATION_TOKEN_PREFIX = "v1"
+
+
+def encode_continuation_token(last_id: ObjectId) -> str:
+    """Encode the `_id` of the last document of a page as an opaque token."""
+    b64 = base64.urlsafe_b64encode(last_id.binary).decode("ascii")
+    return CONTINUATION_TOKEN_PREFIX + b64
+
+
+def decode_continuation_token(token: str) -> ObjectId:
+    """Decode a token made by `encode_continuation_token()`.
+
+    Raises:
+        ValueError - if the token is malformed
+    """
+    if not token.startswith(CONTINUATION_TOKEN_PREFIX):
+        raise ValueError(f"invalid continuation token: {token}")
+    try:
+        b64 = token[len(CONTINUATION_TOKEN_PREFIX):]
+        return ObjectId(base64.urlsafe_b64decode(b64.encode("ascii")))
+    except (binascii.Error, InvalidId, TypeError, UnicodeEncodeError) as e:
+        raise ValueError(f"invalid continuation token: {token}") from e
+
+
+# the prefix versions the token & keeps urlargparse from decoding it as a number
+CHANGES_TOKEN_PREFIX = "c1"
+
+
+def encode_changes_token(meta_modify_date: str, uuid: str) -> str:
+    """Encode the position (`meta_modify_date`, `uuid`) of the last changed file as an opaque token."""
+    raw = json.dumps([meta_modify_date, uuid]).encode("utf-8")
+    return CHANGES_TOKEN_PREFIX + base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_changes_token(token: str) -> Tuple[str, str]:
+    """Decode a token made by `encode_changes_token()`.
+
+    Raises:
+        ValueError - if the token is malformed
+    """
+    if not token.startswith(CHANGES_TOKEN_PREFIX):
+        raise ValueError(f"invalid changes token: {token}")
+    try:
+        b64 = token[len(CHANGES_TOKEN_PREFIX):]
+        meta_modify_date, uuid = json.loads(base64.urlsafe_b64decode(b64.encode("ascii")))
+    except (binascii.Error, TypeError, UnicodeError, ValueError) as e:
+        raise ValueError(f"invalid changes token: {token}") from e
+    if not isinstance(meta_modify_date, str) or not isinstance(uuid, str):
+        raise ValueError(f"invalid changes token: {token}")
+    return meta_modify_date, uuid
+
+
+# the prefix versions the token & keeps urlargparse from decoding it as a number
+SNAPSHOT_TOKEN_PREFIX = "s1"
+
+
+def encode_snapshot_token(position: int) -> str:
+    """Encode the position of the next file in a snapshot as an opaque token."""
+    return SNAPSHOT_TOKEN_PREFIX + base64.urlsafe_b64encode(str(position).encode("ascii")).decode("ascii")
+
+
+def decode_snapshot_token(token: str) -> int:
+    """Decode a token made by `encode_snapshot_token()`.
+
+    Raises:
+        ValueError - if the token is malformed
+    """
+    if not token.startswith(SNAPSHOT_TOKEN_PREFIX):
+        raise ValueError(f"invalid snapshot token: {token}")
+    try:
+        b64 = token[len(SNAPSHOT_TOKEN_PREFIX):]
+        position = int(base64.urlsafe_b64decode(b64.encode("ascii")))
+    except (binascii.Error, TypeError, UnicodeError, ValueError) as e:
+        raise ValueError(f"invalid snapshot token: {token}") from e
+    if position < 0:
+        raise ValueError(f"invalid snapshot token: {token}")
+    return position
+
+
+def get_read_preference(name: str, max_staleness_seconds: int = -1) -> Any:
+    """Get the read preference by its MongoDB name (ex: "secondaryPreferred").
+
+    `max_staleness_seconds` (-1 for no maximum) does not apply to "primary".
+
+    Raises:
+        ValueError - if the name is unknown, or `max_staleness_seconds` is invalid
+    """
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"unknown read preference: {name} (choose from {list(READ_PREFERENCES)})")
+    if name == "primary":
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=max_staleness_seconds)
+
+
+def _time_operation(func: Any) -> Any:
+    """Time a `Mongo` coroutine method, and record it if it's slow."""
+    @functools.wraps(func)
+    async def wrapper(self: "Mongo", *args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        result, error = None, None
+        try:
+            result = await func(self, *args, **kwargs)
+            return result
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if self.slow_query_ms and duration_ms >= self.slow_query_ms:
+                self._on_slow_query(func, args, kwargs, duration_ms, result, error)
+    return wrapper
+
+
+def _time_operations(cls: type) -> type:
+    """Decorate `Mongo` to time its public coroutine methods (see `Mongo.slow_query_ms`)."""
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("_") or attr in SLOW_QUERY_UNTIMED:
+            continue
+        if inspect.iscoroutinefunction(value):
+            setattr(cls, attr, _time_operation(value))
+    return cls
+
+
+@metrics.timed_coroutines(metrics.PHASE_DB)
+@_time_operations
 class Mongo:
-    """A ThreadPoolExecutor-based MongoDB client."""
+    """A ThreadPoolExecutor-based MongoDB client.
+
+    Writes, and the reads they depend on (ex: deconfliction), use
+    `client` (primary reads). Read-only listings & counts may opt in to
+    `reader`, which uses the configured read preference.
+    """
 
     def __init__(  # pylint: disable=R0913
         self,
@@ -34,15 +294,44 @@ class Mongo:
         username: Optional[str] = None,
         password: Optional[str] = None,
         uri: Optional[str] = None,
+        count_cache_ttl: float = DEFAULT_COUNT_CACHE_TTL,
+        count_cache_size: int = DEFAULT_COUNT_CACHE_SIZE,
+        plan_cache_ttl: float = DEFAULT_PLAN_CACHE_TTL,
+        plan_cache_size: int = DEFAULT_PLAN_CACHE_SIZE,
+        file_cache_ttl: float = DEFAULT_FILE_CACHE_TTL,
+        file_cache_bytes: int = DEFAULT_FILE_CACHE_BYTES,
+        collection_cache_ttl: float = DEFAULT_COLLECTION_CACHE_TTL,
+        collection_cache_size: int = DEFAULT_COLLECTION_CACHE_SIZE,
+        read_preference: str = DEFAULT_READ_PREFERENCE,
+        max_staleness_seconds: int = -1,
+        max_pool_size: int = DEFAULT_MAX_POOL_SIZE,
+        min_pool_size: int = DEFAULT_MIN_POOL_SIZE,
+        max_idle_time_ms: Optional[int] = None,
+        slow_query_ms: float = DEFAULT_SLOW_QUERY_MS,
+        slow_query_explain_percent: float = DEFAULT_SLOW_QUERY_EXPLAIN_PERCENT,
+        slow_queries_bytes: int = DEFAULT_SLOW_QUERIES_BYTES,
+        slow_query_explain_max_ms: int = DEFAULT_SLOW_QUERY_EXPLAIN_MAX_MS,
     ) -> None:
-        """Initialize the File Catalog's internal MongoDB client."""
+        """Initialize the File Catalog's internal MongoDB client.
+
+        An operation taking `slow_query_ms` or longer (0 to disable) is
+        recorded in the capped 'slow_queries' collection (of
+        `slow_queries_bytes`); `slow_query_explain_percent` of those
+        that succeeded are explained (re-run, for up to
+        `slow_query_explain_max_ms`, for their plan & documents examined).
+        """
+        pool_args = {
+            "maxPoolSize": max_pool_size,
+            "minPoolSize": min_pool_size,
+            "maxIdleTimeMS": max_idle_time_ms,
+        }
         if uri:
-            logger.info(f"MongoClient args: uri={uri}")
-            self.close_me = MotorClient(uri, authSource=authSource)
+            logger.info(f"MongoClient args: uri={uri}, {pool_args}")
+            self.close_me = MotorClient(uri, authSource=authSource, **pool_args)
             self.client = self.close_me.file_catalog
         else:
             logger.info(
-                "MongoClient args: host=%s, port=%s, username=%s", host, port, username
+                "MongoClient args: host=%s, port=%s, username=%s, %s", host, port, username, pool_args
             )
             self.close_me = MotorClient(
                 host=host,
@@ -50,24 +339,64 @@ class Mongo:
                 authSource=authSource,
                 username=username,
                 password=password,
+                **pool_args,
             )
             self.client = self.close_me.file_catalog
 
+        # for read-only listings & counts, which can tolerate (bounded) staleness
+        self.reader = self.close_me.get_database(
+            "file_catalog",
+            read_preference=get_read_preference(read_preference, max_staleness_seconds),
+        )
+        logger.info(f"Read-only queries' read preference: {self.reader.read_preference}")
+
         self.executor = ThreadPoolExecutor(max_workers=10)
+        self.count_cache: StatsCache[int] = ttl_cache(maxsize=count_cache_size, ttl=count_cache_ttl)
+        self.plan_cache: StatsCache[bool] = ttl_cache(maxsize=plan_cache_size, ttl=plan_cache_ttl)
+        # file documents by uuid, as BSON (so callers can't mutate cached copies)
+        self.file_cache: Optional[StatsCache[bytes]] = None
+        if file_cache_bytes > 0:
+            self.file_cache = bytes_ttl_cache(maxbytes=file_cache_bytes, ttl=file_cache_ttl)
+        # (collection, decoded query) by ("uuid", uuid) & ("collection_name", name)
+        self.collection_cache: StatsCache[Tuple[Dict[str, Any], Dict[str, Any]]] = ttl_cache(
+            maxsize=collection_cache_size, ttl=collection_cache_ttl
+        )
+        self._server_version: Optional[Tuple[int, ...]] = None
+        # background snapshot jobs (referenced, so they aren't garbage-collected while running)
+        self._snapshot_jobs: Set["asyncio.Task[None]"] = set()
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_explain_percent = slow_query_explain_percent
+        self.slow_queries_bytes = slow_queries_bytes
+        self.slow_query_explain_max_ms = slow_query_explain_max_ms
+        self.slow_queries_recorded = 0
+        self.slow_queries_dropped = 0
+        self._slow_queries_ready = False
+        self._slow_query_jobs: Set["asyncio.Task[None]"] = set()
+        self._kill_jobs: Set["asyncio.Task[None]"] = set()
         logger.info("done setting up Mongo")
 
+    async def server_version(self) -> Tuple[int, ...]:
+        """Get the MongoDB server's version (ex: `(5, 0, 9)`), looked up once."""
+        if self._server_version is None:
+            info = await self.client.command("buildInfo")
+            self._server_version = tuple(int(v) for v in info["versionArray"][:3])
+        return self._server_version
+
     @wtt.spanned(all_args=True)
     async def create_indexes(self) -> None:
         """Create indexes for all file-catalog mongo collections."""
         # all files (a.k.a. required fields)
         await self.client.files.create_index('uuid', unique=True, background=True)
         await self.client.files.create_index([('logical_name', pymongo.HASHED)], background=True)
+        await self.client.files.create_index('logical_name', background=True)  # for prefix/directory queries
         await self.client.files.create_index('locations', unique=True, background=True)
         await self.client.files.create_index(
             [('locations.path', pymongo.DESCENDING), ('locations.site', pymongo.DESCENDING)],
             background=True
         )
         await self.client.files.create_index('create_date', background=True)
+        await self.client.files.create_index([('meta_modify_date', 1), ('uuid', 1)], background=True)  # for the changes feed
+        await self.client.file_tombstones.create_index([('meta_modify_date', 1), ('uuid', 1)], background=True)
 
         # all .i3 files
         await self.client.files.create_index('content_status', sparse=True, background=True)
@@ -89,11 +418,15 @@ class Mongo:
         await self.client.collections.create_index('uuid', unique=True, background=True)
         await self.client.collections.create_index('collection_name', background=True)
         await self.client.collections.create_index('owner', background=True)
+        await self.client.collection_files.create_index([('collection_id', 1), ('uuid', 1)], unique=True, background=True)
+        await self.client.collection_files.create_index([('collection_id', 1), ('_id', 1)], background=True)
+        await self.client.collection_files.create_index('uuid', background=True)
 
         # # Snapshots
         await self.client.snapshots.create_index('uuid', unique=True, background=True)
         await self.client.snapshots.create_index('collection_id', background=True)
         await self.client.snapshots.create_index('owner', background=True)
+        await self.client.snapshot_files.create_index([('snapshot_id', 1), ('seq', 1)], unique=True, background=True)
 
     @staticmethod
     def _get_projection(
@@ -116,6 +449,62 @@ class Mongo:
 
         return projection
 
+    @staticmethod
+    def _get_joined_file_projection(
+        keys: Optional[Union[List[str], AllKeys]] = None,
+    ) -> Dict[str, bool]:
+        """Get the projection of a `$lookup`-joined file (as "file"), excluding everything else."""
+        projection = Mongo._get_projection(
+            keys, default={"uuid": True, "logical_name": True}
+        )
+        if len(projection) == 1:  # all keys
+            return {"_id": False, "file._id": False}
+        return {"_id": False, **{f"file.{k}": True for k in projection if k != "_id"}}
+
+    def _files(self, secondary_ok: bool = False, raw: bool = False) -> Any:
+        """Get the files collection.
+
+        Keyword Arguments:
+            secondary_ok -- use the configured read preference, instead of the primary
+            raw -- leave documents as undecoded `RawBSONDocument`s
+        """
+        collection = (self.reader if secondary_ok else self.client).files
+        if raw:
+            collection = collection.with_options(
+                codec_options=CodecOptions(document_class=RawBSONDocument)
+            )
+        return collection
+
+    @staticmethod
+    def _read_options(max_time_ms: Optional[int] = None) -> Dict[str, Any]:
+        """Get the `maxTimeMS` & `comment` options of a read command, in the current request's scope.
+
+        `maxTimeMS` is the lesser of `max_time_ms` and the time left of
+        the request's budget.
+
+        Raises:
+            ExecutionTimeout - if the request's budget is already spent
+        """
+        options: Dict[str, Any] = {}
+        if max_time_ms:
+            options["maxTimeMS"] = max_time_ms
+        if scope := _request_scope.get():
+            options["comment"] = scope.comment
+            if scope.deadline is not None:
+                left = int((scope.deadline - time.monotonic()) * 1000)
+                if left <= 0:
+                    raise ExecutionTimeout("request time budget exceeded", code=50)
+                options["maxTimeMS"] = min(max_time_ms, left) if max_time_ms else left
+        return options
+
+    @staticmethod
+    def _find_options(max_time_ms: Optional[int] = None) -> Dict[str, Any]:
+        """Get `_read_options()`, as `find()` keyword arguments."""
+        options = Mongo._read_options(max_time_ms)
+        if "maxTimeMS" in options:
+            options["max_time_ms"] = options.pop("maxTimeMS")
+        return options
+
     @staticmethod
     async def _limit_result_list(
         cursor: MotorCursor,
@@ -137,6 +526,8 @@ class Mongo:
         limit: Optional[int] = None,
         start: int = 0,
         max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS,
+        raw: bool = False,
+        secondary_ok: bool = False,
     ) -> List[Dict[str, Any]]:
         """Find files.
 
@@ -151,6 +542,8 @@ class Mongo:
             limit -- max count of files returned
             start -- starting index
             max_time_ms -- the query timeout in milliseconds
+            raw -- get undecoded `RawBSONDocument`s instead of dicts
+            secondary_ok -- use the configured read preference, instead of the primary
 
         Returns:
             List of MongoDB files
@@ -158,24 +551,425 @@ class Mongo:
         projection = Mongo._get_projection(
             keys, default={"uuid": True, "logical_name": True}
         )
-        cursor = self.client.files.find(query, projection, max_time_ms=max_time_ms)
+        cursor = self._files(secondary_ok, raw).find(query, projection, **self._find_options(max_time_ms))
         results = await Mongo._limit_result_list(cursor, limit, start)
 
         return results
 
+    @wtt.spanned(all_args=True)
+    async def find_files_after(
+        self,
+        query: Optional[Dict[str, Any]] = None,
+        keys: Optional[Union[List[str], AllKeys]] = None,
+        limit: Optional[int] = None,
+        after: Optional[ObjectId] = None,
+        max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS,
+        secondary_ok: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], Optional[ObjectId]]:
+        """Find a page of files using keyset pagination on `_id`.
+
+        Unlike `start`, the cost of a page does not grow with its
+        position in the result set. "_id" is excluded from the results.
+
+        Keyword Arguments:
+            query -- MongoDB query
+            keys -- fields to include in MongoDB projection
+            limit -- max count of files returned
+            after -- `_id` of the previous page's last file (`None` for the first page)
+            max_time_ms -- the query timeout in milliseconds
+            secondary_ok -- use the configured read preference, instead of the primary
+
+        Returns:
+            List of MongoDB files, and
+            `_id` of the last file (`None` if there are no more pages)
+        """
+        projection = Mongo._get_projection(
+            keys, default={"uuid": True, "logical_name": True}
+        )
+        projection["_id"] = True
+        if after is not None:
+            query = {"$and": [query or {}, {"_id": {"$gt": after}}]}
+
+        cursor = self._files(secondary_ok).find(query, projection, **self._find_options(max_time_ms))
+        cursor = cursor.sort("_id", pymongo.ASCENDING)
+        results = await Mongo._limit_result_list(cursor, limit)
+
+        last_id = None
+        if limit and len(results) == limit:
+            last_id = results[-1]["_id"]
+        for res in results:
+            del res["_id"]
+
+        return results, last_id
+
+    @wtt.spanned(all_args=True)
+    async def find_files_changed(
+        self,
+        until: str,
+        since: Optional[Tuple[str, str]] = None,
+        keys: Optional[Union[List[str], AllKeys]] = None,
+        limit: Optional[int] = None,
+        max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS,
+    ) -> List[Dict[str, Any]]:
+        """Find files modified after `since` & by `until`, in modification order.
+
+        Files are ordered (& paged) by (`meta_modify_date`, `uuid`),
+        using their index, so a page costs only its own files. Files
+        without a `meta_modify_date` are never included. Deleted files
+        are included as tombstones: only `uuid`, `meta_modify_date`
+        (when it was deleted), and `"deleted": True`.
+
+        Keyword Arguments:
+            until -- the latest `meta_modify_date` to include
+            since -- the (`meta_modify_date`, `uuid`) of the previous page's last file (`None` for the first page)
+            keys -- fields to include in MongoDB projection (`uuid` & `meta_modify_date` are always included)
+            limit -- max count of files returned
+            max_time_ms -- the query timeout in milliseconds
+
+        Returns:
+            List of MongoDB files
+        """
+        projection = Mongo._get_projection(
+            keys, default={"uuid": True, "logical_name": True}
+        )
+        if not isinstance(keys, AllKeys):
+            projection.update({"uuid": True, "meta_modify_date": True})
+
+        query: Dict[str, Any] = {"meta_modify_date": {"$lte": until}}
+        if since is not None:
+            date, uuid = since
+            query = {"$and": [query, {"$or": [
+                {"meta_modify_date": {"$gt": date}},
+                {"meta_modify_date": date, "uuid": {"$gt": uuid}},
+            ]}]}
+
+        sort = [("meta_modify_date", pymongo.ASCENDING), ("uuid", pymongo.ASCENDING)]
+        cursor = self.client.files.find(query, projection, **self._find_options(max_time_ms)).sort(sort)
+        files = await Mongo._limit_result_list(cursor, limit)
+        cursor = self.client.file_tombstones.find(query, {"_id": False}, **self._find_options(max_time_ms)).sort(sort)
+        tombstones = await Mongo._limit_result_list(cursor, limit)
+
+        changes = list(heapq.merge(files, tombstones, key=lambda f: (f["meta_modify_date"], f["uuid"])))
+        return changes[:limit] if limit else changes
+
+    async def iter_files(  # pylint: disable=R0913
+        self,
+        query: Optional[Dict[str, Any]] = None,
+        keys: Optional[Union[List[str], AllKeys]] = None,
+        limit: Optional[int] = None,
+        start: int = 0,
+        max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        raw: bool = False,
+        secondary_ok: bool = False,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Find files, yielding them one cursor batch at a time.
+
+        Same arguments as `find_files()`, but only one batch of
+        documents (at most `batch_size`) is held in memory at once.
+        The server-side cursor is killed if the caller stops early.
+        """
+        projection = Mongo._get_projection(
+            keys, default={"uuid": True, "logical_name": True}
+        )
+        cursor = self._files(secondary_ok, raw).find(
+            query, projection, batch_size=batch_size, **self._find_options(max_time_ms)
+        ).skip(start)
+        if limit:
+            cursor = cursor.limit(limit)
+
+        try:
+            while batch := await cursor.to_list(batch_size):
+                yield cast(List[Dict[str, Any]], batch)
+        finally:
+            await cursor.close()
+
+    @staticmethod
+    def _plan_has_stage(plan: Any, stage: str) -> bool:
+        """Return whether `stage` is anywhere in the (explained) query plan."""
+        if isinstance(plan, dict):
+            if plan.get("stage") == stage:
+                return True
+            return any(Mongo._plan_has_stage(v, stage) for v in plan.values())
+        if isinstance(plan, list):
+            return any(Mongo._plan_has_stage(v, stage) for v in plan)
+        return False
+
+    @staticmethod
+    def _summarize_plan(plan: Dict[str, Any]) -> List[str]:
+        """Summarize an explained (winning) plan as its stages, from the first to the last.
+
+        Ex: `["IXSCAN logical_name_1", "FETCH", "LIMIT"]`
+        """
+        plan = plan.get("queryPlan", plan)  # slot-based execution (5.0+)
+        stages: List[str] = []
+        if "inputStage" in plan:
+            stages = Mongo._summarize_plan(plan["inputStage"])
+        elif "inputStages" in plan:
+            # ex: OR, with a branch per clause
+            stages = ["(" + " | ".join(" -> ".join(Mongo._summarize_plan(p)) for p in plan["inputStages"]) + ")"]
+        stage = plan.get("stage", "?")
+        if "indexName" in plan:
+            stage += f" {plan['indexName']}"
+        return stages + [stage]
+
+    @wtt.spanned(all_args=True)
+    async def is_indexed_query(self, query: Dict[str, Any]) -> bool:
+        """Return whether the winning plan for `query` avoids a collection scan.
+
+        The query planner is consulted (without running the query) once
+        per query shape, then the answer is cached.
+        """
+        key = json.dumps(query_shape(query))
+        if (indexed := self.plan_cache.get(key)) is not None:
+            return indexed
+
+        explained = await self.client.command(
+            "explain", {"find": "files", "filter": query}, verbosity="queryPlanner"
+        )
+        indexed = not self._plan_has_stage(explained["queryPlanner"]["winningPlan"], "COLLSCAN")
+        self.plan_cache.set(key, indexed)
+        return indexed
+
+    def _on_slow_query(
+        self,
+        func: Any,
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+        duration_ms: float,
+        result: Any,
+        error: Optional[str],
+    ) -> None:
+        """Record a slow operation in the background (or drop it, if too many are pending)."""
+        if len(self._slow_query_jobs) >= SLOW_QUERY_MAX_PENDING:
+            self.slow_queries_dropped += 1
+            return
+
+        arguments = inspect.signature(func).bind(self, *args, **kwargs).arguments
+        query = arguments.get("query")
+        if isinstance(result, tuple) and result:  # ex: (files, last_id)
+            result = result[0]
+
+        entry: Dict[str, Any] = {
+            "date": str(datetime.datetime.utcnow()),
+            "operation": func.__name__,
+            "duration_ms": round(duration_ms, 3),
+            "route": metrics.current_route(),
+            "query_shape": json.dumps(query_shape(query), sort_keys=True) if query else None,
+            "limit": arguments.get("limit"),
+            "docs_returned": len(result) if isinstance(result, list) else None,
+            "error": error,
+        }
+        explain = None
+        explainable = error is None and func.__name__ in SLOW_QUERY_EXPLAINABLE  # a failed query (ex: killed) isn't re-run
+        if explainable and random.uniform(0, 100) < self.slow_query_explain_percent:
+            explain = {"find": "files", "filter": query or {}, "maxTimeMS": self.slow_query_explain_max_ms}
+            if arguments.get("start"):
+                explain["skip"] = arguments["start"]
+            if arguments.get("limit"):
+                explain["limit"] = arguments["limit"]
+
+        job = create_background_task(self._record_slow_query(entry, explain, bool(arguments.get("secondary_ok"))))
+        self._slow_query_jobs.add(job)
+        job.add_done_callback(self._slow_query_jobs.discard)
+
+    async def _record_slow_query(
+        self, entry: Dict[str, Any], explain: Optional[Dict[str, Any]], secondary_ok: bool
+    ) -> None:
+        """Explain the slow operation (if given `explain`), then insert it into 'slow_queries'."""
+        try:
+            entry["plan"] = None
+            if explain:
+                db = self.reader if secondary_ok else self.client
+                try:
+                    explained = await db.command("explain", explain, verbosity="executionStats")
+                except ExecutionTimeout:
+                    # too slow to re-run in full, so just plan it
+                    explained = await db.command("explain", explain, verbosity="queryPlanner")
+                entry["plan"] = self._summarize_plan(explained["queryPlanner"]["winningPlan"])
+                if stats := explained.get("executionStats"):
+                    entry["docs_examined"] = stats["totalDocsExamined"]
+                    entry["keys_examined"] = stats["totalKeysExamined"]
+                    if entry["docs_returned"] is None:
+                        entry["docs_returned"] = stats["nReturned"]
+                    entry["examined_ratio"] = stats["totalDocsExamined"] / max(entry["docs_returned"] or 0, 1)
+
+            if not self._slow_queries_ready:
+                try:
+                    await self.client.create_collection(
+                        "slow_queries", capped=True, size=self.slow_queries_bytes
+                    )
+                except CollectionInvalid:  # already exists
+                    pass
+                self._slow_queries_ready = True
+
+            await self.client.slow_queries.insert_one(entry)
+            self.slow_queries_recorded += 1
+            logger.warning(
+                f"Slow operation ({entry['duration_ms']:.0f} ms): {entry['operation']} "
+                f"from {entry['route']}: {entry['query_shape']}"
+            )
+        except Exception:
+            logger.exception(f"Failed to record slow operation: {entry}")
+
+    async def find_slow_queries(
+        self,
+        limit: int,
+        operation: Optional[str] = None,
+        route: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Find the most recent slow operations (newest first)."""
+        filters: Dict[str, Any] = {}
+        if operation:
+            filters["operation"] = operation
+        if route:
+            filters["route"] = route
+        cursor = self.client.slow_queries.find(filters, {"_id": False}, **self._find_options())
+        cursor = cursor.sort("$natural", pymongo.DESCENDING)
+        return cast(List[Dict[str, Any]], await cursor.limit(limit).to_list(None))
+
+    async def kill_request_ops(self, comment: str) -> int:
+        """Kill the running operations tagged with a request's `comment`; return how many.
+
+        A cancelled motor call keeps running on the server (& in motor's
+        thread), so this is how an abandoned request's reads are stopped.
+        """
+        ops = await self.close_me.admin.command({
+            "currentOp": 1,
+            "$ownOps": True,
+            "$or": [
+                {"command.comment": comment},
+                {"originatingCommand.comment": comment},  # getMore (MongoDB < 4.4)
+                {"cursor.originatingCommand.comment": comment},
+            ],
+        })
+        killed = 0
+        for op in ops.get("inprog", []):
+            try:
+                await self.close_me.admin.command("killOp", op=op["opid"])
+                killed += 1
+            except OperationFailure:  # already finished
+                pass
+        if killed:
+            logger.info(f"Killed {killed} operation(s) of {comment!r}")
+        return killed
+
+    def kill_request_ops_soon(self, comment: str) -> None:
+        """Kill the running operations tagged with `comment`, in the background."""
+        async def kill() -> None:
+            try:
+                await self.kill_request_ops(comment)
+            except Exception:
+                logger.exception(f"Failed to kill the operations of {comment!r}")
+
+        job = create_background_task(kill())
+        self._kill_jobs.add(job)
+        job.add_done_callback(self._kill_jobs.discard)
+
+    @staticmethod
+    def _count_cache_key(query: Dict[str, Any]) -> str:
+        # top-level fields are AND'ed, so their order doesn't matter
+        # (unlike in embedded documents, which are compared as-is)
+        return json.dumps(sorted(query.items()), default=str)
+
     @wtt.spanned(all_args=True)
     async def count_files(  # pylint: disable=W0613
         self,
         query: Optional[Dict[str, Any]] = None,
+        exact: bool = True,
+        secondary_ok: bool = False,
+        max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS,
         **kwargs: Any,
     ) -> int:
-        """Get count of files matching query."""
+        """Get count of files matching query.
+
+        Without a query, the count comes from the collection's metadata.
+        Otherwise, if not `exact`, a cached count (at most
+        `count_cache_ttl` seconds old) may be returned. Exact counts
+        refresh the cache.
+
+        If `secondary_ok`, use the configured read preference.
+        """
+        files = self._files(secondary_ok)
         if not query:
-            query = {"uuid": {"$exists": True}}
+            return cast(int, await files.estimated_document_count())
+
+        key = self._count_cache_key(query)
+        if not exact:
+            if (ret := self.count_cache.get(key)) is not None:
+                return ret
 
-        ret = await self.client.files.count_documents(query)
+        ret = cast(int, await files.count_documents(query, **self._read_options(max_time_ms)))
+        self.count_cache.set(key, ret)
 
-        return cast(int, ret)
+        return ret
+
+    @wtt.spanned(all_args=True)
+    async def aggregate_files(  # pylint: disable=W0613
+        self,
+        query: Optional[Dict[str, Any]] = None,
+        group_by: Optional[str] = None,
+        max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS,
+        secondary_ok: bool = False,
+        **kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        """Get the count, and sum/min/max of `file_size` & `run.event_count`, of files matching query.
+
+        The files are grouped by the `group_by` field (see
+        `AGGREGATE_GROUP_BY_FIELDS`), or all together. Grouped by
+        `locations.site`, each file is counted once per site.
+
+        Returns:
+            List of `{"group": ..., "count": ..., "file_size": {"sum": ..., "min": ..., "max": ...}, "event_count": {...}}`,
+            sorted by group
+        """
+        if group_by and group_by not in AGGREGATE_GROUP_BY_FIELDS:
+            raise ValueError(f"cannot group by {group_by} (choose from {AGGREGATE_GROUP_BY_FIELDS})")
+
+        pipeline: List[Dict[str, Any]] = [{"$match": query or {}}]
+        key, size, events = (f"${group_by}" if group_by else None), "$file_size", "$run.event_count"
+        if group_by == "locations.site":
+            pipeline += [
+                {"$unwind": "$locations"},
+                {"$group": {
+                    "_id": {"site": "$locations.site", "file": "$_id"},
+                    "file_size": {"$first": size},
+                    "event_count": {"$first": events},
+                }},
+            ]
+            key, size, events = "$_id.site", "$file_size", "$event_count"
+        pipeline += [
+            {"$group": {
+                "_id": key,
+                "count": {"$sum": 1},
+                "file_size_sum": {"$sum": size},
+                "file_size_min": {"$min": size},
+                "file_size_max": {"$max": size},
+                "event_count_sum": {"$sum": events},
+                "event_count_min": {"$min": events},
+                "event_count_max": {"$max": events},
+            }},
+            {"$sort": {"_id": pymongo.ASCENDING}},
+        ]
+
+        cursor = self._files(secondary_ok).aggregate(
+            pipeline, allowDiskUse=True, **self._read_options(max_time_ms)
+        )
+        results = await cursor.to_list(None)
+
+        if not results and not group_by:
+            results = [{"_id": None, "count": 0, "file_size_sum": 0, "event_count_sum": 0}]
+        return [
+            {
+                "group": res["_id"],
+                "count": res["count"],
+                **{
+                    field: {stat: res.get(f"{field}_{stat}") for stat in ["sum", "min", "max"]}
+                    for field in ["file_size", "event_count"]
+                },
+            }
+            for res in results
+        ]
 
     @wtt.spanned(all_args=True)
     async def create_file(self, metadata: Metadata) -> InsertOneResult:
@@ -185,75 +979,311 @@ class Mongo:
         """
         return cast(InsertOneResult, await self.client.files.insert_one(metadata))
 
+    @wtt.spanned()
+    async def create_files(
+        self, metadatas: List[Metadata]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Insert many files' metadata, unordered.
+
+        A failed insert does not stop the others.
+
+        Return the write error (or `None`) for each file.
+        """
+        errors: List[Optional[Dict[str, Any]]] = [None] * len(metadatas)
+        if not metadatas:
+            return errors
+
+        try:
+            await self.client.files.insert_many(metadatas, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details["writeErrors"]:
+                errors[write_error["index"]] = write_error
+
+        return errors
+
+    @wtt.spanned()
+    async def add_files_locations(
+        self, updates: List[Tuple[str, List[Dict[str, Any]]]]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Add distinct locations to many files, with one unordered bulk write.
+
+        `updates` is a list of (uuid, locations). Each file's
+        `meta_modify_date` is set. A failed update does not stop the
+        others.
+
+        Return the write error (or `None`) for each update.
+        """
+        errors: List[Optional[Dict[str, Any]]] = [None] * len(updates)
+        if not updates:
+            return errors
+
+        now = str(datetime.datetime.utcnow())
+        requests = [
+            pymongo.UpdateOne(
+                {"uuid": uuid},
+                {"$addToSet": {"locations": {"$each": locations}}, "$set": {"meta_modify_date": now}},
+            )
+            for uuid, locations in updates
+        ]
+        try:
+            await self.client.files.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details["writeErrors"]:
+                errors[write_error["index"]] = write_error
+        finally:
+            for uuid, _ in updates:
+                self._cache_file(uuid, None)
+
+        return errors
+
+    @wtt.spanned()
+    async def find_location_owners(
+        self, locations: List[Tuple[Optional[str], str, str]]
+    ) -> List[List[str]]:
+        """Find the files with each location, in one query.
+
+        `locations` is a list of (uuid or `None`, site, path); a uuid
+        limits the match to that file. A location matches by its site &
+        path only. Only uuids & location sites/paths are read.
+
+        Return the uuids of the matching files, for each location.
+        """
+        if not locations:
+            return []
+
+        clauses: List[Dict[str, Any]] = []
+        for uuid, site, path in locations:
+            clause: Dict[str, Any] = {"locations": {"$elemMatch": {"site": site, "path": path}}}
+            if uuid is not None:
+                clause["uuid"] = uuid
+            clauses.append(clause)
+        projection = {"_id": False, "uuid": True, "locations.site": True, "locations.path": True}
+        files = await self.client.files.find({"$or": clauses}, projection, **self._find_options()).to_list(None)
+
+        owners: Dict[Tuple[str, str], List[str]] = {}
+        for file in files:
+            for loc in file.get("locations", []):
+                owners.setdefault((loc.get("site"), loc.get("path")), []).append(file["uuid"])
+        return [
+            [u for u in owners.get((site, path), []) if uuid is None or u == uuid]
+            for uuid, site, path in locations
+        ]
+
+    @wtt.spanned()
+    async def pull_files_locations(
+        self, removals: List[Tuple[str, str, str]]
+    ) -> Tuple[List[Optional[Dict[str, Any]]], List[str]]:
+        """Remove locations from many files, deleting the files left without any.
+
+        `removals` is a list of (uuid, site, path). A file whose every
+        location is removed is deleted (an empty `locations` array would
+        collide with another under the unique `locations` index).
+        Otherwise, each removal is an atomic `$pull` of every location
+        entry with that site & path, which sets `meta_modify_date` (only
+        if the file has such an entry). Each step is one unordered bulk
+        write, so a failed removal does not stop the others.
+
+        Return the write error (or `None`) for each removal, and the
+        uuids of the deleted files.
+        """
+        errors: List[Optional[Dict[str, Any]]] = [None] * len(removals)
+        if not removals:
+            return errors, []
+
+        locations_by_uuid: Dict[str, List[Dict[str, str]]] = {}
+        for uuid, site, path in removals:
+            locations_by_uuid.setdefault(uuid, []).append({"site": site, "path": path})
+        uuids = list(locations_by_uuid)
+
+        # delete the files left without any locations
+        deletes = [
+            pymongo.DeleteOne({"uuid": uuid, "locations": {
+                "$elemMatch": {"$or": locations},
+                "$not": {"$elemMatch": {"$nor": locations}},  # none would be left
+            }})
+            for uuid, locations in locations_by_uuid.items()
+        ]
+        try:
+            await self.client.files.bulk_write(deletes, ordered=False)
+        except BulkWriteError as e:
+            failed = {uuids[w["index"]]: w for w in e.details["writeErrors"]}
+            errors = [failed.get(uuid) for uuid, _, _ in removals]
+
+        # then, pull from the rest
+        now = str(datetime.datetime.utcnow())
+        updates = [
+            pymongo.UpdateOne(
+                {"uuid": uuid, "locations": {"$elemMatch": {"site": site, "path": path}}},
+                {"$pull": {"locations": {"site": site, "path": path}}, "$set": {"meta_modify_date": now}},
+            )
+            for uuid, site, path in removals
+        ]
+        try:
+            await self.client.files.bulk_write(updates, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details["writeErrors"]:
+                errors[write_error["index"]] = errors[write_error["index"]] or write_error
+
+        # a location removed concurrently (ex: by another request) can still leave a file empty
+        await self.client.files.delete_many({"uuid": {"$in": uuids}, "locations": {"$size": 0}})
+        remaining = await self.client.files.find({"uuid": {"$in": uuids}}, {"_id": False, "uuid": True}).to_list(None)
+        remaining_uuids = {f["uuid"] for f in remaining}
+        deleted = [u for u in uuids if u not in remaining_uuids]
+        if deleted:
+            await self._record_deletions(deleted)
+
+        for uuid in uuids:
+            self._cache_file(uuid, None)
+        return errors, deleted
+
+    async def _record_deletions(self, uuids: List[str]) -> None:
+        """Leave tombstones of deleted files, for the changes feed."""
+        now = str(datetime.datetime.utcnow())
+        await self.client.file_tombstones.insert_many(
+            [{"uuid": uuid, "meta_modify_date": now, "deleted": True} for uuid in uuids]
+        )
+        # materialized collections drop them right away, not at their next refresh
+        await self.client.collection_files.delete_many({"uuid": {"$in": uuids}})
+
+    def _cache_file(self, uuid: str, file: Optional[Metadata]) -> None:
+        """Write-through `file` to the file cache (or evict it if `None`)."""
+        if self.file_cache is None:
+            return
+        if file is None:
+            self.file_cache.pop(uuid)
+        else:
+            self.file_cache.set(uuid, bson.encode({k: v for k, v in file.items() if k != "_id"}))
+
     @wtt.spanned(all_args=True)
     async def get_file(
-        self, filters: Dict[str, Any], max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS
+        self,
+        filters: Dict[str, Any],
+        max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS,
+        use_cache: bool = True,
     ) -> Optional[Metadata]:
-        """Get file matching filters."""
+        """Get file matching filters.
+
+        A lookup by uuid alone (`{"uuid": ...}`) is served from the file
+        cache, if it's enabled (& `use_cache`). Either way, the file
+        read from the database is cached. Writes based on the file
+        (read-modify-write, `If-Match`) should not `use_cache`: the
+        cache may be stale, by a write from another process.
+        """
+        uuid = filters.get("uuid") if list(filters) == ["uuid"] else None
+        if self.file_cache is not None and isinstance(uuid, str) and use_cache:
+            if cached := self.file_cache.get(uuid):
+                return cast(Metadata, bson.decode(cached))
+
         file = await self.client.files.find_one(
-            filters, {"_id": False}, max_time_ms=max_time_ms
+            filters, {"_id": False}, **self._find_options(max_time_ms)
         )
         if file:
+            if isinstance(uuid, str):
+                self._cache_file(uuid, file)
             return cast(Metadata, file)
         return None
 
+    @staticmethod
+    def _conditional_filters(
+        filters: Dict[str, Any], if_modify_date: Optional[str]
+    ) -> Dict[str, Any]:
+        """Add the (optional) `meta_modify_date` condition to `filters`."""
+        if if_modify_date is None:
+            return filters
+        return {**filters, "meta_modify_date": if_modify_date}
+
     async def _find_file_and_update(
-        self, uuid: str, update_query: Dict[str, Any]
+        self,
+        uuid: str,
+        update_query: Dict[str, Any],
+        if_modify_date: Optional[str] = None,
     ) -> Metadata:
         """Wrap `find_one_and_update()`."""
         doc: Optional[Metadata] = await self.client.files.find_one_and_update(
-            {"uuid": uuid},
+            self._conditional_filters({"uuid": uuid}, if_modify_date),
             update_query,
             projection={"_id": False},
             maxTimeMS=DEFAULT_MAX_TIME_MS,
             return_document=pymongo.ReturnDocument.AFTER,
         )
+        self._cache_file(uuid, doc)
 
         if doc is None:
             msg = f"Record ({uuid}) was not found, so it was not updated"
             logger.warning(msg)
+            if if_modify_date is not None:
+                raise PreconditionFailedError(msg)
             raise FileNotFoundError(msg)
         else:
             return doc
 
     @wtt.spanned(all_args=True)
-    async def update_file(self, uuid: str, update: Metadata) -> Metadata:
+    async def update_file(
+        self, uuid: str, update: Metadata, if_modify_date: Optional[str] = None
+    ) -> Metadata:
         """Update file using `update` subset.
 
+        If `if_modify_date` is given, only update the file if its
+        `meta_modify_date` is still that value, otherwise raise
+        `PreconditionFailedError`.
+
         Return the updated file document.
         """
-        return await self._find_file_and_update(uuid, {"$set": update})
+        return await self._find_file_and_update(uuid, {"$set": update}, if_modify_date)
 
     @wtt.spanned(all_args=True)
-    async def replace_file(self, metadata: Metadata) -> None:
+    async def replace_file(
+        self, metadata: Metadata, if_modify_date: Optional[str] = None
+    ) -> None:
         """Replace file.
 
-        Metadata must include 'uuid'.
+        Metadata must include 'uuid'. See `update_file()` for `if_modify_date`.
         """
         uuid = metadata["uuid"]
 
-        result = await self.client.files.replace_one({"uuid": uuid}, metadata)
+        result = await self.client.files.replace_one(
+            self._conditional_filters({"uuid": uuid}, if_modify_date), metadata
+        )
+        self._cache_file(uuid, metadata if result.matched_count == 1 else None)
 
         if result.modified_count != 1:
             msg = f"updated {result.modified_count} files with id {uuid}"
             logger.error(msg)
+            if if_modify_date is not None and result.matched_count == 0:
+                raise PreconditionFailedError(msg)
             raise Exception(msg)
 
     @wtt.spanned(all_args=True)
-    async def delete_file(self, filters: Dict[str, Any]) -> None:
-        """Delete file matching filters."""
-        # note: result.deleted_count == 1, even when more than one document matches
+    async def delete_file(
+        self, filters: Dict[str, Any], if_modify_date: Optional[str] = None
+    ) -> None:
+        """Delete file matching filters.
+
+        See `update_file()` for `if_modify_date`.
+        """
+        # note: only one document is deleted, even when more than one matches
         match_count = await self.count_files(filters)
         if match_count > 1:
             msg = f"filters {filters} matches {match_count} documents; preventing ambiguous delete of files document"
             logger.error(msg)
             raise Exception(msg)
 
-        result = await self.client.files.delete_one(filters)
+        deleted = await self.client.files.find_one_and_delete(
+            self._conditional_filters(filters, if_modify_date), {"_id": False, "uuid": True}
+        )
+        if deleted:
+            await self._record_deletions([deleted["uuid"]])
+        if self.file_cache is not None and deleted:
+            if isinstance(filters.get("uuid"), str):
+                self.file_cache.pop(filters["uuid"])
+            else:
+                self.file_cache.clear()
 
-        if result.deleted_count != 1:
-            msg = f"deleted {result.deleted_count} files with filters {filters}"
+        if not deleted:
+            msg = f"deleted 0 files with filters {filters}"
             logger.error(msg)
+            if if_modify_date is not None and match_count == 1:
+                raise PreconditionFailedError(msg)
             raise Exception(msg)
 
     async def find_collections(
@@ -261,6 +1291,7 @@ class Mongo:
         keys: Optional[Union[List[str], AllKeys]] = None,
         limit: Optional[int] = None,
         start: int = 0,
+        secondary_ok: bool = False,
     ) -> List[Dict[str, Any]]:
         """Find all collections.
 
@@ -270,12 +1301,14 @@ class Mongo:
             keys -- fields to include in MongoDB projection
             limit -- max count of collections returned
             start -- starting index
+            secondary_ok -- use the configured read preference, instead of the primary
 
         Returns:
             List of MongoDB collections
         """
         projection = Mongo._get_projection(keys)  # show all fields by default
-        cursor = self.client.collections.find({"uuid": {"$exists": True}}, projection)
+        db = self.reader if secondary_ok else self.client
+        cursor = db.collections.find({"uuid": {"$exists": True}}, projection, **self._find_options())
         results = await Mongo._limit_result_list(cursor, limit, start)
 
         return results
@@ -286,6 +1319,7 @@ class Mongo:
         Return uuid.
         """
         result = await self.client.collections.insert_one(metadata)
+        self._uncache_collection(metadata)
 
         if not result.inserted_id:
             msg = "did not insert new collection"
@@ -296,15 +1330,187 @@ class Mongo:
 
     async def get_collection(self, filters: Dict[str, Any]) -> Dict[str, Any]:
         """Get collection matching filters."""
-        collection = await self.client.collections.find_one(filters, {"_id": False})
+        collection = await self.client.collections.find_one(filters, {"_id": False}, **self._find_options())
         return cast(Dict[str, Any], collection)
 
+    async def lookup_collection(self, uid: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Get the collection by uuid, or else by name, with its decoded query.
+
+        Collections are cached (for `collection_cache_ttl` seconds, this
+        bounds staleness from writes by other File Catalog instances).
+        The caller gets its own copies.
+
+        Returns:
+            the collection & its query, or `None` if it's not found
+        """
+        for field in ["uuid", "collection_name"]:
+            entry = self.collection_cache.get((field, uid))
+            if entry is None:
+                collection = await self.client.collections.find_one({field: uid}, {"_id": False}, **self._find_options())
+                if not collection:
+                    continue
+                entry = (collection, json.loads(collection["query"]))
+                self.collection_cache.set((field, uid), entry)
+            return dict(entry[0]), copy.deepcopy(entry[1])
+        return None
+
+    def _uncache_collection(self, collection: Dict[str, Any]) -> None:
+        """Evict the collection from `collection_cache`."""
+        self.collection_cache.pop(("uuid", collection["uuid"]))
+        if "collection_name" in collection:
+            self.collection_cache.pop(("collection_name", collection["collection_name"]))
+
+    async def materialize_collection(self, uuid: str, query: Dict[str, Any], since: Tuple[str, str]) -> int:
+        """Store the uuids of the files matching the collection's `query` in 'collection_files'.
+
+        From then on, the collection's files are listed from there (see
+        `find_collection_files()`), & kept up to date by
+        `refresh_materialized_collections()`, starting with the files
+        changed after `since` (a `find_files_changed()` position).
+
+        Returns:
+            the number of files
+        """
+        await self.client.collection_files.delete_many({"collection_id": uuid})
+
+        if await self.server_version() >= MERGE_VERSION:
+            pipeline = [
+                {"$match": query},
+                {"$project": {"_id": False, "collection_id": {"$literal": uuid}, "uuid": True}},
+                {"$merge": {
+                    "into": "collection_files",
+                    "on": ["collection_id", "uuid"],
+                    "whenMatched": "keepExisting",
+                    "whenNotMatched": "insert",
+                }},
+            ]
+            await self.client.files.aggregate(pipeline, allowDiskUse=True).to_list(None)
+        else:
+            async for batch in self.iter_files(query, keys=["uuid"]):
+                await self.client.collection_files.insert_many(
+                    [{"collection_id": uuid, "uuid": f["uuid"]} for f in batch], ordered=False
+                )
+        count = cast(int, await self.client.collection_files.count_documents({"collection_id": uuid}))
+
+        collection = await self.client.collections.find_one_and_update(
+            {"uuid": uuid}, {"$set": {"materialized_since": list(since)}}
+        )
+        if collection:
+            self._uncache_collection(collection)
+
+        logger.info("materialized collection %s: %d files", uuid, count)
+        return count
+
+    async def refresh_materialized_collections(self, settle_seconds: float = 0) -> int:
+        """Bring each materialized collection's files up to date, incrementally.
+
+        Only the files changed since its last refresh are re-evaluated
+        against its query (see `find_files_changed()`, for
+        `settle_seconds`). Deleted files are removed as soon as they're
+        deleted, and again when their tombstones come up.
+        A collection is refreshed by one process at a time.
+
+        Returns:
+            the number of files re-evaluated
+        """
+        now = datetime.datetime.utcnow()
+        until = str(now - datetime.timedelta(seconds=settle_seconds))
+        total = 0
+
+        async for collection in self.client.collections.find({"materialized_since": {"$exists": True}}):
+            uuid = collection["uuid"]
+            lease = await self.client.collections.update_one(
+                {"uuid": uuid, "$or": [{"refresh_lease": {"$lt": now}}, {"refresh_lease": {"$exists": False}}]},
+                {"$set": {"refresh_lease": now + MATERIALIZED_REFRESH_LEASE}},
+            )
+            if not lease.modified_count:
+                continue  # another process is on it
+
+            query = json.loads(collection["query"])
+            since = cast(Tuple[str, str], tuple(collection["materialized_since"]))
+            while page := await self.find_files_changed(
+                until, since, keys=["uuid"], limit=MATERIALIZED_REFRESH_BATCH_SIZE
+            ):
+                uuids = [f["uuid"] for f in page]
+                cursor = self.client.files.find({"$and": [query, {"uuid": {"$in": uuids}}]}, {"_id": False, "uuid": True})
+                matched = {f["uuid"] for f in await cursor.to_list(None)}
+
+                requests: List[Any] = [
+                    pymongo.UpdateOne({"collection_id": uuid, "uuid": u}, {"$setOnInsert": {"collection_id": uuid, "uuid": u}}, upsert=True)
+                    for u in matched
+                ]
+                requests.append(pymongo.DeleteMany({"collection_id": uuid, "uuid": {"$in": [u for u in uuids if u not in matched]}}))
+                await self.client.collection_files.bulk_write(requests, ordered=False)
+
+                since = (page[-1]["meta_modify_date"], page[-1]["uuid"])
+                await self.client.collections.update_one({"uuid": uuid}, {"$set": {"materialized_since": list(since)}})
+                total += len(page)
+
+            await self.client.collections.update_one({"uuid": uuid}, {"$unset": {"refresh_lease": ""}})
+            self._uncache_collection(collection)
+
+        return total
+
+    @wtt.spanned(all_args=True)
+    async def find_collection_files(
+        self,
+        collection_id: str,
+        keys: Optional[Union[List[str], AllKeys]] = None,
+        limit: Optional[int] = None,
+        start: int = 0,
+        after: Optional[ObjectId] = None,
+        max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS,
+        secondary_ok: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], Optional[ObjectId]]:
+        """Find a page of a materialized collection's files.
+
+        The collection's stored uuids are joined with the files, so its
+        query isn't run. Pages are in the order the files were added;
+        `after` pages by keyset, like `find_files_after()`. "_id" is
+        always excluded.
+
+        Keyword Arguments:
+            collection_id -- the collection's uuid
+            keys -- fields to include in MongoDB projection
+            limit -- max count of files returned
+            start -- starting index
+            after -- the last `_id` of the previous page (`None` for the first page)
+            max_time_ms -- the query timeout in milliseconds
+            secondary_ok -- use the configured read preference, instead of the primary
+
+        Returns:
+            List of MongoDB files, and
+            the `_id` to pass as the next page's `after` (`None` if there are no more pages)
+        """
+        match: Dict[str, Any] = {"collection_id": collection_id}
+        if after is not None:
+            match["_id"] = {"$gt": after}
+
+        pipeline: List[Dict[str, Any]] = [
+            {"$match": match},
+            {"$sort": {"_id": pymongo.ASCENDING}},
+            {"$skip": start},
+        ]
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline += [
+            {"$lookup": {"from": "files", "localField": "uuid", "foreignField": "uuid", "as": "file"}},
+            {"$project": {**Mongo._get_joined_file_projection(keys), "_id": True}},
+        ]
+
+        db = self.reader if secondary_ok else self.client
+        rows = await db.collection_files.aggregate(pipeline, **self._read_options(max_time_ms)).to_list(None)
+        files = [row["file"][0] for row in rows if row["file"]]
+        last_id = rows[-1]["_id"] if limit and len(rows) == limit else None
+        return files, last_id
+
     async def find_snapshots(
         self,
         query: Optional[Dict[str, Any]] = None,
         keys: Optional[Union[List[str], AllKeys]] = None,
         limit: Optional[int] = None,
         start: int = 0,
+        secondary_ok: bool = False,
     ) -> List[Dict[str, Any]]:
         """Find snapshots.
 
@@ -315,22 +1521,43 @@ class Mongo:
             keys -- fields to include in MongoDB projection
             limit -- max count of snapshots returned
             start -- starting index
+            secondary_ok -- use the configured read preference, instead of the primary
 
         Returns:
             List of MongoDB snapshots
         """
         projection = Mongo._get_projection(keys)  # show all fields by default
-        cursor = self.client.snapshots.find(query, projection)
+        db = self.reader if secondary_ok else self.client
+        cursor = db.snapshots.find(query, projection, **self._find_options())
         results = await Mongo._limit_result_list(cursor, limit, start)
 
         return results
 
-    async def create_snapshot(self, metadata: Dict[str, Any]) -> str:
+    async def create_snapshot(
+        self,
+        metadata: Dict[str, Any],
+        query: Optional[Dict[str, Any]] = None,
+    ) -> str:
         """Insert metadata into 'snapshots' collection.
 
+        If `query` is given, the uuids of the files matching it are
+        stored as the snapshot's membership (see
+        `_create_snapshot_files()`), and their count as "file_count".
+        The membership is written first, so a snapshot is never visible
+        without all of its files.
+
         Return uuid.
         """
-        result = await self.client.snapshots.insert_one(metadata)
+        if query is not None:
+            metadata["file_count"] = await self._create_snapshot_files(metadata["uuid"], query)
+            metadata["status"] = SNAPSHOT_COMPLETE
+
+        try:
+            result = await self.client.snapshots.insert_one(metadata)
+        except Exception:
+            if query is not None:
+                await self.client.snapshot_files.delete_many({"snapshot_id": metadata["uuid"]})
+            raise
 
         if (not result) or (not result.inserted_id):
             msg = "did not insert new snapshot"
@@ -339,17 +1566,214 @@ class Mongo:
 
         return cast(str, metadata["uuid"])
 
+    async def start_snapshot(self, metadata: Dict[str, Any], query: Dict[str, Any]) -> str:
+        """Insert metadata into 'snapshots' collection, and store its membership in the background.
+
+        The snapshot's "status" is "pending" (since "started_date")
+        until its membership is stored, then "complete" (with
+        "file_count" & "completion_date"), or "failed" (with "error").
+        The membership is stored by this process, so a snapshot left
+        pending by one that died is failed by `fail_stale_snapshots()`.
+
+        Return uuid.
+        """
+        metadata["status"] = SNAPSHOT_PENDING
+        metadata["started_date"] = str(datetime.datetime.utcnow())
+        uuid = await self.create_snapshot(metadata)
+
+        job = create_background_task(self._finish_snapshot(uuid, query))
+        self._snapshot_jobs.add(job)
+        job.add_done_callback(self._snapshot_jobs.discard)
+        return uuid
+
+    async def _finish_snapshot(self, uuid: str, query: Dict[str, Any]) -> None:
+        """Store the membership of a pending snapshot, then set its status."""
+        update: Dict[str, Any]
+        try:
+            count = await self._create_snapshot_files(uuid, query)
+        except Exception as e:  # pylint: disable=W0703
+            logger.exception("snapshot %s failed", uuid)
+            await self.client.snapshot_files.delete_many({"snapshot_id": uuid})
+            update = {"status": SNAPSHOT_FAILED, "error": str(e)}
+        else:
+            update = {"status": SNAPSHOT_COMPLETE, "file_count": count}
+        update["completion_date"] = str(datetime.datetime.utcnow())
+        res = await self.client.snapshots.update_one({"uuid": uuid, "status": SNAPSHOT_PENDING}, {"$set": update})
+        if not res.modified_count:
+            # it was failed as stale meanwhile
+            await self.client.snapshot_files.delete_many({"snapshot_id": uuid})
+
+    async def fail_stale_snapshots(self, max_seconds: float) -> int:
+        """Fail the snapshots pending for more than `max_seconds`.
+
+        These were (most likely) left behind by a process that died
+        while storing their membership (see `start_snapshot()`).
+
+        Returns:
+            the number of snapshots failed
+        """
+        now = datetime.datetime.utcnow()
+        started = str(now - datetime.timedelta(seconds=max_seconds))
+        query = {"status": SNAPSHOT_PENDING, "$or": [
+            {"started_date": {"$lt": started}},
+            {"started_date": {"$exists": False}},
+        ]}
+        update = {"status": SNAPSHOT_FAILED, "error": "interrupted", "completion_date": str(now)}
+
+        count = 0
+        async for snapshot in self.client.snapshots.find(query, {"_id": False, "uuid": True}):
+            res = await self.client.snapshots.update_one({**query, "uuid": snapshot["uuid"]}, {"$set": update})
+            if res.modified_count:
+                await self.client.snapshot_files.delete_many({"snapshot_id": snapshot["uuid"]})
+                count += 1
+        return count
+
+    async def _create_snapshot_files(self, snapshot_id: str, query: Dict[str, Any]) -> int:
+        """Store the uuids of the files matching `query` as the snapshot's membership.
+
+        The uuids are stored in chunks of `SNAPSHOT_CHUNK_SIZE` in the
+        'snapshot_files' collection (so a snapshot's size isn't bound by
+        the document size limit). On MongoDB 5.0+, the chunks are built
+        & written by an aggregation, without the uuids leaving the
+        database; otherwise, they're streamed through, one chunk at a
+        time.
+
+        Returns:
+            the number of files
+        """
+        # clear out any leftovers of a failed attempt
+        await self.client.snapshot_files.delete_many({"snapshot_id": snapshot_id})
+
+        if await self.server_version() >= WINDOW_FIELDS_VERSION:
+            await self._merge_snapshot_files(snapshot_id, query)
+            count = await self.count_snapshot_files(snapshot_id)
+        else:
+            count = await self._insert_snapshot_files(snapshot_id, query)
+
+        logger.info("created snapshot %s membership: %d files", snapshot_id, count)
+        return count
+
+    async def _merge_snapshot_files(self, snapshot_id: str, query: Dict[str, Any]) -> None:
+        """Build & write the snapshot's membership chunks with an aggregation ($merge)."""
+        pipeline = [
+            {"$match": query},
+            {"$project": {"uuid": True}},
+            {"$setWindowFields": {
+                "sortBy": {"_id": pymongo.ASCENDING},
+                "output": {"position": {"$documentNumber": {}}},
+            }},
+            {"$group": {
+                "_id": {"$toInt": {"$floor": {"$divide": [{"$subtract": ["$position", 1]}, SNAPSHOT_CHUNK_SIZE]}}},
+                "files": {"$push": "$uuid"},
+            }},
+            {"$project": {"_id": False, "snapshot_id": {"$literal": snapshot_id}, "seq": "$_id", "files": True}},
+            {"$merge": {
+                "into": "snapshot_files",
+                "on": ["snapshot_id", "seq"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }},
+        ]
+        await self.client.files.aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+    async def _insert_snapshot_files(self, snapshot_id: str, query: Dict[str, Any]) -> int:
+        """Stream the snapshot's membership chunks through, one at a time.
+
+        Returns:
+            the number of files
+        """
+        count = 0
+        chunk: List[str] = []
+        async for batch in self.iter_files(query, keys=["uuid"], batch_size=SNAPSHOT_CHUNK_SIZE):
+            for file in batch:
+                chunk.append(file["uuid"])
+                if len(chunk) == SNAPSHOT_CHUNK_SIZE:
+                    await self.client.snapshot_files.insert_one(
+                        {"snapshot_id": snapshot_id, "seq": count // SNAPSHOT_CHUNK_SIZE, "files": chunk}
+                    )
+                    count += len(chunk)
+                    chunk = []
+        if chunk:
+            await self.client.snapshot_files.insert_one(
+                {"snapshot_id": snapshot_id, "seq": count // SNAPSHOT_CHUNK_SIZE, "files": chunk}
+            )
+            count += len(chunk)
+        return count
+
+    async def count_snapshot_files(self, snapshot_id: str) -> int:
+        """Count the files stored in the snapshot's membership so far."""
+        pipeline = [
+            {"$match": {"snapshot_id": snapshot_id}},
+            {"$group": {"_id": None, "count": {"$sum": {"$size": "$files"}}}},
+        ]
+        res = await self.client.snapshot_files.aggregate(pipeline, **self._read_options()).to_list(None)
+        return cast(int, res[0]["count"]) if res else 0
+
+    @wtt.spanned(all_args=True)
+    async def find_snapshot_files(
+        self,
+        snapshot_id: str,
+        keys: Optional[Union[List[str], AllKeys]] = None,
+        limit: Optional[int] = None,
+        start: int = 0,
+        max_time_ms: Optional[int] = DEFAULT_MAX_TIME_MS,
+        secondary_ok: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Find a page of a snapshot's files, in membership order.
+
+        Only the membership chunks holding the page are read (using
+        their (`snapshot_id`, `seq`) index), then joined with the files
+        by uuid, so a page costs the same no matter the snapshot's size
+        or `start`. Files deleted since the snapshot was taken are
+        skipped. "_id" is always excluded.
+
+        Keyword Arguments:
+            snapshot_id -- the snapshot's uuid
+            keys -- fields to include in MongoDB projection
+            limit -- max count of files returned
+            start -- starting position in the snapshot
+            max_time_ms -- the query timeout in milliseconds
+            secondary_ok -- use the configured read preference, instead of the primary
+
+        Returns:
+            List of MongoDB files, and
+            the number of snapshot positions read (including skipped files)
+        """
+        seq_range: Dict[str, int] = {"$gte": start // SNAPSHOT_CHUNK_SIZE}
+        if limit:
+            seq_range["$lte"] = (start + limit - 1) // SNAPSHOT_CHUNK_SIZE
+
+        pipeline: List[Dict[str, Any]] = [
+            {"$match": {"snapshot_id": snapshot_id, "seq": seq_range}},
+            {"$sort": {"seq": pymongo.ASCENDING}},
+            {"$unwind": "$files"},
+            {"$skip": start % SNAPSHOT_CHUNK_SIZE},
+        ]
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline += [
+            {"$lookup": {"from": "files", "localField": "files", "foreignField": "uuid", "as": "file"}},
+            {"$project": Mongo._get_joined_file_projection(keys)},
+        ]
+
+        db = self.reader if secondary_ok else self.client
+        rows = await db.snapshot_files.aggregate(pipeline, **self._read_options(max_time_ms)).to_list(None)
+        files = [row["file"][0] for row in rows if row["file"]]
+        return files, len(rows)
+
     async def get_snapshot(self, filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         """Find snapshot, optionally filtered."""
-        snapshot = await self.client.snapshots.find_one(filters, {"_id": False})
+        snapshot = await self.client.snapshots.find_one(filters, {"_id": False}, **self._find_options())
         return cast(Dict[str, Any], snapshot)
 
     @wtt.spanned(all_args=True)
     async def append_distinct_elements_to_file(
-        self, uuid: str, metadata: Dict[str, Any]
+        self, uuid: str, metadata: Dict[str, Any], if_modify_date: Optional[str] = None
     ) -> Metadata:
         """Append distinct elements to arrays within a file document.
 
+        See `update_file()` for `if_modify_date`.
+
         Return the updated file document.
         """
         # build the query to update the file document
@@ -362,4 +1786,4 @@ class Mongo:
 
         # update the file document
         update_query["$set"] = {"meta_modify_date": str(datetime.datetime.utcnow())}
-        return await self._find_file_and_update(uuid, update_query)
+        return await self._find_file_and_update(uuid, update_query, if_modify_date)
@@ -4,7 +4,7 @@
 import re
 from typing import Any, Dict, List, Optional, cast
 
-from .. import utils
+from .. import metrics, utils
 from . import types
 
 
@@ -100,25 +100,49 @@ class Validation:
             return True  # value was not found in old_metadata
 
     @staticmethod
-    def _has_forbidden_fields(
-        apihandler: Any,
+    def _find_forbidden_fields_error(
         metadata: types.Metadata,
         old_metadata: types.Metadata,
         forbidden_fields: List[str],
         http_error_message: str,
-    ) -> bool:
+    ) -> Optional[str]:
+        """Return the error message for the first forbidden field, or `None`."""
         forbidden_matches = Validation._find_all_field_vals(metadata, forbidden_fields)
 
         for field, val in forbidden_matches.items():
             if Validation._field_vals_are_different(field, val, old_metadata):
-                apihandler.send_error(
-                    400,
-                    reason=f"Validation Error: {http_error_message} '{field}'",
-                    file=apihandler.files_url,
-                )
-                return True
+                return f"Validation Error: {http_error_message} '{field}'"
+        return None
+
+    @staticmethod
+    def _has_forbidden_fields(
+        apihandler: Any,
+        metadata: types.Metadata,
+        old_metadata: types.Metadata,
+        forbidden_fields: List[str],
+        http_error_message: str,
+    ) -> bool:
+        error = Validation._find_forbidden_fields_error(
+            metadata, old_metadata, forbidden_fields, http_error_message
+        )
+        if error:
+            apihandler.send_error(400, reason=error, file=apihandler.files_url)
+            return True
         return False
 
+    @metrics.timed(metrics.PHASE_VALIDATION)
+    def find_forbidden_fields_creation_error(
+        self, metadata: types.Metadata
+    ) -> Optional[str]:
+        """Return the error message if `metadata` has forbidden fields, or `None`."""
+        return self._find_forbidden_fields_error(
+            metadata,
+            {},
+            self.FORBIDDEN_FIELDS_CREATION,
+            "forbidden field creation",
+        )
+
+    @metrics.timed(metrics.PHASE_VALIDATION)
     def has_forbidden_fields_creation(
         self, apihandler: Any, metadata: types.Metadata
     ) -> bool:
@@ -131,6 +155,7 @@ class Validation:
             "forbidden field creation",
         )
 
+    @metrics.timed(metrics.PHASE_VALIDATION)
     def has_forbidden_fields_modification(
         self, apihandler: Any, metadata: types.Metadata, old_metadata: types.Metadata
     ) -> bool:
@@ -155,44 +180,47 @@ class Validation:
                 return field
         return None
 
-    def validate_metadata_schema_typing(
-        self, apihandler: Any, metadata: types.Metadata
-    ) -> bool:
-        """Check that `metadata` is okay to insert into the database.
+    @metrics.timed(metrics.PHASE_VALIDATION)
+    def find_metadata_schema_typing_error(
+        self, metadata: types.Metadata
+    ) -> Optional[str]:
+        """Return the error message if `metadata` is not okay to insert into the database.
 
-        Utilizes `send_error` and returns `False` if validation failed.
-        If validation was successful, `True` is returned.
+        If validation was successful, `None` is returned.
         """
         # fmt: off
         # MANDATORY FIELDS
         missing = self._find_missing_mandatory_field(metadata, self.MANDATORY_FIELDS)
         if missing:
-            apihandler.send_error(
-                400,
-                reason=f"Validation Error: metadata missing mandatory field `{missing}` "
-                       f"(mandatory fields: {', '.join(self.MANDATORY_FIELDS)})",
-                file=apihandler.files_url
+            return (
+                f"Validation Error: metadata missing mandatory field `{missing}` "
+                f"(mandatory fields: {', '.join(self.MANDATORY_FIELDS)})"
             )
-            return False
 
         # CHECKSSUM.SHA512
         if not self.is_valid_sha512(metadata['checksum']['sha512']):
             # force to use SHA512
-            apihandler.send_error(
-                400,
-                reason='Validation Error: `checksum[sha512]` needs to be a SHA512 hash',
-                file=apihandler.files_url
-            )
-            return False
+            return 'Validation Error: `checksum[sha512]` needs to be a SHA512 hash'
 
         # LOCATIONS LIST & ITS ENTRIES
         if not self.is_valid_location_list(metadata['locations']):
-            apihandler.send_error(
-                400,
-                reason=self.INVALID_LOCATIONS_LIST_MESSAGE,
-                file=apihandler.files_url
-            )
+            return self.INVALID_LOCATIONS_LIST_MESSAGE
+
+        return None
+        # fmt: on
+
+    @metrics.timed(metrics.PHASE_VALIDATION)
+    def validate_metadata_schema_typing(
+        self, apihandler: Any, metadata: types.Metadata
+    ) -> bool:
+        """Check that `metadata` is okay to insert into the database.
+
+        Utilizes `send_error` and returns `False` if validation failed.
+        If validation was successful, `True` is returned.
+        """
+        error = self.find_metadata_schema_typing_error(metadata)
+        if error:
+            apihandler.send_error(400, reason=error, file=apihandler.files_url)
             return False
 
         return True
-        # fmt: on
@@ -4,21 +4,39 @@
 # fmt: off
 # pylint: disable=R0913,R0903
 
+import asyncio
 import datetime
+import hashlib
 import logging
 import os
 import secrets
+import socket
 import sys
 from pkgutil import get_loader
-from typing import Any, Callable, Dict, Optional, cast
+from typing import Any, Callable, Dict, List, Optional, Union, cast
 from uuid import uuid1
 
+from bson.raw_bson import RawBSONDocument  # type: ignore[import]
+from pymongo.errors import ExecutionTimeout  # type: ignore[import]
 from rest_tools.server import keycloak_role_auth, RestHandler, RestHandlerSetup, RestServer
-from tornado.escape import json_decode, json_encode
-from tornado.web import HTTPError
-
-from . import argbuilder, deconfliction, urlargparse
-from .mongo import Mongo
+from tornado.concurrent import Future
+from tornado.escape import json_decode, json_encode, utf8
+from tornado.httpserver import HTTPServer
+from tornado.web import Application, HTTPError
+
+from . import argbuilder, deconfliction, encoding, metrics, urlargparse, utils
+from .config import ConfigValidationError
+from .mongo import (
+    DUPLICATE_KEY_ERROR_CODE,
+    Mongo,
+    PreconditionFailedError,
+    RequestScope,
+    SNAPSHOT_COMPLETE,
+    encode_changes_token,
+    encode_continuation_token,
+    encode_snapshot_token,
+    start_request_scope,
+)
 from .schema import types
 from .schema.validation import Validation
 
@@ -31,6 +49,23 @@ CONFIG_LOGGING_DENY_LIST = ["FC_COOKIE_SECRET", "MONGODB_AUTH_PASS"]
 FC_AUTH_PREFIX = "resource_access.file-catalog.roles"
 FC_AUTH_ROLES = ["system"]
 
+STREAM_NDJSON = "ndjson"
+STREAM_JSON = "json"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+PRECONDITION_FAILED_REASON = 'File was modified (ETag does not match If-Match)'
+
+INDEX_ENFORCEMENT_OFF = "off"
+INDEX_ENFORCEMENT_FLAG = "flag"
+INDEX_ENFORCEMENT_LIMIT = "limit"
+INDEX_ENFORCEMENT_REJECT = "reject"
+INDEX_ENFORCEMENT_MODES = [
+    INDEX_ENFORCEMENT_OFF,
+    INDEX_ENFORCEMENT_FLAG,
+    INDEX_ENFORCEMENT_LIMIT,
+    INDEX_ENFORCEMENT_REJECT,
+]
+
 
 # --------------------------------------------------------------------------------------
 # Auth
@@ -87,11 +122,51 @@ def tornado_logger(handler: Any) -> None:
                handler._request_summary(), request_time)
 
 
+def is_default_files_query(query: Optional[StrDict]) -> bool:
+    """Return whether `query` has no filters but the default `locations.archive` one (see `argbuilder.build_files_query()`)."""
+    return not [k for k, v in (query or {}).items() if (k, v) != ('locations.archive', None)]
+
+
 def set_last_modification_date(metadata: types.Metadata) -> None:
     """Set the `"meta_modify_date"` field."""
     metadata['meta_modify_date'] = str(datetime.datetime.utcnow())
 
 
+def parse_time_budgets(spec: str) -> Dict[str, int]:
+    """Parse per-handler time budgets like "FilesCountHandler=30000,FilesHandler=5000" (ms).
+
+    Raises:
+        ValueError - if an entry is malformed, or not for an API handler
+    """
+    handlers = set()
+    todo = [APIHandler]
+    while todo:
+        cls = todo.pop()
+        handlers.add(cls.__name__)
+        todo.extend(cls.__subclasses__())
+
+    budgets = {}
+    for entry in filter(None, (e.strip() for e in spec.split(','))):
+        name, sep, value = entry.partition('=')
+        name = name.strip()
+        if not sep or not value.strip().isdigit():
+            raise ValueError(f"malformed entry (expected Handler=milliseconds): {entry!r}")
+        if name not in handlers:
+            raise ValueError(f"unknown handler: {name!r}")
+        budgets[name] = int(value)
+    return budgets
+
+
+def get_etag(metadata: types.Metadata) -> Optional[str]:
+    """Get the (strong) ETag for the record's version, from its `"meta_modify_date"` field.
+
+    Return `None` if the record has no `"meta_modify_date"` field.
+    """
+    if not metadata.get('meta_modify_date'):
+        return None
+    return '"' + hashlib.sha1(metadata['meta_modify_date'].encode()).hexdigest() + '"'
+
+
 # --------------------------------------------------------------------------------------
 # Server Setup
 # --------------------------------------------------------------------------------------
@@ -99,8 +174,13 @@ def set_last_modification_date(metadata: types.Metadata) -> None:
 def create(config: Dict[str, Any],
            mongo: Mongo,
            port: int = 8888,
-           debug: bool = False) -> RestServer:
-    """Create an instance of the File Catalog server."""
+           debug: bool = False,
+           sockets: Optional[List[socket.socket]] = None) -> RestServer:
+    """Create an instance of the File Catalog server.
+
+    If `sockets` are given (ex: bound before forking worker processes),
+    serve on those instead of binding `FC_HOST`:`FC_PORT`.
+    """
     for key in config:
         if key not in CONFIG_LOGGING_DENY_LIST:
             logger.info(f"config: {key} => '{config[key]}'")
@@ -109,6 +189,23 @@ def create(config: Dict[str, Any],
     logger.info(f"port: {port}")
     logger.info(f"debug: {debug}")
 
+    if config["FC_INDEX_ENFORCEMENT"] not in INDEX_ENFORCEMENT_MODES:
+        raise ConfigValidationError(
+            f"FC_INDEX_ENFORCEMENT must be one of {INDEX_ENFORCEMENT_MODES}"
+        )
+
+    try:
+        encoding.get_encoder(config["FC_JSON_ENCODER"])
+    except ValueError as e:
+        raise ConfigValidationError(f"FC_JSON_ENCODER: {e}")
+    if config["FC_RAW_BSON_JSON"] and not encoding.has_raw_bson_encoder():
+        raise ConfigValidationError("FC_RAW_BSON_JSON requires python-bsonjs")
+
+    try:
+        time_budgets = parse_time_budgets(config["FC_REQUEST_TIME_BUDGETS_MS"] or "")
+    except ValueError as e:
+        raise ConfigValidationError(f"FC_REQUEST_TIME_BUDGETS_MS: {e}")
+
     static_path = get_pkgdata_filename('file_catalog', 'data/www')
     if static_path is None:
         raise Exception('bad static path')
@@ -137,6 +234,7 @@ def create(config: Dict[str, Any],
     args["base_url"] = "/api"
     args["config"] = config
     args["db"] = mongo
+    args["time_budgets"] = time_budgets
 
     cookie_secret = secrets.token_hex(32)  # 32 bytes = 256-bits
     if 'FC_COOKIE_SECRET' in config:
@@ -160,6 +258,11 @@ def create(config: Dict[str, Any],
     server.add_route(r"/api/collections/([^\/]+)/snapshots",         SingleCollectionSnapshotsHandler,       args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
 
     server.add_route(r"/api/files",                                  FilesHandler,                           args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+    server.add_route(r"/api/files/bulk",                             FilesBulkHandler,                       args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+    server.add_route(r"/api/files/actions/add_locations",            FilesActionsAddLocationsHandler,        args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+    server.add_route(r"/api/files/actions/remove_locations",         FilesActionsRemoveLocationsHandler,     args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+    server.add_route(r"/api/files/aggregate",                        FilesAggregateHandler,                  args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+    server.add_route(r"/api/files/changes",                          FilesChangesHandler,                    args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
     server.add_route(r"/api/files/count",                            FilesCountHandler,                      args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
     server.add_route(r"/api/files/([^\/]+)",                         SingleFileHandler,                      args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
     server.add_route(r"/api/files/([^\/]+)/actions/remove_location", SingleFileActionsRemoveLocationHandler, args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
@@ -167,6 +270,21 @@ def create(config: Dict[str, Any],
 
     server.add_route(r"/api/snapshots/([^\/]+)",                     SingleSnapshotHandler,                  args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
     server.add_route(r"/api/snapshots/([^\/]+)/files",               SingleSnapshotFilesHandler,             args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+    server.add_route(r"/api/snapshots/([^\/]+)/status",              SingleSnapshotStatusHandler,            args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+
+    server.add_route(r"/api/slow_queries",                           SlowQueriesHandler,                     args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+    server.add_route(r"/api/stats",                                  StatsHandler,                           args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+
+    if config["FC_METRICS"]:
+        server.add_route(r"/metrics",                                MetricsHandler,                         args)  # type: ignore[no-untyped-call]  # noqa: E221, E241, E251
+
+    if sockets:
+        # like RestServer.startup(), but with already-bound sockets
+        app = Application(server.routes, **server.app_args)
+        server.http_server = HTTPServer(app, xheaders=True, max_body_size=server.max_body_size)
+        server.http_server.add_sockets(sockets)
+        logger.info(f"serving on {len(sockets)} inherited socket(s)")
+        return server
 
     address = config["FC_HOST"]
     port = config["FC_PORT"]
@@ -187,9 +305,15 @@ class APIHandler(RestHandler):
         config: Dict[str, Any],
         db: Optional[Mongo] = None,
         base_url: str = "/",
+        time_budgets: Optional[Dict[str, int]] = None,
         **kwargs: Any,
     ) -> None:
-        """Initialize handler."""
+        """Initialize handler.
+
+        `time_budgets` are the milliseconds that a request's database
+        reads may take, by handler name (otherwise,
+        `FC_REQUEST_TIME_BUDGET_MS`).
+        """
         super().initialize(**kwargs)  # type: ignore[no-untyped-call]
 
         if db is None:
@@ -198,13 +322,235 @@ class APIHandler(RestHandler):
         self.base_url = base_url
         self.config = config
         self.validation = Validation(self.config)
+        self.json_encoder = encoding.get_encoder(self.config['FC_JSON_ENCODER'])
+        self.metrics_timer: Optional[metrics.RequestTimer] = None
+        self.response_size = 0
+        self.time_budget_ms = (time_budgets or {}).get(
+            type(self).__name__, self.config['FC_REQUEST_TIME_BUDGET_MS']
+        )
+        self.request_scope: Optional[RequestScope] = None
+        self.request_task: Optional["asyncio.Task[Any]"] = None
+        self.client_disconnected = False
+
+    def prepare(self) -> None:
+        """Start the request's metrics & database scope, then prepare."""
+        name, method = type(self).__name__, self.request.method or ""
+        self.metrics_timer = metrics.start_request(name, method, record=bool(self.config['FC_METRICS']))
+        self.request_scope = start_request_scope(f"{method} {name}", self.time_budget_ms)
+        self.request_task = asyncio.current_task()
+        super().prepare()
+
+    def on_connection_close(self) -> None:
+        """Stop a read-only request's work when its client disconnects.
+
+        The handler's task is cancelled, and its database operations are
+        killed (cancelling a motor call doesn't stop it on the server).
+        Writes run to completion, so they're never left half-done.
+        """
+        super().on_connection_close()
+        if self._finished or self.request.method != 'GET' or not self.request_task:
+            return
+        self.client_disconnected = True
+        self.request_task.cancel()
+        if self.request_scope:
+            self.db.kill_request_ops_soon(self.request_scope.comment)
+
+    async def _execute(self, *args: Any, **kwargs: Any) -> None:
+        """Execute the request, and stop quietly if it's cancelled by the client disconnecting."""
+        try:
+            await super()._execute(*args, **kwargs)
+        except asyncio.CancelledError:
+            if not self.client_disconnected:
+                raise
+            logger.info(f"Client disconnected, request cancelled: {self._request_summary()}")
+            if self.metrics_timer:
+                self.metrics_timer.finish(499, self.response_size)  # "client closed request"
+
+    def _handle_request_exception(self, e: BaseException) -> None:
+        """Respond 504 to a database operation that ran out of time (instead of 500)."""
+        if isinstance(e, ExecutionTimeout) and not self._finished:
+            logger.warning(f"Database operation timed out: {self._request_summary()}: {e}")
+            self.send_error(504, reason='Request exceeded its time limit')
+            return
+        super()._handle_request_exception(e)
 
     def check_xsrf_cookie(self) -> None:  # noqa: D102
         pass
 
+    def decode_json_body(self) -> Any:
+        """Decode the JSON request body."""
+        with metrics.phase(metrics.PHASE_PARSE):
+            return json_decode(self.request.body)
+
+    def write(self, chunk: Union[str, bytes, StrDict]) -> None:
+        """Write `chunk` to the output buffer, encoding a dict with the configured JSON encoder."""
+        if isinstance(chunk, dict):
+            self.set_header('Content-Type', 'application/json; charset=UTF-8')
+            with metrics.phase(metrics.PHASE_SERIALIZE):
+                chunk = self.json_encoder(chunk)
+        chunk = utf8(chunk)
+        self.response_size += len(chunk)
+        super().write(chunk)
+
+    def finish(self, chunk: Union[str, bytes, StrDict, None] = None) -> "Future[None]":
+        """Finish the response (the "write" phase), then record the request's metrics."""
+        if chunk is not None:
+            self.write(chunk)
+        with metrics.phase(metrics.PHASE_WRITE):
+            future = super().finish()
+        if self.metrics_timer:
+            self.metrics_timer.finish(self.get_status(), self.response_size)
+        return future
+
+    @metrics.timed(metrics.PHASE_SERIALIZE)
+    def encode_files(self, files: List[Any], sep: bytes) -> bytes:
+        """Encode each file (dict or raw BSON) as JSON, joined by `sep`."""
+        if files and isinstance(files[0], RawBSONDocument):
+            return encoding.encode_raw_bson_list(files, sep)
+        return sep.join(self.json_encoder(f) for f in files)
+
     def set_default_headers(self) -> None:  # noqa: D102
         self.set_header('Content-Type', 'application/hal+json; charset=UTF-8')
 
+    def get_stream_format(self, kwargs: StrDict) -> Optional[str]:
+        """Pop `"stream"` from `kwargs` and negotiate the streaming format.
+
+        `stream=ndjson` (or an `Accept: application/x-ndjson` header)
+        selects newline-delimited JSON; `stream=json` (or `stream=true`)
+        selects a chunked JSON response with the same body as the
+        non-streamed response. Return `None` for no streaming.
+        """
+        stream = kwargs.pop("stream", None)
+
+        if stream not in [None, "False", "false", 0] and "after" in kwargs:
+            raise ValueError("streaming does not support keyset pagination (after)")
+
+        if stream == STREAM_NDJSON:
+            return STREAM_NDJSON
+        if stream in [STREAM_JSON, "True", "true", 1]:
+            return STREAM_JSON
+        if stream in ["False", "false", 0]:
+            return None
+        if stream is None:
+            if NDJSON_CONTENT_TYPE in self.request.headers.get('Accept', ''):
+                return STREAM_NDJSON
+            return None
+
+        raise ValueError(f"invalid stream format: {stream}")
+
+    async def enforce_indexed_query(self, kwargs: StrDict, limitable: bool = True) -> None:
+        """Check whether the query in `kwargs` can use an index, per `FC_INDEX_ENFORCEMENT`.
+
+        A query that needs a collection scan is logged ("flag"), has its
+        `limit` capped ("limit"), or is rejected with a 400 ("reject").
+        If the query is not `limitable` (ex: a count), "limit" rejects too.
+
+        A query with only the default `locations.archive` filter is
+        always allowed.
+        """
+        mode = self.config['FC_INDEX_ENFORCEMENT']
+        if mode == INDEX_ENFORCEMENT_OFF:
+            return
+
+        query = kwargs.get('query') or {}
+        if is_default_files_query(query):
+            return
+        if await self.db.is_indexed_query(query):
+            return
+
+        logger.warning(f"Query needs a collection scan (FC_INDEX_ENFORCEMENT={mode}): {query}")
+        if mode == INDEX_ENFORCEMENT_LIMIT and limitable:
+            kwargs['limit'] = min(kwargs['limit'], self.config['FC_UNINDEXED_QUERY_LIMIT'])
+        elif mode in [INDEX_ENFORCEMENT_LIMIT, INDEX_ENFORCEMENT_REJECT]:
+            raise HTTPError(400, reason='Query needs a collection scan (no usable index)')
+
+    def check_if_match(self, db_file: types.Metadata) -> Optional[str]:
+        """Check the `If-Match` header against the record's ETag (412 if no match).
+
+        `db_file` must be current -- read from the database, not the
+        file cache (another process's write may have made it stale).
+
+        Return the record's `"meta_modify_date"` to condition the write on,
+        so a concurrent write can't slip in between. Return `None` if
+        there's no condition (no `If-Match` header, or `If-Match: *`).
+        """
+        if_match = self.request.headers.get('If-Match')
+        if if_match is None or if_match.strip() == '*':
+            return None
+
+        etag = get_etag(db_file)
+        if not etag or etag not in [tag.strip() for tag in if_match.split(',')]:
+            raise HTTPError(412, reason=PRECONDITION_FAILED_REASON)
+        return db_file['meta_modify_date']
+
+    def set_etag(self, db_file: types.Metadata) -> None:
+        """Set the `ETag` header for the record, if it has one."""
+        if etag := get_etag(db_file):
+            self.set_header('ETag', etag)
+
+    async def reject_unanchored_regex(self, kwargs: StrDict) -> None:
+        """Reject (400) a query with an unanchored `$regex`, if there are many files.
+
+        Without a literal prefix (ex: `^/data/exp/`), the regex has to be
+        tested against every value, instead of a range of the index.
+        """
+        max_files = self.config['FC_UNANCHORED_REGEX_MAX_FILES']
+        if not max_files:
+            return
+        patterns = utils.find_unanchored_regexes(kwargs.get('query'))
+        if not patterns:
+            return
+        if await self.db.count_files(secondary_ok=True) > max_files:
+            raise HTTPError(
+                400,
+                reason=f"Regex needs an anchored prefix (ex: '^/data/exp/') for this many files: {patterns[0]}"
+            )
+
+    async def find_files_listing(self, kwargs: StrDict) -> StrDict:
+        """Find files for a listing response.
+
+        If `after` was given, use keyset pagination and include the
+        next page's continuation token (`None` after the last page).
+        """
+        if 'after' not in kwargs:
+            return {'files': await self.db.find_files(**kwargs, secondary_ok=True)}
+
+        files, last_id = await self.db.find_files_after(**kwargs, secondary_ok=True)
+        return {
+            'files': files,
+            'next_after': encode_continuation_token(last_id) if last_id else None,
+        }
+
+    async def write_files_stream(self, stream_format: str, links: StrDict, **kwargs: Any) -> None:
+        """Write the files matching `kwargs`, flushing after each cursor batch.
+
+        Only one batch of files is held in memory at a time.
+        """
+        if stream_format == STREAM_NDJSON:
+            self.set_header('Content-Type', NDJSON_CONTENT_TYPE)
+        else:
+            self.set_header('Content-Type', 'application/json; charset=UTF-8')
+            self.write(b'{"_links": ' + self.json_encoder(links) + b', "files": [')
+
+        first = True
+        async for batch in self.db.iter_files(
+            batch_size=self.config['FC_STREAM_BATCH_SIZE'],
+            raw=bool(self.config['FC_RAW_BSON_JSON']),
+            secondary_ok=True,
+            **kwargs
+        ):
+            if stream_format == STREAM_NDJSON:
+                self.write(self.encode_files(batch, b'\n') + b'\n')
+            else:
+                chunk = self.encode_files(batch, b', ')
+                self.write(chunk if first else b', ' + chunk)
+                first = False
+            with metrics.phase(metrics.PHASE_WRITE):
+                await self.flush()
+
+        if stream_format == STREAM_JSON:
+            self.write(']}')
+
 
 # --------------------------------------------------------------------------------------
 
@@ -248,28 +594,44 @@ class FilesHandler(APIHandler):
         """Handle GET requests."""
         try:
             kwargs = urlargparse.parse(self.request.query)
+            stream_format = self.get_stream_format(kwargs)
             argbuilder.build_limit(kwargs, self.config)
             argbuilder.build_start(kwargs)
+            argbuilder.build_after(kwargs)
             argbuilder.build_files_query(kwargs)
             argbuilder.build_keys(kwargs)
         except Exception:  # pylint: disable=W0703
             logging.warning('query parameter error', exc_info=True)
             raise HTTPError(400, reason='Invalid query parameter(s)')
 
-        files = await self.db.find_files(**kwargs)
+        await self.reject_unanchored_regex(kwargs)
+        await self.enforce_indexed_query(kwargs)
+
+        links = {
+            'self': {'href': self.files_url},
+            'parent': {'href': self.base_url},
+        }
+
+        if stream_format:
+            await self.write_files_stream(stream_format, links, **kwargs)
+            return
+
+        # skip decoding & re-encoding each file
+        if self.config['FC_RAW_BSON_JSON'] and 'after' not in kwargs:
+            files = await self.db.find_files(**kwargs, raw=True, secondary_ok=True)
+            self.set_header('Content-Type', 'application/json; charset=UTF-8')
+            self.write(b'{"_links": ' + self.json_encoder(links) + b', "files": [' + self.encode_files(files, b', ') + b']}')
+            return
 
         self.write({
-            '_links': {
-                'self': {'href': self.files_url},
-                'parent': {'href': self.base_url},
-            },
-            'files': files,
+            '_links': links,
+            **(await self.find_files_listing(kwargs)),
         })
 
     @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
     async def post(self) -> None:
         """Handle POST request."""
-        metadata: types.Metadata = json_decode(self.request.body)
+        metadata: types.Metadata = self.decode_json_body()
 
         # allow user-specified uuid, create if not found
         if 'uuid' not in metadata:
@@ -283,19 +645,13 @@ class FilesHandler(APIHandler):
 
         # Deconflict with DB Records
         # NOTE - POST should not conflict with any existing record
-        # NOTE - by uuid, by existing location(s), or by existing file-version
-        if await self.db.get_file({'uuid': metadata['uuid']}):
-            raise HTTPError(
-                409,
-                reason='Conflict with existing file (uuid already exists)',
-                file=os.path.join(self.files_url, metadata['uuid'])
-            )
+        # NOTE - by uuid, by existing file-version, or by existing location(s)
         try:  # check if `metadata` will conflict with an existing metadata record
-            if await deconfliction.FileVersion(metadata).is_in_db(self):
-                return
+            conflict = await deconfliction.find_creation_conflict(self.db, metadata)
         except deconfliction.IndeterminateFileVersionError:
             raise HTTPError(400, reason="File-version cannot be detected from the given 'metadata'")
-        if await deconfliction.any_location_in_db(self, metadata.get("locations")):
+        if conflict:
+            deconfliction.send_conflict_error(self, conflict)
             return
 
         # Create & Write-Back
@@ -314,6 +670,144 @@ class FilesHandler(APIHandler):
 # --------------------------------------------------------------------------------------
 
 
+class FilesBulkHandler(APIHandler):
+    """Initialize a handler for creating many files at once."""
+
+    def initialize(self, **kwargs: Any) -> None:  # type: ignore[override]  # pylint: disable=C0116,W0221
+        """Initialize handler."""
+        super().initialize(**kwargs)
+        # pylint: disable=W0201
+        self.files_url = os.path.join(self.base_url, 'files')
+
+    @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
+    async def post(self) -> None:
+        """Handle POST request.
+
+        Create each file in the `files` list, like `POST /api/files`.
+        Respond with a result (`status`, `reason`, `file`) for each file,
+        using the same status codes as `POST /api/files`.
+        """
+        body = self.decode_json_body()
+        if not isinstance(body, dict) or not isinstance(body.get('files'), list):
+            raise HTTPError(400, reason="POST body requires 'files' list")
+        metadatas: List[types.Metadata] = body['files']
+        if len(metadatas) > self.config['FC_BULK_LIMIT']:
+            raise HTTPError(400, reason=f"Too many files (limit: {self.config['FC_BULK_LIMIT']})")
+
+        results: List[StrDict] = [{} for _ in metadatas]
+
+        # Validate Incoming Data
+        valid = []
+        for i, metadata in enumerate(metadatas):
+            if not isinstance(metadata, dict):
+                results[i] = {'status': 400, 'reason': 'Validation Error: metadata must be an object'}
+                continue
+            # allow user-specified uuid, create if not found
+            if 'uuid' not in metadata:
+                metadata['uuid'] = str(uuid1())
+            error = self.validation.find_forbidden_fields_creation_error(metadata)
+            if not error:
+                error = self.validation.find_metadata_schema_typing_error(metadata)
+            if error:
+                results[i] = {'uuid': metadata['uuid'], 'status': 400, 'reason': error}
+                continue
+            valid.append(i)
+
+        # Deconflict with DB Records (and each other)
+        conflicts = await deconfliction.find_conflicts(
+            self.db,
+            uuids=[metadatas[i]['uuid'] for i in valid],
+            file_versions=[deconfliction.FileVersion(metadatas[i]) for i in valid],
+            locations=[loc for i in valid for loc in metadatas[i]['locations']],
+        )
+        accepted = []
+        for i in valid:
+            if conflict := conflicts.get_creation_conflict(metadatas[i]):
+                results[i] = {
+                    'uuid': metadatas[i]['uuid'],
+                    'status': 409,
+                    'reason': conflict.reason,
+                    'file': os.path.join(self.files_url, conflict.record['uuid']),
+                }
+                continue
+            conflicts.add(metadatas[i])
+            accepted.append(i)
+
+        # Create & Write-Back
+        for i in accepted:
+            set_last_modification_date(metadatas[i])
+        errors = await self.db.create_files([metadatas[i] for i in accepted])
+        for i, write_error in zip(accepted, errors):
+            uuid = metadatas[i]['uuid']
+            if not write_error:
+                results[i] = {'uuid': uuid, 'status': 201, 'file': os.path.join(self.files_url, uuid)}
+            elif write_error['code'] == DUPLICATE_KEY_ERROR_CODE:  # a concurrent write won the race
+                results[i] = {'uuid': uuid, 'status': 409, 'reason': 'Conflict with existing file (uuid or location already exists)'}
+            else:
+                results[i] = {'uuid': uuid, 'status': 500, 'reason': write_error['errmsg']}
+
+        self.write({
+            '_links': {
+                'self': {'href': os.path.join(self.files_url, 'bulk')},
+                'parent': {'href': self.files_url},
+            },
+            'files': results,
+        })
+
+
+# --------------------------------------------------------------------------------------
+
+
+class FilesChangesHandler(APIHandler):
+    """Initialize a handler for listing files in the order they were modified (a changes feed)."""
+
+    def initialize(self, **kwargs: Any) -> None:  # type: ignore[override]  # pylint: disable=C0116,W0221
+        """Initialize handler."""
+        super().initialize(**kwargs)
+        # pylint: disable=W0201
+        self.files_url = os.path.join(self.base_url, 'files')
+
+    @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
+    async def get(self) -> None:
+        """Handle GET request.
+
+        Respond with the files modified after `since`, and `next_since`
+        to resume from. Modifications are only listed once they are
+        `FC_CHANGES_SETTLE_SECONDS` old, so none are skipped. Deleted
+        files are listed as `{uuid, meta_modify_date, "deleted": true}`.
+        """
+        try:
+            kwargs = urlargparse.parse(self.request.query)
+            argbuilder.build_limit(kwargs, self.config)
+            argbuilder.build_since(kwargs)
+            argbuilder.build_keys(kwargs)
+        except Exception:  # pylint: disable=W0703
+            logging.warning('query parameter error', exc_info=True)
+            raise HTTPError(400, reason='Invalid query parameter(s)')
+
+        since = kwargs.pop('since', None)
+        settled = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.config['FC_CHANGES_SETTLE_SECONDS'])
+
+        files = await self.db.find_files_changed(until=str(settled), since=since, **kwargs)
+
+        if files:
+            next_since: Optional[str] = encode_changes_token(files[-1]['meta_modify_date'], files[-1]['uuid'])
+        else:
+            next_since = encode_changes_token(*since) if since else None
+
+        self.write({
+            '_links': {
+                'self': {'href': os.path.join(self.files_url, 'changes')},
+                'parent': {'href': self.files_url},
+            },
+            'files': files,
+            'next_since': next_since,
+        })
+
+
+# --------------------------------------------------------------------------------------
+
+
 class FilesCountHandler(APIHandler):
     """Initialize a handler for counting files."""
 
@@ -329,11 +823,15 @@ class FilesCountHandler(APIHandler):
         try:
             kwargs = urlargparse.parse(self.request.query)
             argbuilder.build_files_query(kwargs)
+            argbuilder.build_exact(kwargs)
         except Exception:  # pylint: disable=W0703
             logging.warning('query parameter error', exc_info=True)
             raise HTTPError(400, reason='Invalid query parameter(s)')
 
-        files = await self.db.count_files(**kwargs)
+        await self.reject_unanchored_regex(kwargs)
+        await self.enforce_indexed_query(kwargs, limitable=False)
+
+        files = await self.db.count_files(**kwargs, secondary_ok=True)
 
         self.write({
             '_links': {
@@ -347,6 +845,292 @@ class FilesCountHandler(APIHandler):
 # --------------------------------------------------------------------------------------
 
 
+class FilesActionsAddLocationsHandler(APIHandler):
+    """Initialize a handler for adding locations to many files at once."""
+
+    def initialize(self, **kwargs: Any) -> None:  # type: ignore[override]  # pylint: disable=C0116,W0221
+        """Initialize handler."""
+        super().initialize(**kwargs)
+        # pylint: disable=W0201
+        self.files_url = os.path.join(self.base_url, 'files')
+
+    @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
+    async def post(self) -> None:
+        """Handle POST request.
+
+        Add the location(s) of each `{uuid, locations}` in the `files`
+        list, like `POST /api/files/{uuid}/locations`. Respond with a
+        result (`status`, `reason`, `file`) for each, using the same
+        status codes.
+        """
+        body = self.decode_json_body()
+        if not isinstance(body, dict) or not isinstance(body.get('files'), list):
+            raise HTTPError(400, reason="POST body requires 'files' list")
+        items: List[StrDict] = body['files']
+        if len(items) > self.config['FC_BULK_LIMIT']:
+            raise HTTPError(400, reason=f"Too many files (limit: {self.config['FC_BULK_LIMIT']})")
+
+        results: List[StrDict] = [{} for _ in items]
+
+        # Validate Incoming Data
+        valid = []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get('uuid'), str):
+                results[i] = {'status': 400, 'reason': "Validation Error: each item requires a 'uuid' string"}
+            elif item.get('locations') is None:
+                results[i] = {'uuid': item['uuid'], 'status': 400, 'reason': "Validation Error: each item requires a 'locations' field"}
+            elif not self.validation.is_valid_location_list(item['locations']):
+                results[i] = {'uuid': item['uuid'], 'status': 400, 'reason': self.validation.INVALID_LOCATIONS_LIST_MESSAGE}
+            else:
+                valid.append(i)
+
+        # Deconflict with DB Records (and each other)
+        conflicts = await deconfliction.find_conflicts(
+            self.db,
+            uuids=[items[i]['uuid'] for i in valid],
+            locations=[loc for i in valid for loc in items[i]['locations']],
+        )
+        accepted = []
+        for i in valid:
+            uuid = items[i]['uuid']
+            if not conflicts.get_uuid_conflict(uuid):
+                results[i] = {'uuid': uuid, 'status': 404, 'reason': 'File uuid not found'}
+                continue
+            if conflict := conflicts.get_modification_conflict(uuid, {'locations': items[i]['locations']}):
+                results[i] = {
+                    'uuid': uuid,
+                    'status': 409,
+                    'reason': conflict.reason,
+                    'file': os.path.join(self.files_url, conflict.record['uuid']),
+                    'location': conflict.location,
+                }
+                continue
+            results[i] = {'uuid': uuid, 'status': 200, 'file': os.path.join(self.files_url, uuid)}
+            # locations already in the record are not added again
+            new_locations = [loc for loc in items[i]['locations'] if not conflicts.get_location_matches(loc)]
+            if new_locations:
+                conflicts.add({'uuid': uuid, 'locations': new_locations})
+                accepted.append((i, new_locations))
+
+        # Write-Back
+        errors = await self.db.add_files_locations([(items[i]['uuid'], locs) for i, locs in accepted])
+        for (i, _), write_error in zip(accepted, errors):
+            uuid = items[i]['uuid']
+            if not write_error:
+                continue
+            if write_error['code'] == DUPLICATE_KEY_ERROR_CODE:  # a concurrent write won the race
+                results[i] = {'uuid': uuid, 'status': 409, 'reason': 'Conflict with existing file (location already exists)'}
+            else:
+                results[i] = {'uuid': uuid, 'status': 500, 'reason': write_error['errmsg']}
+
+        self.write({
+            '_links': {
+                'self': {'href': os.path.join(self.files_url, 'actions', 'add_locations')},
+                'parent': {'href': self.files_url},
+            },
+            'files': results,
+        })
+
+
+# --------------------------------------------------------------------------------------
+
+
+class FilesActionsRemoveLocationsHandler(APIHandler):
+    """Initialize a handler for removing locations from many files at once.
+
+    And potentially the entire records.
+    """
+
+    def initialize(self, **kwargs: Any) -> None:  # type: ignore[override]  # pylint: disable=C0116,W0221
+        """Initialize handler."""
+        super().initialize(**kwargs)
+        # pylint: disable=W0201
+        self.files_url = os.path.join(self.base_url, 'files')
+
+    @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
+    async def post(self) -> None:
+        """Handle POST request.
+
+        Remove each `{site, path}` (optionally, `uuid`) in the
+        `locations` list, like `POST /api/files/{uuid}/actions/remove_location`,
+        deleting the records left without any locations. Respond with
+        a result (`status`, `reason`, `file`, `deleted`) for each.
+        """
+        body = self.decode_json_body()
+        if not isinstance(body, dict) or not isinstance(body.get('locations'), list):
+            raise HTTPError(400, reason="POST body requires 'locations' list")
+        items: List[StrDict] = body['locations']
+        if len(items) > self.config['FC_BULK_LIMIT']:
+            raise HTTPError(400, reason=f"Too many locations (limit: {self.config['FC_BULK_LIMIT']})")
+
+        results: List[StrDict] = [{} for _ in items]
+
+        # Validate Incoming Data
+        valid = []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not all(isinstance(item.get(k), str) for k in ['site', 'path']):
+                results[i] = {'status': 400, 'reason': "Validation Error: each item requires 'site' & 'path' strings"}
+            elif extra := set(item) - {'uuid', 'site', 'path'}:
+                # only the mandatory fields are matched (see SingleFileActionsRemoveLocationHandler)
+                results[i] = {'status': 400, 'reason': f"Validation Error: extra fields detected: {sorted(extra)}"}
+            elif not isinstance(item.get('uuid', ''), str):
+                results[i] = {'status': 400, 'reason': "Validation Error: 'uuid' must be a string"}
+            else:
+                valid.append(i)
+
+        # Find Each Location's File
+        owners = await self.db.find_location_owners(
+            [(items[i].get('uuid'), items[i]['site'], items[i]['path']) for i in valid]
+        )
+        removals = []
+        for i, uuids in zip(valid, owners):
+            site, path = items[i]['site'], items[i]['path']
+            if not uuids:
+                results[i] = {'status': 404, 'reason': f"Location entry not found for site='{site}' & path='{path}'"}
+            elif len(uuids) > 1:
+                results[i] = {'status': 409, 'reason': f"Location entry belongs to {len(uuids)} files; give its 'uuid'"}
+            else:
+                results[i] = {'uuid': uuids[0], 'status': 200, 'file': os.path.join(self.files_url, uuids[0])}
+                removals.append(i)
+
+        # Remove (possibly entire records) & Write-Back
+        errors, deleted = await self.db.pull_files_locations(
+            [(results[i]['uuid'], items[i]['site'], items[i]['path']) for i in removals]
+        )
+        deleted_uuids = set(deleted)
+        for i, write_error in zip(removals, errors):
+            if write_error:
+                results[i] = {'uuid': results[i]['uuid'], 'status': 500, 'reason': write_error['errmsg']}
+            else:
+                results[i]['deleted'] = results[i]['uuid'] in deleted_uuids
+
+        self.write({
+            '_links': {
+                'self': {'href': os.path.join(self.files_url, 'actions', 'remove_locations')},
+                'parent': {'href': self.files_url},
+            },
+            'locations': results,
+        })
+
+
+# --------------------------------------------------------------------------------------
+
+
+class FilesAggregateHandler(APIHandler):
+    """Initialize a handler for aggregate statistics of files (counts, sizes, events)."""
+
+    def initialize(self, **kwargs: Any) -> None:  # type: ignore[override]  # pylint: disable=C0116,W0221
+        """Initialize handler."""
+        super().initialize(**kwargs)
+        # pylint: disable=W0201
+        self.files_url = os.path.join(self.base_url, 'files')
+
+    @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
+    async def get(self) -> None:
+        """Handle GET request."""
+        try:
+            kwargs = urlargparse.parse(self.request.query)
+            argbuilder.build_files_query(kwargs)
+            argbuilder.build_group_by(kwargs)
+        except Exception:  # pylint: disable=W0703
+            logging.warning('query parameter error', exc_info=True)
+            raise HTTPError(400, reason='Invalid query parameter(s)')
+
+        await self.reject_unanchored_regex(kwargs)
+        await self.enforce_indexed_query(kwargs, limitable=False)
+
+        groups = await self.db.aggregate_files(**kwargs, secondary_ok=True)
+
+        self.write({
+            '_links': {
+                'self': {'href': os.path.join(self.files_url, 'aggregate')},
+                'parent': {'href': self.files_url},
+            },
+            'group_by': kwargs.get('group_by'),
+            'groups': groups,
+        })
+
+
+# --------------------------------------------------------------------------------------
+
+
+class StatsHandler(APIHandler):
+    """Initialize a handler for the server's internal statistics."""
+
+    @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
+    async def get(self) -> None:
+        """Handle GET request."""
+        self.write({
+            '_links': {
+                'self': {'href': os.path.join(self.base_url, 'stats')},
+                'parent': {'href': self.base_url},
+            },
+            'count_cache': self.db.count_cache.stats(),
+            'plan_cache': self.db.plan_cache.stats(),
+            'file_cache': self.db.file_cache.stats() if self.db.file_cache else None,
+            'collection_cache': self.db.collection_cache.stats(),
+            'query_parse_cache': urlargparse.parse_cache.stats(),
+            'slow_queries': {
+                'threshold_ms': self.db.slow_query_ms,
+                'recorded': self.db.slow_queries_recorded,
+                'dropped': self.db.slow_queries_dropped,
+            },
+        })
+
+
+# --------------------------------------------------------------------------------------
+
+
+class SlowQueriesHandler(APIHandler):
+    """Initialize a handler for listing slow database operations (see `FC_SLOW_QUERY_MS`)."""
+
+    @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
+    async def get(self) -> None:
+        """Handle GET request."""
+        try:
+            kwargs = urlargparse.parse(self.request.query)
+            limit = int(kwargs.pop('limit', 100))
+            if limit < 1:
+                raise Exception("limit is not positive")
+            operation = kwargs.pop('operation', None)
+            route = kwargs.pop('route', None)
+        except Exception:
+            logging.warning('query parameter error', exc_info=True)
+            raise HTTPError(400, reason='Invalid query parameter(s)')
+
+        slow_queries = await self.db.find_slow_queries(
+            limit=min(limit, self.config['FC_QUERY_FILE_LIST_LIMIT']),
+            operation=operation,
+            route=route,
+        )
+
+        self.write({
+            '_links': {
+                'self': {'href': os.path.join(self.base_url, 'slow_queries')},
+                'parent': {'href': self.base_url},
+            },
+            'slow_queries': slow_queries,
+        })
+
+
+# --------------------------------------------------------------------------------------
+
+
+class MetricsHandler(APIHandler):
+    """Initialize a handler for the server's request metrics, in the Prometheus text format.
+
+    Unauthenticated, for scraping: route it only to internal networks.
+    """
+
+    async def get(self) -> None:
+        """Handle GET request."""
+        self.set_header('Content-Type', metrics.PROMETHEUS_CONTENT_TYPE)
+        self.write(metrics.render())
+
+
+# --------------------------------------------------------------------------------------
+
+
 class SingleFileHandler(APIHandler):
     """Initialize a handler for requesting single files via uuid."""
 
@@ -358,11 +1142,20 @@ class SingleFileHandler(APIHandler):
 
     @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
     async def get(self, uuid: str) -> None:
-        """Handle GET request."""
+        """Handle GET request.
+
+        Respond with `304 Not Modified` if the `If-None-Match` header
+        has the record's current ETag.
+        """
         db_file = await self.db.get_file({'uuid': uuid})
         if not db_file:
             raise HTTPError(404, reason='File uuid not found')
 
+        self.set_etag(db_file)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
         db_file['_links'] = {
             'self': {'href': os.path.join(self.files_url, uuid)},
             'parent': {'href': self.files_url},
@@ -382,13 +1175,15 @@ class SingleFileHandler(APIHandler):
     @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
     async def patch(self, uuid: str) -> None:
         """Handle PATCH request."""
-        metadata: types.Metadata = json_decode(self.request.body)
+        metadata: types.Metadata = self.decode_json_body()
 
         # Find Matching File
-        db_file = await self.db.get_file({'uuid': uuid})
+        db_file = await self.db.get_file({'uuid': uuid}, use_cache=False)
         if not db_file:
             raise HTTPError(404, reason='File uuid not found')
 
+        if_modify_date = self.check_if_match(db_file)
+
         # Validate Incoming Metadata
         if self.validation.has_forbidden_fields_modification(self, metadata, db_file):
             return
@@ -396,13 +1191,10 @@ class SingleFileHandler(APIHandler):
         # Deconflict with DB Records
         # NOTE - PATCH should not conflict with any existing record (excl. uuid's record)
         # NOTE - by existing location(s) or by existing file-version
-        if await deconfliction.any_location_in_db(self, metadata.get("locations"), skip=uuid):
+        conflict = await deconfliction.find_modification_conflict(self.db, uuid, metadata)
+        if conflict:
+            deconfliction.send_conflict_error(self, conflict)
             return
-        try:
-            if await deconfliction.FileVersion(metadata).is_in_db(self, skip=uuid):
-                return
-        except deconfliction.IndeterminateFileVersionError:
-            pass
 
         # Modify & Write Back
         set_last_modification_date(metadata)
@@ -410,7 +1202,11 @@ class SingleFileHandler(APIHandler):
         # we have to validate `db_file` b/c `metadata` may not have all the required fields
         if not self.validation.validate_metadata_schema_typing(self, db_file):
             return
-        db_file = await self.db.update_file(uuid, metadata)
+        try:
+            db_file = await self.db.update_file(uuid, metadata, if_modify_date)
+        except PreconditionFailedError:
+            raise HTTPError(412, reason=PRECONDITION_FAILED_REASON)
+        self.set_etag(db_file)
         db_file['_links'] = {
             'self': {'href': os.path.join(self.files_url, uuid)},
             'parent': {'href': self.files_url},
@@ -420,14 +1216,16 @@ class SingleFileHandler(APIHandler):
     @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
     async def put(self, uuid: str) -> None:
         """Handle PUT request."""
-        metadata: types.Metadata = json_decode(self.request.body)
+        metadata: types.Metadata = self.decode_json_body()
         metadata['uuid'] = uuid
 
         # Find Matching File
-        db_file = await self.db.get_file({'uuid': uuid})
+        db_file = await self.db.get_file({'uuid': uuid}, use_cache=False)
         if not db_file:
             raise HTTPError(404, reason='File uuid not found')
 
+        if_modify_date = self.check_if_match(db_file)
+
         # Validate Incoming Metadata
         if self.validation.has_forbidden_fields_modification(self, metadata, db_file):
             return
@@ -437,18 +1235,19 @@ class SingleFileHandler(APIHandler):
         # Deconflict with DB Records
         # NOTE - PUT should not conflict with any existing record (excl. uuid's record)
         # NOTE - by existing location(s) or by existing file-version
-        if await deconfliction.any_location_in_db(self, metadata.get("locations"), skip=uuid):
+        # NOTE - `validate_metadata_schema_typing()` guarantees there is a file-version
+        conflict = await deconfliction.find_modification_conflict(self.db, uuid, metadata)
+        if conflict:
+            deconfliction.send_conflict_error(self, conflict)
             return
-        try:
-            if await deconfliction.FileVersion(metadata).is_in_db(self, skip=uuid):
-                return
-        except deconfliction.IndeterminateFileVersionError:
-            # `validate_metadata_schema_typing()` should have detected this anyways
-            raise HTTPError(400, reason="File-version cannot be detected from the given 'metadata'")
 
         # Replace & Write Back
         set_last_modification_date(metadata)
-        await self.db.replace_file(metadata.copy())
+        try:
+            await self.db.replace_file(metadata.copy(), if_modify_date)
+        except PreconditionFailedError:
+            raise HTTPError(412, reason=PRECONDITION_FAILED_REASON)
+        self.set_etag(metadata)
         metadata['_links'] = {
             'self': {'href': os.path.join(self.files_url, uuid)},
             'parent': {'href': self.files_url},
@@ -479,12 +1278,14 @@ class SingleFileActionsRemoveLocationHandler(APIHandler):
         and potentially the entire record.
         """
         # try to load the record from the file catalog by UUID
-        db_file = await self.db.get_file({'uuid': uuid})
+        db_file = await self.db.get_file({'uuid': uuid}, use_cache=False)
         if not db_file:
             raise HTTPError(404, reason='File uuid not found')
 
+        if_modify_date = self.check_if_match(db_file)
+
         # decode the JSON provided in the POST body
-        body = json_decode(self.request.body)
+        body = self.decode_json_body()
         try:
             site = body.pop("site")
             path = body.pop("path")
@@ -521,8 +1322,14 @@ class SingleFileActionsRemoveLocationHandler(APIHandler):
             )
         # remove location! -- there are remaining locations after filtering
         elif after:
-            db_file = await self.db.update_file(uuid, {'locations': after})
+            update: types.Metadata = {'locations': after}
+            set_last_modification_date(update)
+            try:
+                db_file = await self.db.update_file(uuid, update, if_modify_date)
+            except PreconditionFailedError:
+                raise HTTPError(412, reason=PRECONDITION_FAILED_REASON)
             # send the record back to the caller
+            self.set_etag(db_file)
             db_file['_links'] = {
                 'self': {'href': os.path.join(self.files_url, uuid)},
                 'parent': {'href': self.files_url},
@@ -531,7 +1338,10 @@ class SingleFileActionsRemoveLocationHandler(APIHandler):
             return
         # delete whole record! -- no remaining locations after filtering
         else:
-            await self.db.delete_file({'uuid': uuid})
+            try:
+                await self.db.delete_file({'uuid': uuid}, if_modify_date)
+            except PreconditionFailedError:
+                raise HTTPError(412, reason=PRECONDITION_FAILED_REASON)
             # send back empty dict to show record was deleted
             self.write({})
             return
@@ -556,12 +1366,14 @@ class SingleFileLocationsHandler(APIHandler):
         Add location(s) to the record identified by the provided UUID.
         """
         # try to load the record from the file catalog by UUID
-        db_file = await self.db.get_file({'uuid': uuid})
+        db_file = await self.db.get_file({'uuid': uuid}, use_cache=False)
         if not db_file:
             raise HTTPError(404, reason='File uuid not found')
 
+        if_modify_date = self.check_if_match(db_file)
+
         # decode the JSON provided in the POST body
-        metadata: types.Metadata = json_decode(self.request.body)
+        metadata: types.Metadata = self.decode_json_body()
         locations = metadata.get("locations")
 
         # if the user didn't provide locations
@@ -572,31 +1384,28 @@ class SingleFileLocationsHandler(APIHandler):
         if not self.validation.is_valid_location_list(locations):
             raise HTTPError(400, reason=self.validation.INVALID_LOCATIONS_LIST_MESSAGE)
 
-        # for each location provided
-        new_locations = []
-        async for loc, check in deconfliction.find_each_location_in_db(self.db, locations):
-            # if we got a file by that location
-            if check:
-                # if the file we got isn't the one we're trying to update
-                if check['uuid'] != uuid:
-                    # then that location belongs to another file (already exists)
-                    deconfliction.send_location_conflict_error(self, loc, check['uuid'])
-                    return
-                # note that if we get the record that we are trying to update
-                # the location will NOT be added to the list of new_locations
-                # which leaves new_locations as a vetted list of addable locations
-            # this is a new location
-            else:
-                # so add it to our list of new locations
-                new_locations.append(loc)
+        # if any location belongs to another file (already exists)
+        conflicts = await deconfliction.find_conflicts(self.db, locations=locations)
+        if conflict := conflicts.get_modification_conflict(uuid, {"locations": locations}):
+            deconfliction.send_conflict_error(self, conflict)
+            return
+
+        # note that if a location is already in the record that we are trying to update
+        # the location will NOT be added to the list of new_locations
+        # which leaves new_locations as a vetted list of addable locations
+        new_locations = [loc for loc in locations if not conflicts.get_location_matches(loc)]
 
         # if there are new locations to append, update the file in the database
         if new_locations:
-            db_file = await self.db.append_distinct_elements_to_file(
-                uuid, {"locations": new_locations}
-            )
+            try:
+                db_file = await self.db.append_distinct_elements_to_file(
+                    uuid, {"locations": new_locations}, if_modify_date
+                )
+            except PreconditionFailedError:
+                raise HTTPError(412, reason=PRECONDITION_FAILED_REASON)
 
         # send the record back to the caller
+        self.set_etag(db_file)
         db_file['_links'] = {
             'self': {'href': os.path.join(self.files_url, uuid)},
             'parent': {'href': self.files_url},
@@ -637,7 +1446,7 @@ class CollectionsHandler(CollectionBaseHandler):
             logging.warning('query parameter error', exc_info=True)
             raise HTTPError(400, reason='Invalid query parameter(s)')
 
-        collections = await self.db.find_collections(**kwargs)
+        collections = await self.db.find_collections(**kwargs, secondary_ok=True)
 
         self.write({
             '_links': {
@@ -650,14 +1459,17 @@ class CollectionsHandler(CollectionBaseHandler):
     @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
     async def post(self) -> None:
         """Handle POST request."""
-        metadata = json_decode(self.request.body)
+        metadata = self.decode_json_body()
 
         try:
             argbuilder.build_files_query(metadata)
-            metadata['query'] = json_encode(metadata['query'])
+            query = metadata['query']
+            metadata['query'] = json_encode(query)
         except Exception:  # pylint: disable=W0703
             logging.warning('query parameter error', exc_info=True)
             raise HTTPError(400, reason='Invalid query parameter(s)')
+        if not isinstance(metadata.get('materialized', False), bool):
+            raise HTTPError(400, reason='materialized must be a boolean')
 
         if 'collection_name' not in metadata:
             raise HTTPError(400, reason='Missing collection_name')
@@ -679,6 +1491,10 @@ class CollectionsHandler(CollectionBaseHandler):
                             file=os.path.join(self.collections_url, ret['uuid']))
         else:
             uuid = await self.db.create_collection(metadata)
+            if metadata.get('materialized'):
+                # start listening for changes before the current files are stored
+                settled = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.config['FC_CHANGES_SETTLE_SECONDS'])
+                await self.db.materialize_collection(uuid, query, since=(str(settled), ''))
             self.set_status(201)
         self.write({
             '_links': {
@@ -698,11 +1514,10 @@ class SingleCollectionHandler(CollectionBaseHandler):
     @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
     async def get(self, uid: str) -> None:
         """Handle GET request."""
-        ret = await self.db.get_collection({'uuid': uid})
-        if not ret:
-            ret = await self.db.get_collection({'collection_name': uid})
+        found = await self.db.lookup_collection(uid)
 
-        if ret:
+        if found:
+            ret = found[0]
             ret['_links'] = {
                 'self': {'href': os.path.join(self.collections_url, uid)},
                 'parent': {'href': self.collections_url},
@@ -722,32 +1537,36 @@ class SingleCollectionFilesHandler(CollectionBaseHandler):
     @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
     async def get(self, uid: str) -> None:
         """Handle GET request."""
-        ret = await self.db.get_collection({'uuid': uid})
-        if not ret:
-            ret = await self.db.get_collection({'collection_name': uid})
+        found = await self.db.lookup_collection(uid)
+        if not found:
+            raise HTTPError(404, reason='Collection not found')
+        ret, query = found
 
-        if ret:
-            try:
-                kwargs = urlargparse.parse(self.request.query)
-                argbuilder.build_limit(kwargs, self.config)
-                argbuilder.build_start(kwargs)
-                kwargs['query'] = json_decode(ret['query'])
-                argbuilder.build_keys(kwargs)
-            except Exception:  # pylint: disable=W0703
-                logging.warning('query parameter error', exc_info=True)
-                raise HTTPError(400, reason='Invalid query parameter(s)')
+        try:
+            kwargs = urlargparse.parse(self.request.query)
+            argbuilder.build_limit(kwargs, self.config)
+            argbuilder.build_start(kwargs)
+            argbuilder.build_after(kwargs)
+            argbuilder.build_keys(kwargs)
+        except Exception:  # pylint: disable=W0703
+            logging.warning('query parameter error', exc_info=True)
+            raise HTTPError(400, reason='Invalid query parameter(s)')
 
-            files = await self.db.find_files(**kwargs)
+        links = {
+            'self': {'href': os.path.join(self.collections_url, uid, 'files')},
+            'parent': {'href': os.path.join(self.collections_url, uid)},
+        }
+        if 'materialized_since' not in ret:
+            kwargs['query'] = query
+            self.write({'_links': links, **(await self.find_files_listing(kwargs))})
+            return
 
-            self.write({
-                '_links': {
-                    'self': {'href': os.path.join(self.collections_url, uid, 'files')},
-                    'parent': {'href': os.path.join(self.collections_url, uid)},
-                },
-                'files': files,
-            })
-        else:
-            raise HTTPError(404, reason='Collection not found')
+        # materialized -- list the stored files, instead of running the query
+        files, last_id = await self.db.find_collection_files(ret['uuid'], **kwargs, secondary_ok=True)
+        listing: StrDict = {'files': files}
+        if 'after' in kwargs:
+            listing['next_after'] = encode_continuation_token(last_id) if last_id else None
+        self.write({'_links': links, **listing})
 
 
 # --------------------------------------------------------------------------------------
@@ -759,11 +1578,10 @@ class SingleCollectionSnapshotsHandler(CollectionBaseHandler):
     @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
     async def get(self, uid: str) -> None:
         """Handle GET request."""
-        ret = await self.db.get_collection({'uuid': uid})
-        if not ret:
-            ret = await self.db.get_collection({'collection_name': uid})
-        if not ret:
+        found = await self.db.lookup_collection(uid)
+        if not found:
             raise HTTPError(400, reason='Cannot find collection')
+        ret = found[0]
 
         try:
             kwargs = urlargparse.parse(self.request.query)
@@ -775,7 +1593,7 @@ class SingleCollectionSnapshotsHandler(CollectionBaseHandler):
             logging.warning('query parameter error', exc_info=True)
             raise HTTPError(400, reason='Invalid query parameter(s)')
 
-        snapshots = await self.db.find_snapshots(**kwargs)
+        snapshots = await self.db.find_snapshots(**kwargs, secondary_ok=True)
 
         self.write({
             '_links': {
@@ -788,19 +1606,13 @@ class SingleCollectionSnapshotsHandler(CollectionBaseHandler):
     @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
     async def post(self, uid: str) -> None:
         """Handle POST request."""
-        ret = await self.db.get_collection({'uuid': uid})
-        if not ret:
-            ret = await self.db.get_collection({'collection_name': uid})
-        if not ret:
+        found = await self.db.lookup_collection(uid)
+        if not found:
             raise HTTPError(400, reason='Cannot find collection')
-
-        files_kwargs = {
-            'query': json_decode(ret['query']),
-            'keys': ['uuid'],
-        }
+        ret, query = found
 
         if self.request.body:
-            metadata = json_decode(self.request.body)
+            metadata = self.decode_json_body()
         else:
             metadata = {}
 
@@ -821,19 +1633,26 @@ class SingleCollectionSnapshotsHandler(CollectionBaseHandler):
         if snapshot:
             # snapshot uuid already exists
             raise HTTPError(409, reason='Conflict with existing snapshot (uuid already exists)')
+
+        # create the snapshot, with the collection's current files
+        links = {
+            'self': {'href': os.path.join(self.collections_url, uid, 'snapshots')},
+            'parent': {'href': os.path.join(self.collections_url, uid)},
+        }
+        if await self.db.count_files(query, exact=False) > self.config['FC_SNAPSHOT_SYNC_LIMIT']:
+            # too big to wait for -- poll the status
+            uuid = await self.db.start_snapshot(metadata, query)
+            self.set_status(202)
+            self.write({
+                '_links': links,
+                'snapshot': os.path.join(self.snapshots_url, uuid),
+                'status': os.path.join(self.snapshots_url, uuid, 'status'),
+            })
         else:
-            # find the list of files
-            files = await self.db.find_files(**files_kwargs)
-            metadata['files'] = [row['uuid'] for row in files]
-            logger.warning('creating snapshot %s with files %r', metadata['uuid'], metadata['files'])
-            # create the snapshot
-            uuid = await self.db.create_snapshot(metadata)
+            uuid = await self.db.create_snapshot(metadata, query=query)
             self.set_status(201)
             self.write({
-                '_links': {
-                    'self': {'href': os.path.join(self.collections_url, uid, 'snapshots')},
-                    'parent': {'href': os.path.join(self.collections_url, uid)},
-                },
+                '_links': links,
                 'snapshot': os.path.join(self.snapshots_url, uuid),
             })
 
@@ -873,26 +1692,75 @@ class SingleSnapshotFilesHandler(CollectionBaseHandler):
         """Handle GET request."""
         ret = await self.db.get_snapshot({'uuid': uid})
 
-        if ret:
-            try:
-                kwargs = urlargparse.parse(self.request.query)
-                argbuilder.build_limit(kwargs, self.config)
-                argbuilder.build_start(kwargs)
+        if not ret:
+            raise HTTPError(404, reason='Snapshot not found')
+
+        if ret.get('status', SNAPSHOT_COMPLETE) != SNAPSHOT_COMPLETE:
+            raise HTTPError(409, reason=f"Snapshot is not complete (status: {ret['status']})")
+
+        # snapshots from before the membership collection hold their uuids
+        legacy = 'files' in ret
+
+        try:
+            kwargs = urlargparse.parse(self.request.query)
+            argbuilder.build_limit(kwargs, self.config)
+            argbuilder.build_start(kwargs)
+            if legacy:
+                argbuilder.build_after(kwargs)
                 kwargs['query'] = {'uuid': {'$in': ret['files']}}
-                logger.warning('getting files: %r', kwargs['query'])
-                argbuilder.build_keys(kwargs)
-            except Exception:  # pylint: disable=W0703
-                logging.warning('query parameter error', exc_info=True)
-                raise HTTPError(400, reason='Invalid query parameter(s)')
+            else:
+                argbuilder.build_snapshot_after(kwargs)
+            argbuilder.build_keys(kwargs)
+        except Exception:  # pylint: disable=W0703
+            logging.warning('query parameter error', exc_info=True)
+            raise HTTPError(400, reason='Invalid query parameter(s)')
 
-            files = await self.db.find_files(**kwargs)
+        links = {
+            'self': {'href': os.path.join(self.snapshots_url, uid, 'files')},
+            'parent': {'href': os.path.join(self.snapshots_url, uid)},
+        }
+        if legacy:
+            self.write({'_links': links, **(await self.find_files_listing(kwargs))})
+            return
 
-            self.write({
-                '_links': {
-                    'self': {'href': os.path.join(self.snapshots_url, uid, 'files')},
-                    'parent': {'href': os.path.join(self.snapshots_url, uid)},
-                },
-                'files': files,
-            })
-        else:
+        after = kwargs.pop('after', None)
+        if after is not None:
+            kwargs['start'] = after
+        files, read = await self.db.find_snapshot_files(uid, **kwargs, secondary_ok=True)
+
+        listing: StrDict = {'files': files}
+        if after is not None:
+            more = kwargs['limit'] and read == kwargs['limit']
+            listing['next_after'] = encode_snapshot_token(kwargs['start'] + read) if more else None
+        self.write({'_links': links, **listing})
+
+
+# --------------------------------------------------------------------------------------
+
+
+class SingleSnapshotStatusHandler(CollectionBaseHandler):
+    """Initialize a handler for requesting the status of a single snapshot's creation."""
+
+    @fc_auth(prefix=FC_AUTH_PREFIX, roles=FC_AUTH_ROLES)
+    async def get(self, uid: str) -> None:
+        """Handle GET request."""
+        ret = await self.db.get_snapshot({'uuid': uid})
+        if not ret:
             raise HTTPError(404, reason='Snapshot not found')
+
+        status = ret.get('status', SNAPSHOT_COMPLETE)
+        if status == SNAPSHOT_COMPLETE:
+            files_stored = ret.get('file_count', len(ret.get('files', [])))
+        else:
+            files_stored = await self.db.count_snapshot_files(uid)
+
+        self.write({
+            '_links': {
+                'self': {'href': os.path.join(self.snapshots_url, uid, 'status')},
+                'parent': {'href': os.path.join(self.snapshots_url, uid)},
+            },
+            'uuid': uid,
+            'status': status,
+            'files_stored': files_stored,
+            **{k: ret[k] for k in ['creation_date', 'completion_date', 'file_count', 'error'] if k in ret},
+        })
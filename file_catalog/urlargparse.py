@@ -4,10 +4,13 @@
 
 from copy import deepcopy
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union, cast
 
 from tornado.escape import url_escape, url_unescape
 
+from . import metrics
+from .cache import StatsCache, lru_cache
+
 
 class SubscriptType(Enum):
     END = 1    # =
@@ -18,6 +21,12 @@ class SubscriptType(Enum):
 Args = Dict[str, Any]
 Subscript = Tuple[SubscriptType, str, SubscriptType]  # this-type, this-key, next-type
 
+PARSE_CACHE_SIZE = 1024
+PARSE_CACHE_MAX_LENGTH = 4096  # longer query strings are not cached
+
+# parsed results by query string (callers get copies, since they modify theirs)
+parse_cache: "StatsCache[Args]" = lru_cache(PARSE_CACHE_SIZE)
+
 
 def decode_value(value: str) -> Optional[Union[float, int, str]]:
     """Convert a value the way jQuery does."""
@@ -111,19 +120,48 @@ def encode_value(obj: Any) -> str:
     return str(obj)
 
 
+def copy_args(obj: Any) -> Any:
+    """Copy parsed arguments (nested dicts & lists of immutable values)."""
+    if isinstance(obj, dict):
+        return {k: copy_args(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [copy_args(v) for v in obj]
+    return obj
+
+
+@metrics.timed(metrics.PHASE_PARSE)
 def parse(data: str) -> Args:
-    """Parse query arguments encoded in jQuery.param() format."""
+    """Parse query arguments encoded in jQuery.param() format.
+
+    Recently-parsed query strings are served from `parse_cache`.
+    """
+    cacheable = len(data) <= PARSE_CACHE_MAX_LENGTH
+    if cacheable and (cached := parse_cache.get(data)) is not None:
+        return cast(Args, copy_args(cached))
+
     ret: Args = {}
     for part in data.split("&"):
         if part:
-            ret = parse_arg(ret, part)
+            parse_arg_into(ret, part)
+
+    if cacheable:
+        parse_cache.set(data, copy_args(ret))
     return ret
 
 
 def parse_arg(orig_args: Args, data: str) -> Args:
-    """Parse a query argument encoded in jQuery.param() format."""
-    key, value = url_unescape(data).split("=", 1)
+    """Parse a query argument encoded in jQuery.param() format.
+
+    Return a copy of `orig_args` updated with the argument.
+    """
     work_args = deepcopy(orig_args)
+    parse_arg_into(work_args, data)
+    return work_args
+
+
+def parse_arg_into(work_args: Args, data: str) -> None:
+    """Parse a query argument encoded in jQuery.param() format into `work_args` (in place)."""
+    key, value = url_unescape(data).split("=", 1)
     # DEBUG: print(f"key:'{key}' value:'{value}'")
     obj: Any = work_args
     key_path = parse_key(key)
@@ -139,8 +177,6 @@ def parse_arg(orig_args: Args, data: str) -> Args:
         else:
             raise Exception("path object is neither Dict or List")
         # DEBUG: print(f"\t\twork_args: {work_args}")
-    # return the updated arguments dictionary to the caller
-    return work_args
 
 
 def parse_key(key: str) -> List[Subscript]:
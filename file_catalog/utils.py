@@ -2,7 +2,7 @@
 
 
 # NOTE: no relative imports please, let's keep this generic
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 
 class DottedKeyError(KeyError):
@@ -28,3 +28,81 @@ def get_val_in_dict_dotted(field: str, dicto: Dict[str, Any]) -> Any:
 
     except (KeyError, TypeError) as e:
         raise DottedKeyError() from e
+
+
+def query_shape(query: Any) -> Any:
+    """Return the "shape" of a MongoDB query: its fields & operators, without the values.
+
+    Queries with the same shape get the same query plan. Ex:
+        `{"run.run_number": {"$in": [1, 2, 3]}}` -> `{"run.run_number": {"$in": ["?"]}}`
+    """
+    if isinstance(query, dict):
+        return {k: query_shape(v) for k, v in sorted(query.items())}
+    if isinstance(query, list):
+        shapes: List[Any] = []
+        for shape in (query_shape(v) for v in query):
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+REGEX_METACHARACTERS = r"\^$.|?*+()[]{}"
+
+
+def escape_regex(string: str) -> str:
+    """Escape `string` so that it is matched literally in a (PCRE) regex."""
+    return "".join("\\" + c if c in REGEX_METACHARACTERS else c for c in string)
+
+
+def regex_literal_prefix(pattern: str, options: str = "") -> str:
+    """Return the literal prefix that every match of `pattern` starts with.
+
+    Return "" if `pattern` is not anchored at the start (with "^"). This
+    prefix is what MongoDB uses to bound an index scan for a `$regex`.
+    """
+    if not isinstance(pattern, str) or not pattern.startswith("^"):
+        return ""
+    # case-insensitive, multi-line ("^" matches after any newline), extended
+    if any(o in options for o in "imx"):
+        return ""
+    # a top-level alternation may not be anchored
+    if "|" in pattern:
+        return ""
+
+    prefix: List[str] = []
+    chars = iter(pattern[1:])
+    for c in chars:
+        if c == "\\":
+            c = next(chars, "")
+            if not c or c.isalnum():  # ex: "\d"
+                break
+            prefix.append(c)
+        elif c in "*?{":  # the preceding char is optional
+            if prefix:
+                prefix.pop()
+            break
+        elif c in "^$.[()+":
+            break
+        else:
+            prefix.append(c)
+    return "".join(prefix)
+
+
+def find_unanchored_regexes(query: Any) -> List[str]:
+    """Return each `$regex` pattern in the MongoDB query without a literal prefix.
+
+    A prefix of only "/" (the root directory) doesn't count.
+    """
+    found: List[str] = []
+    if isinstance(query, dict):
+        if "$regex" in query:
+            prefix = regex_literal_prefix(query["$regex"], query.get("$options", ""))
+            if not prefix.strip("/"):
+                found.append(str(query["$regex"]))
+        for val in query.values():
+            found.extend(find_unanchored_regexes(val))
+    elif isinstance(query, list):
+        for val in query:
+            found.extend(find_unanchored_regexes(val))
+    return found
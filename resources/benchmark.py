@@ -1,143 +1,302 @@
 #!/usr/bin/env python3
+"""Load-test a running File Catalog with concurrent, mixed requests.
 
-# fmt:off
+Workers send requests concurrently, optionally at a fixed total rate,
+picking each operation from a weighted mix:
+
+    create           POST /api/files
+    get              GET /api/files/{uuid}
+    list             GET /api/files (filtered to this run's files)
+    count            GET /api/files/count (filtered to this run's files)
+    add_location     POST /api/files/{uuid}/locations
+    remove_location  POST /api/files/{uuid}/actions/remove_location
+    patch            PATCH /api/files/{uuid}
+
+Every file is created under a per-run logical_name prefix (and deleted
+afterwards, unless --keep). The report (JSON) has the latency
+percentiles, throughput & error rate of each operation, so runs can be
+compared across releases.
 
-from __future__ import print_function
+With --rate, requests are scheduled open-loop, and latency is measured
+from each request's scheduled time (so a slow server can't hide its
+queueing delay by slowing the load down).
+"""
+
+# fmt:off
 
 import argparse
+import asyncio
 import hashlib
-from json import dumps as json_encode
-from json import loads as json_decode
+import json
 import random
-import string
+import sys
 import time
-from typing import Any, List
+import uuid
+from collections import Counter
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+
+OPERATIONS = ["create", "get", "list", "count", "add_location", "remove_location", "patch"]
+DEFAULT_MIX = "create=2,get=6,list=1,count=1,add_location=1,remove_location=1,patch=1"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse a workload mix like "create=2,get=6" into weights by operation."""
+    weights: Dict[str, float] = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"unknown operation: {name} (choose from {OPERATIONS})")
+        weights[name] = float(weight) if weight else 1.0
+        if weights[name] < 0:
+            raise ValueError(f"negative weight for {name}")
+    if not any(weights.values()):
+        raise ValueError("the mix has no (positive) weights")
+    return weights
+
 
-import requests
+def percentile(values: List[float], pct: float) -> float:
+    """Get the `pct`-th percentile (nearest rank) of sorted `values`."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * pct // 100))  # ceil
+    return values[int(rank) - 1]
 
 
-class FileCatalogLowLevel(object):
-    """
-    Low level file catalog interface.  Use like a dict::
+class Stats:
+    """Latencies & statuses, by operation."""
 
-        fc = FileCatalog('http://file_catalog.com')
-        fc['my_new_file'] = {'locations':['/this/is/a/path']}
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Counter[str]] = {}
 
-    Args:
-        url (str): url of the file catalog server
-        timeout (float): (optional) seconds to wait for a query to finish
-    """
-    def __init__(self, url: str, timeout: int = 60):
-        self.url: str = url
+    def record(self, operation: str, seconds: float, status: str) -> None:
+        """Record one request."""
+        self.latencies.setdefault(operation, []).append(seconds)
+        self.statuses.setdefault(operation, Counter())[status] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """Summarize the requests made in `elapsed` seconds."""
+        operations = {}
+        total = errors = 0
+        for operation in sorted(self.latencies):
+            latencies = sorted(self.latencies[operation])
+            statuses = self.statuses[operation]
+            failed = sum(n for status, n in statuses.items() if not status.startswith("2"))
+            total += len(latencies)
+            errors += failed
+            operations[operation] = {
+                "requests": len(latencies),
+                "errors": failed,
+                "error_rate": failed / len(latencies),
+                "throughput_rps": len(latencies) / elapsed,
+                "latency_ms": {
+                    "p50": percentile(latencies, 50) * 1000,
+                    "p95": percentile(latencies, 95) * 1000,
+                    "p99": percentile(latencies, 99) * 1000,
+                    "max": latencies[-1] * 1000,
+                    "mean": sum(latencies) / len(latencies) * 1000,
+                },
+                "statuses": dict(sorted(statuses.items())),
+            }
+        return {
+            "elapsed_s": elapsed,
+            "requests": total,
+            "errors": errors,
+            "error_rate": errors / total if total else 0.0,
+            "throughput_rps": total / elapsed,
+            "operations": operations,
+        }
+
+
+class RateLimiter:
+    """Hand out evenly spaced start times, for a total rate (0 for no limit)."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate if rate else 0.0
+        self.next_time = time.monotonic()
+
+    async def wait(self) -> float:
+        """Wait for the next slot, and return its (scheduled) time."""
+        if not self.interval:
+            return time.monotonic()
+        slot = self.next_time
+        self.next_time += self.interval
+        if (delay := slot - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        return slot
+
+
+class Workload:
+    """Make the requests of each operation, against this run's files."""
+
+    def __init__(self, address: str, token: Optional[str], timeout: float) -> None:
+        self.address = address.rstrip("/")
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
         self.timeout = timeout
-        self.session: Any = requests.Session()
-
-    def _getfileurl(self, uid: str) -> str:
-        for _ in range(5):
-            try:
-                r = self.session.get(self.url + '/api/files',
-                                     params={'query': json_encode({'uid': uid})},
-                                     timeout=self.timeout)
-            except requests.exceptions.Timeout:
-                continue
-            if r.status_code == 429:
-                continue
-            r.raise_for_status()
-            files: List[str] = json_decode(r.text)['files']
-            break
-        else:
-            raise Exception('server is too busy')
-        if len(files) != 1:
-            raise KeyError()
-        return self.url + files[0]
-
-    def __getitem__(self, uid: str) -> Any:
-        url = self._getfileurl(uid)
-        for _ in range(5):
-            try:
-                r = self.session.get(url, timeout=self.timeout)
-            except requests.exceptions.Timeout:
-                continue
-            if r.status_code == 429:
-                continue
-            r.raise_for_status()
-            return json_decode(r.text)
-        raise Exception('server is too busy')
-
-    def __setitem__(self, uid: str, value: Any) -> None:
-        meta = value.copy()
-        meta['uid'] = uid
-        data = json_encode(meta)
+        self.client = AsyncHTTPClient()
+        self.prefix = f"/benchmark/{uuid.uuid4()}/"
+        self.counter = 0
+        self.uuids: List[str] = []
+        # locations added by add_location, which remove_location can remove (by file uuid)
+        self.extra_locations: List[Tuple[str, Dict[str, str]]] = []
+
+    async def request(self, method: str, path: str, body: Any = None, params: Optional[Dict[str, Any]] = None) -> Tuple[str, Any]:
+        """Make one request; return the status (or error name) & the decoded response."""
+        url = self.address + path
+        if params:
+            url += "?" + urlencode(params)
+        request = HTTPRequest(
+            url, method=method, headers=self.headers, request_timeout=self.timeout,
+            body=None if body is None else json.dumps(body),
+            allow_nonstandard_methods=True,
+        )
         try:
-            url = self._getfileurl(uid)
-        except KeyError:
-            # does not exist
-            method = self.session.post
-            url = self.url + '/api/files'
-        else:
-            # exists, so update
-            method = self.session.put
-        for _ in range(5):
-            try:
-                r = method(url, data=data,
-                           timeout=self.timeout)
-            except requests.exceptions.Timeout:
-                continue
-            if r.status_code == 429:
-                continue
-            r.raise_for_status()
-            return
-        raise Exception('server is too busy')
-
-    def __delitem__(self, uid: str) -> None:
-        url = self._getfileurl(uid)
-        for _ in range(5):
-            try:
-                r = self.session.delete(url, timeout=self.timeout)
-            except requests.exceptions.Timeout:
-                continue
-            if r.status_code == 429:
-                continue
-            r.raise_for_status()
-            return
-        raise Exception('server is too busy')
-
-
-def sha512sum(data: bytearray) -> str:
-    m = hashlib.sha512()
-    m.update(data)
-    return m.hexdigest()
-
-
-def make_data() -> bytearray:
-    data = ''.join(random.choice(string.ascii_letters) for _ in range(random.randint(1, 1000)))
-    return bytearray(data, 'utf-8')
-
-
-def benchmark(address: str, num: int) -> float:
-    start = time.time()
-    fc = FileCatalogLowLevel(address)
-    for i in range(num):
-        data = make_data()
-        cksm = sha512sum(data)
-        fc[str(i)] = {'data': data, 'checksum': cksm, 'locations': [make_data()]}
-    for i in range(num):
-        _ = fc[str(i)]
-    for i in range(num):
-        del fc[str(i)]
-    return time.time() - start
+            response = await self.client.fetch(request)
+        except HTTPClientError as e:
+            return str(e.code), None
+        except Exception as e:  # pylint: disable=W0703
+            return type(e).__name__, None
+        return str(response.code), json.loads(response.body) if response.body else None
+
+    def next_name(self) -> str:
+        """Get a new logical_name, under this run's prefix."""
+        self.counter += 1
+        return f"{self.prefix}{self.counter:09d}.dat"
+
+    async def create(self) -> str:
+        name = self.next_name()
+        status, data = await self.request("POST", "/api/files", {
+            "logical_name": name,
+            "checksum": {"sha512": hashlib.sha512(name.encode()).hexdigest()},
+            "file_size": random.randint(1, 10**9),
+            "locations": [{"site": "BENCHMARK", "path": name}],
+            "data_type": "real",
+            "processing_level": "L2",
+        })
+        if data and "file" in data:
+            self.uuids.append(data["file"].split("/")[-1])
+        return status
+
+    async def get(self) -> str:
+        return (await self.request("GET", f"/api/files/{random.choice(self.uuids)}"))[0]
+
+    def _query(self) -> Dict[str, Any]:
+        query = {"logical_name": {"$regex": f"^{self.prefix}"}, "file_size": {"$gte": random.randint(1, 10**9)}}
+        return {"query": json.dumps(query)}
+
+    async def list(self) -> str:
+        return (await self.request("GET", "/api/files", params={**self._query(), "limit": 100, "keys": "uuid|file_size"}))[0]
+
+    async def count(self) -> str:
+        return (await self.request("GET", "/api/files/count", params=self._query()))[0]
+
+    async def add_location(self) -> str:
+        file_uuid = random.choice(self.uuids)
+        location = {"site": "BENCHMARK-ARCHIVE", "path": f"{self.next_name()}.zip"}
+        status, _ = await self.request("POST", f"/api/files/{file_uuid}/locations", {"locations": [location]})
+        if status == "200":
+            self.extra_locations.append((file_uuid, location))
+        return status
+
+    async def remove_location(self) -> str:
+        # take it, so no other worker removes it too
+        file_uuid, location = self.extra_locations.pop(random.randrange(len(self.extra_locations)))
+        return (await self.request("POST", f"/api/files/{file_uuid}/actions/remove_location", location))[0]
+
+    async def patch(self) -> str:
+        body = {"file_size": random.randint(1, 10**9)}
+        return (await self.request("PATCH", f"/api/files/{random.choice(self.uuids)}", body))[0]
+
+    async def cleanup(self) -> int:
+        """Delete this run's files; return how many couldn't be."""
+        failed = 0
+        for file_uuid in self.uuids:
+            status, _ = await self.request("DELETE", f"/api/files/{file_uuid}")
+            failed += status not in ["200", "204", "404"]
+        return failed
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the load test; return the report."""
+    weights = parse_mix(args.mix)
+    AsyncHTTPClient.configure(None, max_clients=args.concurrency)
+    workload = Workload(args.address, args.token, args.timeout)
+    operations: Dict[str, Callable[[], Coroutine[Any, Any, str]]] = {
+        name: getattr(workload, name) for name in OPERATIONS
+    }
+    names = list(weights)
+
+    # every operation but create needs files to work on
+    for _ in range(args.seed_files):
+        await workload.create()
+    if not workload.uuids and set(names) - {"create"}:
+        raise SystemExit("could not create any seed files -- is the server up (and --token right)?")
+
+    stats = Stats()
+    limiter = RateLimiter(args.rate)
+    deadline = time.monotonic() + args.duration
+    remaining = [args.requests or sys.maxsize]
+
+    async def worker() -> None:
+        while time.monotonic() < deadline and remaining[0] > 0:
+            remaining[0] -= 1
+            name = random.choices(names, weights=[weights[n] for n in names])[0]
+            start = await limiter.wait()
+            # check after waiting (other workers may have taken them all meanwhile),
+            # with no await before remove_location takes one
+            if name == "remove_location" and not workload.extra_locations:
+                name = "add_location"  # nothing to remove yet
+            status = await operations[name]()
+            stats.record(name, time.monotonic() - start, status)
+
+    start = time.monotonic()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    report = stats.report(time.monotonic() - start)
+
+    report["config"] = {
+        "address": args.address,
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "duration": args.duration,
+        "requests": args.requests,
+        "mix": weights,
+        "seed_files": args.seed_files,
+    }
+    if not args.keep:
+        report["cleanup_failures"] = await workload.cleanup()
+    return report
 
 
 def main() -> None:
-    parser = argparse.ArgumentParser(description='benchmark file_catalog server')
-    parser.add_argument('--address', type=str, default='http://localhost:8888', help='server address')
-    parser.add_argument('-n', '--num', type=int, default=10000, help='number of test values')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", default="http://localhost:8888", help="server address")
+    parser.add_argument("--token", default=None, help="bearer token (if the server requires auth)")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="concurrent requests (workers)")
+    parser.add_argument("-r", "--rate", type=float, default=0, help="total requests per second (0 for as fast as possible)")
+    parser.add_argument("-d", "--duration", type=float, default=60, help="seconds to run for")
+    parser.add_argument("-n", "--requests", type=int, default=0, help="stop after this many requests (0 for no limit)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed-files", type=int, default=100, help="files to create before the run")
+    parser.add_argument("--timeout", type=float, default=60, help="request timeout (seconds)")
+    parser.add_argument("--keep", action="store_true", help="don't delete the files created by the run")
+    parser.add_argument("-o", "--output", default=None, help="write the JSON report here (default: stdout)")
     args = parser.parse_args()
 
-    print('starting benchmark')
-    t = benchmark(args.address, args.num)
-    print('finished. took', t, 'seconds')
+    report = asyncio.run(run(args))
+
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
 
 
-if __name__ == '__main__':
+if __name__ == "__main__":
     main()
@@ -0,0 +1,85 @@
+"""All-keys file documents, for the benchmarks in `resources/`."""
+
+# fmt:off
+
+import hashlib
+from typing import List
+
+from file_catalog.schema import types
+
+NUM_LOCATIONS = 12
+
+
+def make_file(i: int) -> types.Metadata:
+    """Make an all-keys simulation file document, with `NUM_LOCATIONS` locations."""
+    name = f"/data/sim/IceCube/2020/generated/neutrino-generator/22645/0000000-0000999/NuGen_22645_{i:06d}.i3.zst"
+    locations: List[types.LocationEntry] = [{"site": "WIPAC", "path": name}]
+    for j in range(NUM_LOCATIONS - 1):
+        locations.append({"site": f"SITE-{j}", "path": f"/archive/{j}/{i}.zip:{name}", "archive": True})
+    return {
+        "uuid": f"00000000-0000-0000-0000-{i:012d}",
+        "logical_name": name,
+        "checksum": {"sha512": hashlib.sha512(name.encode()).hexdigest()},
+        "file_size": 123456789 + i,
+        "locations": locations,
+        "create_date": "2020-01-01T00:00:00",
+        "meta_modify_date": "2020-01-02 00:00:00.000000",
+        "data_type": "simulation",
+        "processing_level": "L2",
+        "content_status": "good",
+        "software": [{"name": "icetray", "version": "V01-00-00", "date": "2020-01-01"}],
+        "run": {
+            "run_number": 22645,
+            "subrun_number": 0,
+            "part_number": i,
+            "start_datetime": "2020-01-01T00:00:00",
+            "end_datetime": "2020-01-01T08:00:00",
+            "first_event": 1000 * i,
+            "last_event": 1000 * i + 999,
+            "event_count": 1000,
+        },
+        "offline_processing_metadata": {
+            "dataset_id": 22645,
+            "season": 2020,
+            "season_name": "IC86-2020",
+            "L2_gcd_file": "/data/sim/sim-new/downloads/GCD/GeoCalibDetectorStatus_2020.Run134142.Pass2_V0.i3.gz",
+            "L2_snapshot_id": 3,
+            "L2_production_version": 1,
+            "working_group": "simulation",
+            "validation_validated": True,
+            "livetime": 28800.0,
+            "first_event": {"event_id": 1000 * i, "datetime": "2020-01-01T00:00:00"},
+            "last_event": {"event_id": 1000 * i + 999, "datetime": "2020-01-01T08:00:00"},
+        },
+        "iceprod": {
+            "dataset": 22645,
+            "dataset_id": "a1b2c3d4e5f6",
+            "job": i,
+            "job_id": f"job{i:08d}",
+            "task": "generate",
+            "task_id": f"task{i:08d}",
+            "config": "https://iceprod2.icecube.wisc.edu/config?dataset_id=a1b2c3d4e5f6",
+        },
+        "simulation": {
+            "generator": "nugen",
+            "composition": "NuMu",
+            "geometry": "IC86",
+            "GCD_file": "/data/sim/sim-new/downloads/GCD/GeoCalibDetectorStatus_2020.Run134142.Pass2_V0.i3.gz",
+            "bulk_ice_model": "spice_3.2.1",
+            "hole_ice_model": "flasher_p1=0.3_p2=0.0",
+            "photon_propagator": "CLSim",
+            "DOMefficiency": 1.0,
+            "atmosphere": 13,
+            "n_events": 1000,
+            "oversampling": 1,
+            "DOMoversize": 1,
+            "energy_min": 100.0,
+            "energy_max": 1e8,
+            "power_law_index": "E^-1.5",
+            "cylinder_length": 1900.0,
+            "cylinder_radius": 950.0,
+            "zenith_min": 0.0,
+            "zenith_max": 3.1415,
+            "hadronic_interaction": "Sibyll-2.3c",
+        },
+    }
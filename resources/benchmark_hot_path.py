@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Microbenchmark the Python-side cost of a request (no database).
+
+Runs the request hot path -- query-string parsing, the argument
+builders, metadata validation, dotted-key lookups, `FileVersion`, and
+JSON encoding of a `/api/files` response -- on realistic all-keys
+`Metadata` documents (run, offline_processing_metadata, iceprod,
+simulation & a dozen locations).
+
+For each benchmark, reports operations per second (the best of
+--repeat runs) and the peak memory allocated by one operation
+(tracemalloc). Save a baseline with --save; compare against one with
+--compare, which exits non-zero if any benchmark is slower (or
+allocates more) than the baseline by more than --threshold.
+Baselines are machine-specific, so compare runs from the same machine.
+"""
+
+# fmt:off
+
+import argparse
+import copy
+import json
+import platform
+import sys
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from file_catalog import argbuilder, encoding, urlargparse, utils
+from file_catalog.config import Config
+from file_catalog.deconfliction import FileVersion
+from file_catalog.schema.validation import Validation
+
+from benchmark_files import make_file  # (from resources/)
+
+
+# a typical GET /api/files query string
+QUERY_STRING = urlargparse.encode({
+    "query": json.dumps({
+        "iceprod.dataset": 22645,
+        "run.run_number": {"$gte": 22645},
+        "locations.site": {"$in": ["WIPAC", "NERSC"]},
+    }),
+    "directory": "/data/sim/IceCube/2020/generated/neutrino-generator/22645",
+    "processing_level": "L2",
+    "keys": "uuid|logical_name|checksum|file_size|locations",
+    "limit": 1000,
+    "start": 0,
+})
+
+DOTTED_FIELDS = [
+    "checksum.sha512",
+    "run.run_number",
+    "offline_processing_metadata.first_event.event_id",
+    "iceprod.dataset",
+    "simulation.generator",
+]
+
+
+class _Handler:
+    """Stand-in for the `apihandler` the validators report errors to."""
+
+    files_url = "/api/files"
+
+    def send_error(self, *args: Any, **kwargs: Any) -> None:
+        raise RuntimeError(f"validation failed: {kwargs}")
+
+
+def make_benchmarks(num_files: int) -> Dict[str, Callable[[], Any]]:
+    """Get the benchmarks, by name."""
+    config = Config()
+    validation = Validation(config)
+    handler = _Handler()
+    metadata = make_file(0)
+    new_metadata = make_file(0)  # as POSTed
+    del new_metadata["meta_modify_date"]
+    links = {"self": {"href": "/api/files"}, "parent": {"href": "/api"}}
+    files = [make_file(i) for i in range(num_files)]
+
+    def parse_uncached() -> Any:
+        urlargparse.parse_cache.clear()
+        return urlargparse.parse(QUERY_STRING)
+
+    def build_files_args() -> Any:
+        kwargs = urlargparse.parse(QUERY_STRING)
+        argbuilder.build_limit(kwargs, config)
+        argbuilder.build_start(kwargs)
+        argbuilder.build_after(kwargs)
+        argbuilder.build_files_query(kwargs)
+        argbuilder.build_keys(kwargs)
+        return kwargs
+
+    def validate() -> Any:
+        if validation.has_forbidden_fields_creation(handler, new_metadata):
+            return False
+        return validation.validate_metadata_schema_typing(handler, new_metadata)
+
+    def get_dotted() -> Any:
+        return [utils.get_val_in_dict_dotted(f, metadata) for f in DOTTED_FIELDS]  # type: ignore[arg-type]
+
+    benchmarks: Dict[str, Callable[[], Any]] = {
+        "urlargparse.parse (uncached)": parse_uncached,
+        "urlargparse.parse (cached)": lambda: urlargparse.parse(QUERY_STRING),
+        "argbuilder (GET /api/files)": build_files_args,
+        "validation (POST /api/files)": validate,
+        f"get_val_in_dict_dotted (x{len(DOTTED_FIELDS)})": get_dotted,
+        "FileVersion": lambda: FileVersion(metadata),
+        "deepcopy (one file)": lambda: copy.deepcopy(metadata),
+        f"json (stdlib, {num_files} files)": lambda: encoding.stdlib_encode({"_links": links, "files": files}),
+    }
+    if encoding.HAS_ORJSON:
+        benchmarks[f"orjson ({num_files} files)"] = lambda: encoding.orjson_encode({"_links": links, "files": files})
+
+    # fail fast, rather than benchmark an error path
+    for func in benchmarks.values():
+        func()
+    return benchmarks
+
+
+def measure(func: Callable[[], Any], number: int, repeat: int) -> Tuple[float, int]:
+    """Get the ops/sec (best of `repeat`) & the peak bytes allocated by one call of `func`."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return 1 / best, peak - base
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Get a message for each benchmark that regressed past `threshold` (a fraction)."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{name}: {result['ops_per_sec']:.0f} ops/s < baseline {base['ops_per_sec']:.0f} ops/s"
+            )
+        if result["peak_bytes"] > base["peak_bytes"] * (1 + threshold):
+            regressions.append(
+                f"{name}: {result['peak_bytes']:.0f} B peak > baseline {base['peak_bytes']:.0f} B peak"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=1000, help="operations per measurement")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="measurements per benchmark (the best is reported)")
+    parser.add_argument("-f", "--num-files", type=int, default=100, help="files per encoded response")
+    parser.add_argument("-k", "--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--save", default=None, help="save the results as a baseline (JSON) here")
+    parser.add_argument("--compare", default=None, help="compare the results with this baseline (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fraction slower (or more allocated) than the baseline that fails --compare")
+    args = parser.parse_args()
+    if args.threshold < 0:
+        parser.error("--threshold must not be negative")
+
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'benchmark':<36} {'ops/sec':>12} {'us/op':>10} {'peak KiB/op':>12}")
+    for name, func in make_benchmarks(args.num_files).items():
+        if args.filter not in name:
+            continue
+        # encoding a whole response is much slower than the rest
+        number = max(1, args.number // args.num_files) if "files)" in name else args.number
+        ops, peak = measure(func, number, args.repeat)
+        results[name] = {"ops_per_sec": ops, "peak_bytes": peak}
+        print(f"{name:<36} {ops:>12.0f} {1e6 / ops:>10.1f} {peak / 1024:>12.1f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "results": results}, f, indent=2)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if regressions := compare(results, baseline, args.threshold):
+            print(f"\n{len(regressions)} regression(s) past {args.threshold:.0%}:")
+            for msg in regressions:
+                print(f"  {msg}")
+            sys.exit(1)
+        print(f"\nno regressions past {args.threshold:.0%} (vs {args.compare})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Benchmark encoding a `/api/files` response of all-keys documents.
+
+Compares encode time & peak memory (tracemalloc) of each JSON encoder
+in `file_catalog.encoding`, from decoded dicts, and (if python-bsonjs
+is installed) straight from raw BSON.
+"""
+
+# fmt:off
+
+import argparse
+import time
+import tracemalloc
+from typing import Callable, List
+
+import bson  # type: ignore[import]
+from bson.raw_bson import RawBSONDocument  # type: ignore[import]
+
+from file_catalog import encoding
+
+from benchmark_files import make_file  # (from resources/)
+
+
+def measure(name: str, func: Callable[[], bytes], repeat: int) -> None:
+    """Print the best encode time & the peak memory of `func`."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<24} {best * 1000:9.1f} ms {peak / 2**20:9.1f} MiB peak {len(out) / 2**20:9.1f} MiB out")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--num-files", type=int, default=10000, help="files per response")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per encoder (the best time is reported)")
+    args = parser.parse_args()
+
+    links = {"self": {"href": "/api/files"}, "parent": {"href": "/api"}}
+    files = [make_file(i) for i in range(args.num_files)]
+    raw_files: List[RawBSONDocument] = [RawBSONDocument(bson.encode(f)) for f in files]
+
+    print(f"{args.num_files} all-keys files:")
+    measure("json (stdlib)", lambda: encoding.stdlib_encode({"_links": links, "files": files}), args.repeat)
+    if encoding.HAS_ORJSON:
+        measure("orjson", lambda: encoding.orjson_encode({"_links": links, "files": files}), args.repeat)
+    else:
+        print("orjson                   (not installed)")
+
+    # what the database driver does, before any encoder can run
+    measure("(BSON -> dicts)", lambda: b"" if [bson.decode(f.raw) for f in raw_files] else b"", args.repeat)
+    if encoding.has_raw_bson_encoder():
+        measure("raw BSON (bsonjs)", lambda: encoding.encode_raw_bson_list(raw_files), args.repeat)
+    else:
+        print("raw BSON (bsonjs)        (not installed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Microbenchmark `file_catalog.urlargparse.parse()`.
+
+Compares the single-pass parser (uncached & cached) with folding
+`parse_arg()`, which copies everything parsed so far for each argument
+(quadratic), on query strings with more & more arguments.
+"""
+
+# fmt:off
+
+import argparse
+import timeit
+from typing import Any, Dict
+
+from file_catalog import urlargparse
+
+
+def make_query(n: int) -> str:
+    """Make a query string with `n` keys[] & nested query[...] arguments."""
+    args: Dict[str, Any] = {
+        "keys": [f"field_{i}" for i in range(n // 2)],
+        "query": {f"run.run_number_{i}": {"$in": [i, i + 1]} for i in range(n // 4)},
+        "limit": 10000,
+    }
+    return urlargparse.encode(args)
+
+
+def parse_quadratic(data: str) -> Dict[str, Any]:
+    """Parse like before: copy everything parsed so far, for each argument."""
+    ret: Dict[str, Any] = {}
+    for part in data.split("&"):
+        if part:
+            ret = urlargparse.parse_arg(ret, part)
+    return ret
+
+
+def parse_uncached(data: str) -> Dict[str, Any]:
+    urlargparse.parse_cache.clear()
+    return urlargparse.parse(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=100, help="parses per measurement")
+    args = parser.parse_args()
+
+    print(f"{'args':>6} {'chars':>7} {'quadratic':>12} {'single-pass':>12} {'cached':>12}  (per parse)")
+    for n in [4, 16, 64, 256, 1024]:
+        data = make_query(n)
+        assert parse_quadratic(data) == parse_uncached(data) == urlargparse.parse(data)
+
+        times = [
+            min(timeit.repeat(lambda: func(data), number=args.number, repeat=3)) / args.number
+            for func in [parse_quadratic, parse_uncached, urlargparse.parse]
+        ]
+        cached = "-" if len(data) > urlargparse.PARSE_CACHE_MAX_LENGTH else f"{times[2] * 1e6:9.1f} us"
+        print(f"{len(data.split('&')):>6} {len(data):>7} {times[0] * 1e6:9.1f} us {times[1] * 1e6:9.1f} us {cached:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -215,16 +215,18 @@ def bad_fc_metadata(rc: RestClient) -> Generator[FCMetadata, None, None]:
                 raise RuntimeError(f"Wrong path! (doesn't start with /mnt/lfs) {fcm}")
 
     # infinite querying (break when no more files)
-    page_seek = 0  # start at the first page b/c will delete from front of queue
+    # keyset pagination: entries left behind (not deleted) are skipped over,
+    # and each page costs the same no matter how deep into the queue
+    after = ""  # start at the first page
     for num in count(1):
         logging.info(
             f"Looking for more bad-rooted paths "
-            f"(Query #{num}, limit={PAGE_SIZE}, page_seek={page_seek})..."
+            f"(Query #{num}, limit={PAGE_SIZE}, after={after})..."
         )
 
         # Query
         body = {
-            "start": page_seek * PAGE_SIZE,
+            "after": after,
             "limit": PAGE_SIZE,
             "all-keys": True,
             "query": json.dumps({"logical_name": {"$regex": r"^\/mnt\/lfs.*"}}),
@@ -240,20 +242,21 @@ def bad_fc_metadata(rc: RestClient) -> Generator[FCMetadata, None, None]:
             logging.warning(f"Asked for {PAGE_SIZE} files, received {len(fc_metas)}")
         check_paths(fc_metas)
         if set(f["uuid"] for f in fc_metas) == previous_uuids:
-            logging.warning(
-                "This page is the same as the previous page "
-                "(that portion of the queue was not cleared)."
-            )
-            page_seek += 1
-            logging.warning(f"Now seeking to page #{page_seek}...")
-            continue
+            msg = "This page is the same as the previous page."
+            logging.critical(msg)
+            raise RuntimeError(msg)
         previous_uuids = set(f["uuid"] for f in fc_metas)
 
         # yield
         for fcm in fc_metas:
-            logging.info(f"Query #{num} (Page-Seek {page_seek})")
+            logging.info(f"Query #{num} (After {after})")
             yield fcm
 
+        if not resp["next_after"]:
+            logging.warning("No more files.")
+            return
+        after = resp["next_after"]
+
 
 DEDUP = "dedup-errors.paths"
 UNMATCHED = "unmatched-missing.paths"
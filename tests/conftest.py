@@ -80,13 +80,9 @@ def port() -> int:
     return cast(int, ephemeral_port)
 
 
-@pytest_asyncio.fixture
-async def rest(monkeypatch: MonkeyPatch, mongo: Mongo, port: int) -> AsyncGenerator[RestClient, None]:
-    """Start a File Catalog instance and get a RestClient configured to talk to it."""
-    # setup_function
-    monkeypatch.delenv("OTEL_EXPORTER_OTLP_ENDPOINT", raising=False)
-    monkeypatch.setenv("WIPACTEL_EXPORT_STDOUT", "FALSE")
-
+@pytest.fixture
+def config(port: int) -> Config:
+    """Get the File Catalog's config (a test may modify it while the server is up)."""
     config: Config = Config()
     config.update({
         "AUTH_AUDIENCE": "file-catalog-testing",
@@ -96,6 +92,15 @@ async def rest(monkeypatch: MonkeyPatch, mongo: Mongo, port: int) -> AsyncGenera
         "FC_PUBLIC_URL": f"http://localhost:{port}",
         "FC_QUERY_FILE_LIST_LIMIT": 10000,
     })
+    return config
+
+
+@pytest_asyncio.fixture
+async def rest(monkeypatch: MonkeyPatch, mongo: Mongo, port: int, config: Config) -> AsyncGenerator[RestClient, None]:
+    """Start a File Catalog instance and get a RestClient configured to talk to it."""
+    # setup_function
+    monkeypatch.delenv("OTEL_EXPORTER_OTLP_ENDPOINT", raising=False)
+    monkeypatch.setenv("WIPACTEL_EXPORT_STDOUT", "FALSE")
 
     rest_server = create(config=config,
                          port=port,
@@ -5,7 +5,11 @@
 import pprint
 from typing import Any, Dict, List, Optional, TypedDict, Union
 
+import pytest
+from bson.objectid import ObjectId  # type: ignore[import]
+
 from file_catalog import argbuilder
+from file_catalog.mongo import encode_changes_token, encode_continuation_token, encode_snapshot_token
 
 
 def test_00_path_args() -> None:
@@ -41,25 +45,25 @@ def test_00_path_args() -> None:
         {
             "kwargs_in": {"directory": "/path/to/dir/"},
             "kwargs_after": {},
-            "ret": {"$regex": r"^/path/to/dir/(.*/)?.*$"},
+            "ret": {"$regex": r"^/path/to/dir/"},
         },
         # only "directory" w/o trailing '/'
         {
             "kwargs_in": {"directory": "/path/to/dir"},
             "kwargs_after": {},
-            "ret": {"$regex": r"^/path/to/dir/(.*/)?.*$"},
+            "ret": {"$regex": r"^/path/to/dir/"},
         },
         # only "filename"
         {
             "kwargs_in": {"filename": "my-file"},
             "kwargs_after": {},
-            "ret": {"$regex": r"^.*/(.*/)?my-file$"},
+            "ret": {"$regex": r"/my-file$"},
         },
         # only "filename" w/ a sub-directory
         {
             "kwargs_in": {"filename": "/sub-dir/my-file"},
             "kwargs_after": {},
-            "ret": {"$regex": r"^.*/(.*/)?sub-dir/my-file$"},
+            "ret": {"$regex": r"/sub-dir/my-file$"},
         },
         # "directory" & "filename"
         {
@@ -67,6 +71,24 @@ def test_00_path_args() -> None:
             "kwargs_after": {},
             "ret": {"$regex": r"^/path/to/dir/(.*/)?my-file$"},
         },
+        # empty "directory" & "filename" (ex: `?directory=&filename=`) don't filter
+        {
+            "kwargs_in": {"directory": None, "filename": ""},
+            "kwargs_after": {},
+            "ret": None,
+        },
+        # ...nor override another name argument
+        {
+            "kwargs_in": {"logical_name": "LOGICAL_NAME", "directory": None},
+            "kwargs_after": {},
+            "ret": "LOGICAL_NAME",
+        },
+        # regex metacharacters are matched literally
+        {
+            "kwargs_in": {"directory": "/path/to/dir.v2 (copy)/", "filename": "my-file.tar.gz"},
+            "kwargs_after": {},
+            "ret": {"$regex": r"^/path/to/dir\.v2 \(copy\)/(.*/)?my-file\.tar\.gz$"},
+        },
     ]
 
     for ktd in kwargs_test_dicts:
@@ -77,7 +99,7 @@ def test_00_path_args() -> None:
 
     # test multiple path-args (each loop pops the arg of the highest precedence)
     args = [  # list in decreasing order of precedence
-        ("directory", "/path/to/dir/", {"$regex": r"^/path/to/dir/(.*/)?.*$"}),
+        ("directory", "/path/to/dir/", {"$regex": r"^/path/to/dir/"}),
         # not testing "filename" b/c that is equal to "directory" in precedence
         ("logical_name", "LOGICAL_NAME", "LOGICAL_NAME"),
         ("logical-name-regex", r"this.*is?a.path", {"$regex": r"this.*is?a.path"}),
@@ -88,3 +110,82 @@ def test_00_path_args() -> None:
         assert argbuilder._resolve_name_args(kwargs) == args[0][2]
         assert not kwargs  # everything was popped
         args.pop(0)
+
+
+def test_10_after() -> None:
+    """Test build_after."""
+    kwargs: Dict[str, Any] = {}
+    argbuilder.build_after(kwargs)
+    assert not kwargs
+
+    kwargs = {"after": None}  # first page
+    argbuilder.build_after(kwargs)
+    assert kwargs == {"after": None}
+
+    oid = ObjectId()
+    kwargs = {"after": encode_continuation_token(oid)}
+    argbuilder.build_after(kwargs)
+    assert kwargs == {"after": oid}
+
+    bads: List[Dict[str, Any]] = [{"after": "garbage"}, {"after": None, "start": 5}]
+    for bad in bads:
+        with pytest.raises(Exception):
+            argbuilder.build_after(bad)
+
+
+def test_11_exact() -> None:
+    """Test build_exact."""
+    for val, exact in [(None, True), ("true", True), ("False", False), ("false", False), (0, False)]:
+        kwargs: Dict[str, Any] = {"exact": val} if val is not None else {}
+        argbuilder.build_exact(kwargs)
+        assert kwargs == {"exact": exact}
+
+
+def test_12_group_by() -> None:
+    """Test build_group_by."""
+    for val in [None, "processing_level", "locations.site"]:
+        kwargs: Dict[str, Any] = {"group_by": val}
+        argbuilder.build_group_by(kwargs)
+        assert kwargs == {"group_by": val}
+
+    argbuilder.build_group_by({})
+
+    for val in ["uuid", "locations", "checksum.sha512"]:
+        with pytest.raises(Exception):
+            argbuilder.build_group_by({"group_by": val})
+
+
+def test_13_since() -> None:
+    """Test build_since."""
+    kwargs: Dict[str, Any] = {"since": encode_changes_token("2022-01-01 00:00:00.000001", "abc")}
+    argbuilder.build_since(kwargs)
+    assert kwargs == {"since": ("2022-01-01 00:00:00.000001", "abc")}
+
+    kwargs = {"since": None}
+    argbuilder.build_since(kwargs)
+    assert kwargs == {"since": None}
+
+    for val in ["abc", 1234, encode_continuation_token(ObjectId())]:
+        with pytest.raises(ValueError):
+            argbuilder.build_since({"since": val})
+
+
+def test_14_snapshot_after() -> None:
+    """Test build_snapshot_after."""
+    kwargs: Dict[str, Any] = {"after": encode_snapshot_token(1234)}
+    argbuilder.build_snapshot_after(kwargs)
+    assert kwargs == {"after": 1234}
+
+    kwargs = {"after": None}
+    argbuilder.build_snapshot_after(kwargs)
+    assert kwargs == {"after": 0}
+
+    kwargs = {}
+    argbuilder.build_snapshot_after(kwargs)
+    assert kwargs == {}
+
+    with pytest.raises(Exception):
+        argbuilder.build_snapshot_after({"after": None, "start": 0})
+    for val in ["abc", 1234, encode_continuation_token(ObjectId())]:
+        with pytest.raises(ValueError):
+            argbuilder.build_snapshot_after({"after": val})
@@ -0,0 +1,46 @@
+# test_cache.py
+"""Unit tests for file_catalog/cache.py."""
+
+from file_catalog.cache import bytes_ttl_cache, ttl_cache
+
+
+def test_00_always_succeed() -> None:
+    """Succeed with flying colors."""
+    assert True
+
+
+def test_10_ttl_cache() -> None:
+    """Test hit/miss statistics."""
+    cache = ttl_cache(maxsize=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    cache.pop("a")
+    cache.pop("a")  # already evicted
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 1 / 3
+    assert stats["size"] == 0
+
+
+def test_20_bytes_ttl_cache() -> None:
+    """Test that the cache is bounded by the total length of its values."""
+    cache = bytes_ttl_cache(maxbytes=10, ttl=60)
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    assert cache.stats()["currsize"] == 8
+
+    # least-recently used is evicted
+    assert cache.get("a")
+    cache.set("c", b"1234")
+    assert cache.get("a")
+    assert cache.get("b") is None
+    assert cache.get("c")
+
+    # too large for the cache -- not cached (and the stale value is evicted)
+    cache.set("a", b"12345678901")
+    assert cache.get("a") is None
+    assert cache.stats()["maxsize"] == 10
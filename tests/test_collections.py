@@ -4,11 +4,15 @@
 # fmt:off
 # pylint: skip-file
 
-from typing import Any, Dict
+import asyncio
+from typing import Any, Dict, List
 
 import pytest
 from rest_tools.client import RestClient
 
+from file_catalog.config import Config
+from file_catalog.mongo import Mongo
+
 from .test_files import hex
 
 
@@ -211,3 +215,125 @@ async def test_71_snapshot_find(rest: RestClient) -> None:
     assert len(data['files']) == 1
     assert data['files'][0]['uuid'] == file_uid
     assert data['files'][0]['checksum'] == metadata['checksum']
+
+
+@pytest.mark.asyncio
+async def test_72_snapshot_files_paging(rest: RestClient, mongo: Mongo) -> None:
+    """Test GET /api/snapshots/{uuid}/files pagination, and legacy snapshots."""
+    data = await rest.request('POST', '/api/collections', {'collection_name': 'blah', 'owner': 'foo'})
+    uid = data['collection'].split('/')[-1]
+
+    file_uids = []
+    for i in range(5):
+        data = await rest.request('POST', '/api/files', {
+            'logical_name': f'/data/{i}',
+            'checksum': {'sha512': hex(f'foo {i}')},
+            'file_size': i,
+            'locations': [{'site': 'test', 'path': f'/data/{i}'}],
+        })
+        file_uids.append(data['file'].split('/')[-1])
+
+    data = await rest.request('POST', '/api/collections/{}/snapshots'.format(uid))
+    snap_uid = data['snapshot'].split('/')[-1]
+
+    data = await rest.request('GET', '/api/snapshots/{}'.format(snap_uid))
+    assert data['file_count'] == 5
+    assert 'files' not in data
+
+    # start & limit
+    data = await rest.request('GET', '/api/snapshots/{}/files'.format(snap_uid), {'start': 1, 'limit': 2})
+    assert len(data['files']) == 2
+    assert 'next_after' not in data
+
+    # after
+    seen: List[str] = []
+    after = None
+    while True:
+        data = await rest.request('GET', '/api/snapshots/{}/files'.format(snap_uid), {'limit': 2, 'after': after})
+        seen.extend(f['uuid'] for f in data['files'])
+        after = data['next_after']
+        if not after:
+            break
+    assert sorted(seen) == sorted(file_uids)
+
+    with pytest.raises(Exception):
+        await rest.request('GET', '/api/snapshots/{}/files'.format(snap_uid), {'after': 'garbage'})
+
+    # a snapshot from before the membership collection
+    await mongo.create_snapshot({'uuid': 'legacy', 'owner': 'foo', 'collection_id': uid, 'files': file_uids[:2]})
+    data = await rest.request('GET', '/api/snapshots/legacy/files')
+    assert sorted(f['uuid'] for f in data['files']) == sorted(file_uids[:2])
+
+
+@pytest.mark.asyncio
+async def test_73_snapshot_background(rest: RestClient, config: Config) -> None:
+    """Test POST /api/collections/{uuid}/snapshots for a snapshot created in the background."""
+    config['FC_SNAPSHOT_SYNC_LIMIT'] = 0
+
+    data = await rest.request('POST', '/api/collections', {'collection_name': 'blah', 'owner': 'foo'})
+    uid = data['collection'].split('/')[-1]
+    data = await rest.request('POST', '/api/files', {
+        'logical_name': '/data/0',
+        'checksum': {'sha512': hex('foo')},
+        'file_size': 1,
+        'locations': [{'site': 'test', 'path': '/data/0'}],
+    })
+    file_uid = data['file'].split('/')[-1]
+
+    data = await rest.request('POST', '/api/collections/{}/snapshots'.format(uid))
+    snap_uid = data['snapshot'].split('/')[-1]
+    assert data['status'].endswith('/api/snapshots/{}/status'.format(snap_uid))
+
+    for _ in range(50):
+        status = await rest.request('GET', '/api/snapshots/{}/status'.format(snap_uid))
+        if status['status'] != 'pending':
+            break
+        await asyncio.sleep(0.1)
+    assert status['status'] == 'complete'
+    assert status['file_count'] == status['files_stored'] == 1
+    assert 'completion_date' in status
+
+    data = await rest.request('GET', '/api/snapshots/{}/files'.format(snap_uid))
+    assert [f['uuid'] for f in data['files']] == [file_uid]
+
+    with pytest.raises(Exception):
+        await rest.request('GET', '/api/snapshots/missing/status')
+
+
+@pytest.mark.asyncio
+async def test_80_materialized_collection(rest: RestClient, mongo: Mongo, config: Config) -> None:
+    """Test /api/collections/{uuid}/files for a materialized collection."""
+    config['FC_CHANGES_SETTLE_SECONDS'] = 0
+
+    file_uids = []
+    for i in range(3):
+        data = await rest.request('POST', '/api/files', {
+            'logical_name': f'/data/{i}',
+            'checksum': {'sha512': hex(f'foo {i}')},
+            'file_size': i,
+            'locations': [{'site': 'test', 'path': f'/data/{i}'}],
+        })
+        file_uids.append(data['file'].split('/')[-1])
+
+    with pytest.raises(Exception):
+        await rest.request('POST', '/api/collections', {'collection_name': 'blah', 'owner': 'foo', 'materialized': 'yes'})
+
+    data = await rest.request('POST', '/api/collections', {
+        'collection_name': 'blah',
+        'owner': 'foo',
+        'query': {'file_size': {'$gte': 1}},
+        'materialized': True,
+    })
+    uid = data['collection'].split('/')[-1]
+
+    data = await rest.request('GET', '/api/collections/blah/files', {'limit': 1, 'after': None})
+    assert len(data['files']) == 1
+    data2 = await rest.request('GET', '/api/collections/blah/files', {'limit': 1, 'after': data['next_after']})
+    assert sorted(f['uuid'] for f in data['files'] + data2['files']) == sorted(file_uids[1:])
+
+    # changes are listed after a refresh
+    await rest.request('PATCH', '/api/files/' + file_uids[0], {'file_size': 10})
+    await rest.request('PATCH', '/api/files/' + file_uids[1], {'file_size': 0})
+    await mongo.refresh_materialized_collections()
+    data = await rest.request('GET', '/api/collections/{}/files'.format(uid), {'keys': 'uuid|file_size'})
+    assert sorted((f['uuid'], f['file_size']) for f in data['files']) == sorted([(file_uids[0], 10), (file_uids[2], 2)])
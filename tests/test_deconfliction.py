@@ -0,0 +1,77 @@
+# test_deconfliction.py
+"""Unit tests for file_catalog/deconfliction.py."""
+
+from typing import List
+
+from file_catalog.deconfliction import ConflictIndex, UUID_CONFLICT_REASON
+from file_catalog.schema import types
+
+
+def _record(uuid: str, name: str, sha: str, paths: List[str]) -> types.Metadata:
+    return {
+        "uuid": uuid,
+        "logical_name": name,
+        "checksum": {"sha512": sha},
+        "locations": [{"site": "WIPAC", "path": p} for p in paths],
+    }
+
+
+def test_00_always_succeed() -> None:
+    """Succeed with flying colors."""
+    assert True
+
+
+def test_10_creation_conflict() -> None:
+    """Test ConflictIndex.get_creation_conflict()."""
+    index = ConflictIndex()
+    existing = _record("u1", "/foo", "aaa", ["/foo", "/bar"])
+    index.add(existing)
+
+    # no conflict
+    assert not index.get_creation_conflict(_record("u2", "/foo", "bbb", ["/baz"]))
+
+    # uuid -> file-version -> location
+    conflict = index.get_creation_conflict(_record("u1", "/foo", "aaa", ["/foo"]))
+    assert conflict and conflict.reason == UUID_CONFLICT_REASON
+    assert conflict.record == existing
+
+    conflict = index.get_creation_conflict(_record("u2", "/foo", "aaa", ["/foo"]))
+    assert conflict and conflict.reason.startswith("Conflict with existing file-version")
+    assert not conflict.location
+
+    conflict = index.get_creation_conflict(_record("u2", "/baz", "aaa", ["/baz", "/bar"]))
+    assert conflict
+    assert conflict.reason == "Conflict with existing file (location already exists `/bar`)"
+    assert conflict.location == {"site": "WIPAC", "path": "/bar"}
+
+
+def test_20_modification_conflict() -> None:
+    """Test ConflictIndex.get_modification_conflict()."""
+    index = ConflictIndex()
+    index.add(_record("u1", "/foo", "aaa", ["/foo"]))
+    index.add(_record("u2", "/bar", "bbb", ["/bar"]))
+
+    # own record is not a conflict
+    assert not index.get_modification_conflict("u1", _record("u1", "/foo", "aaa", ["/foo", "/new"]))
+    assert not index.get_modification_conflict("u1", {"locations": [{"site": "WIPAC", "path": "/foo"}]})
+
+    # location before file-version
+    conflict = index.get_modification_conflict("u1", _record("u1", "/bar", "bbb", ["/bar"]))
+    assert conflict and conflict.location == {"site": "WIPAC", "path": "/bar"}
+    assert conflict.record["uuid"] == "u2"
+
+    conflict = index.get_modification_conflict("u1", _record("u1", "/bar", "bbb", ["/foo"]))
+    assert conflict and conflict.reason.startswith("Conflict with existing file-version")
+
+
+def test_30_location_matches() -> None:
+    """Test that location matching works like `$elemMatch`."""
+    index = ConflictIndex()
+    record = _record("u1", "/foo", "aaa", [])
+    record["locations"] = [{"site": "WIPAC", "path": "/foo", "archive": True}]
+    index.add(record)
+
+    assert index.get_location_matches({"site": "WIPAC", "path": "/foo"}) == [record]
+    assert index.get_location_matches({"site": "WIPAC", "path": "/foo", "archive": True}) == [record]
+    assert not index.get_location_matches({"site": "WIPAC", "path": "/foo", "archive": False})
+    assert not index.get_location_matches({"site": "NERSC", "path": "/foo"})
@@ -0,0 +1,63 @@
+# test_encoding.py
+"""Unit tests for file_catalog/encoding.py."""
+
+import json
+
+import pytest
+from tornado.escape import json_encode
+
+from file_catalog import encoding
+
+
+def test_00_always_succeed() -> None:
+    """Succeed with flying colors."""
+    assert True
+
+
+def test_10_get_encoder() -> None:
+    """Test get_encoder."""
+    assert encoding.get_encoder("json") is encoding.stdlib_encode
+    if encoding.HAS_ORJSON:
+        assert encoding.get_encoder("orjson") is encoding.orjson_encode
+        assert encoding.get_encoder("auto") is encoding.orjson_encode
+    else:
+        with pytest.raises(ValueError):
+            encoding.get_encoder("orjson")
+        assert encoding.get_encoder("auto") is encoding.stdlib_encode
+
+    with pytest.raises(ValueError):
+        encoding.get_encoder("ujson")
+
+
+def test_20_encoders() -> None:
+    """Test that every encoder encodes the same JSON."""
+    value = {
+        "uuid": "abc",
+        "logical_name": "/data/</script>/ünïcode",
+        "file_size": 2**40,
+        "locations": [{"site": "WIPAC", "path": "/a", "archive": True}],
+        "run": {"first_event": None, "event_count": 1.5},
+    }
+    assert encoding.stdlib_encode(value) == json_encode(value).encode("utf-8")
+
+    if encoding.HAS_ORJSON:
+        assert json.loads(encoding.orjson_encode(value)) == value
+        # beyond orjson (64 bits) -- falls back to the stdlib
+        assert json.loads(encoding.orjson_encode({"n": 2**70})) == {"n": 2**70}
+
+
+@pytest.mark.skipif(not encoding.HAS_ORJSON, reason="orjson is not installed")
+def test_21_orjson_differences() -> None:
+    """Test where orjson_encode matches the stdlib encoder, & where it differs."""
+    # "</" is escaped, like tornado's json_encode
+    assert encoding.orjson_encode({"a": "</script>"}) == b'{"a":"<\\/script>"}'
+    assert encoding.stdlib_encode({"a": "</script>"}) == b'{"a": "<\\/script>"}'
+
+    # non-ASCII is UTF-8, not escaped
+    assert encoding.orjson_encode("ü") == '"ü"'.encode("utf-8")
+    assert encoding.stdlib_encode("ü") == b'"\\u00fc"'
+
+    # non-finite floats are null, not (invalid JSON) NaN & Infinity
+    value = [float("nan"), float("inf"), float("-inf")]
+    assert encoding.orjson_encode(value) == b"[null,null,null]"
+    assert encoding.stdlib_encode(value) == b"[NaN, Infinity, -Infinity]"
@@ -10,11 +10,16 @@ import itertools
 import logging
 from typing import Any, cast, Dict, List, Optional, Tuple, Union
 
+from file_catalog.cache import bytes_ttl_cache
+from file_catalog.config import Config
+from file_catalog.mongo import Mongo
 from file_catalog.schema import types
+from file_catalog.server import get_etag, PRECONDITION_FAILED_REASON
 import pytest
 import requests
 from rest_tools.client import RestClient
-from tornado.escape import json_encode
+from tornado.escape import json_decode, json_encode
+from tornado.httpclient import AsyncHTTPClient
 
 logger = logging.getLogger(__name__)
 
@@ -136,6 +141,149 @@ async def test_11_files_count(rest: RestClient) -> None:
     assert 'files' in data
     assert data['files'] == 1
 
+    # approximate (cached) counts
+    data = await rest.request('GET', '/api/files/count', {'exact': False})
+    assert data['files'] == 1
+    data = await rest.request('GET', '/api/stats')
+    assert data['count_cache']['hits'] >= 1
+
+
+@pytest.mark.asyncio
+async def test_11a_files_count__archive_only(rest: RestClient, mongo: Mongo, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that an unfiltered /api/files/count matches /api/files, which excludes archive-only files."""
+    await _post_and_assert(rest, {
+        'logical_name': '/data/a.dat',
+        'checksum': {'sha512': hex('a.dat')},
+        'file_size': 1,
+        'locations': [{'site': 'WIPAC', 'path': '/data/a.dat'}],
+    })
+    await _post_and_assert(rest, {
+        'logical_name': '/data/b.dat',
+        'checksum': {'sha512': hex('b.dat')},
+        'file_size': 1,
+        'locations': [{'site': 'NERSC', 'path': '/archive/b.zip:b.dat', 'archive': True}],
+    })
+
+    data = await rest.request('GET', '/api/files')
+    assert len(data['files']) == 1
+    for exact in [True, False]:
+        data = await rest.request('GET', '/api/files/count', {'exact': exact})
+        assert data['files'] == 1
+
+    # an exact count is never an estimate (nor cached)
+    queries = []
+    count_files = mongo.count_files
+
+    async def spy(query: Any = None, **kwargs: Any) -> int:
+        queries.append((query, kwargs['exact']))
+        return await count_files(query, **kwargs)
+
+    monkeypatch.setattr(mongo, 'count_files', spy)
+    await rest.request('GET', '/api/files/count')
+    assert queries == [({'locations.archive': None}, True)]
+
+
+@pytest.mark.asyncio
+async def test_11b_files_aggregate(rest: RestClient) -> None:
+    """Test /api/files/aggregate."""
+    # nothing to aggregate
+    data = await rest.request('GET', '/api/files/aggregate')
+    assert data['group_by'] is None
+    assert data['groups'] == [{
+        'group': None,
+        'count': 0,
+        'file_size': {'sum': 0, 'min': None, 'max': None},
+        'event_count': {'sum': 0, 'min': None, 'max': None},
+    }]
+
+    for i, level in enumerate(['L2', 'L2', 'PFFilt']):
+        await rest.request('POST', '/api/files', {
+            'logical_name': f'/data/{i}',
+            'checksum': {'sha512': hex(f'foo {i}')},
+            'file_size': 10 * (i + 1),
+            'locations': [{'site': 'WIPAC', 'path': f'/data/{i}'}, {'site': 'NERSC', 'path': f'/data/{i}'}],
+            'processing_level': level,
+            'run': {'event_count': i},
+        })
+
+    data = await rest.request('GET', '/api/files/aggregate')
+    assert data['groups'][0]['count'] == 3
+    assert data['groups'][0]['file_size'] == {'sum': 60, 'min': 10, 'max': 30}
+    assert data['groups'][0]['event_count'] == {'sum': 3, 'min': 0, 'max': 2}
+
+    data = await rest.request('GET', '/api/files/aggregate', {'group_by': 'processing_level'})
+    assert data['group_by'] == 'processing_level'
+    assert [(g['group'], g['count'], g['file_size']['sum']) for g in data['groups']] == [('L2', 2, 30), ('PFFilt', 1, 30)]
+
+    # with a filter
+    data = await rest.request('GET', '/api/files/aggregate', {'group_by': 'locations.site', 'processing_level': 'L2'})
+    assert [(g['group'], g['count'], g['file_size']['sum']) for g in data['groups']] == [('NERSC', 2, 30), ('WIPAC', 2, 30)]
+
+    with pytest.raises(Exception) as cm:
+        await rest.request('GET', '/api/files/aggregate', {'group_by': 'uuid'})
+    _assert_httperror(cm.value, 400, 'Invalid query parameter(s)')
+
+
+@pytest.mark.asyncio
+async def test_11c_files_changes(rest: RestClient, config: Config) -> None:
+    """Test /api/files/changes."""
+    config['FC_CHANGES_SETTLE_SECONDS'] = 0
+
+    data = await rest.request('GET', '/api/files/changes')
+    assert data['files'] == []
+    assert data['next_since'] is None
+
+    uuids = []
+    for i in range(3):
+        data = await rest.request('POST', '/api/files', {
+            'logical_name': f'/data/{i}',
+            'checksum': {'sha512': hex(f'foo {i}')},
+            'file_size': i,
+            'locations': [{'site': 'WIPAC', 'path': f'/data/{i}'}],
+        })
+        uuids.append(data['file'].split('/')[-1])
+
+    # page through all the changes
+    changed = []
+    since = None
+    while True:
+        data = await rest.request('GET', '/api/files/changes', {'limit': 2, 'keys': 'uuid|file_size', 'since': since})
+        changed.extend(data['files'])
+        if not data['files']:
+            assert data['next_since'] == since
+            break
+        since = data['next_since']
+    assert [f['uuid'] for f in changed] == uuids
+    assert [f['file_size'] for f in changed] == [0, 1, 2]
+
+    # only the modified file is listed, resuming from the last page
+    await rest.request('PATCH', f'/api/files/{uuids[0]}', {'file_size': 100})
+    data = await rest.request('GET', '/api/files/changes', {'since': since, 'keys': 'file_size'})
+    assert [(f['uuid'], f['file_size']) for f in data['files']] == [(uuids[0], 100)]
+
+    # not settled yet
+    config['FC_CHANGES_SETTLE_SECONDS'] = 60
+    await rest.request('PATCH', f'/api/files/{uuids[1]}', {'file_size': 100})
+    data2 = await rest.request('GET', '/api/files/changes', {'since': data['next_since']})
+    assert data2['files'] == []
+
+    # deletions are listed as tombstones, in order with the other changes
+    config['FC_CHANGES_SETTLE_SECONDS'] = 0
+    await rest.request('DELETE', f'/api/files/{uuids[2]}')
+    data2 = await rest.request('GET', '/api/files/changes', {'since': data['next_since'], 'keys': 'file_size'})
+    assert [(f['uuid'], f.get('file_size'), f.get('deleted')) for f in data2['files']] == [
+        (uuids[1], 100, None),
+        (uuids[2], None, True),
+    ]
+    data3 = await rest.request('GET', '/api/files/changes', {'since': data['next_since'], 'limit': 1})
+    assert [f['uuid'] for f in data3['files']] == [uuids[1]]
+    data3 = await rest.request('GET', '/api/files/changes', {'since': data3['next_since']})
+    assert data3['files'] == [{'uuid': uuids[2], 'meta_modify_date': data3['files'][0]['meta_modify_date'], 'deleted': True}]
+
+    with pytest.raises(Exception) as cm:
+        await rest.request('GET', '/api/files/changes', {'since': 'garbage'})
+    _assert_httperror(cm.value, 400, 'Invalid query parameter(s)')
+
 
 @pytest.mark.asyncio
 async def test_12_files_keys(rest: RestClient) -> None:
@@ -273,6 +421,38 @@ async def test_13_files__name_type_args(rest: RestClient) -> None:
     assert len(await get_logical_names({"logical-name-regex": r".*"})) == 4
 
 
+@pytest.mark.asyncio
+async def test_13b_files__unanchored_regex(rest: RestClient, config: Config) -> None:
+    """Test that unanchored regexes are rejected when there are many files."""
+    for i in range(3):
+        metadata = {
+            'logical_name': f'/data/exp/IceCube/2020/file{i}.i3',
+            'checksum': {'sha512': hex(f'{i}')},
+            'file_size': 1,
+            'locations': [{'site': 'WIPAC', 'path': f'/data/exp/IceCube/2020/file{i}.i3'}],
+        }
+        await _post_and_assert(rest, metadata)
+
+    config['FC_UNANCHORED_REGEX_MAX_FILES'] = 2
+    for args in [{'logical-name-regex': r'.*file1.*'}, {'filename': 'file1.i3'}]:
+        with pytest.raises(requests.exceptions.HTTPError) as cm:
+            await rest.request('GET', '/api/files', args)
+        assert cm.value.response.status_code == 400
+
+    # anchored
+    data = await rest.request('GET', '/api/files', {'logical-name-regex': r'^/data/exp/.*file1.*'})
+    assert len(data['files']) == 1
+    data = await rest.request('GET', '/api/files', {'directory': '/data/exp/IceCube/2020', 'filename': 'file1.i3'})
+    assert len(data['files']) == 1
+    data = await rest.request('GET', '/api/files/count', {'directory': '/data/exp/IceCube/2020/'})
+    assert data['files'] == 3
+
+    # few enough files
+    config['FC_UNANCHORED_REGEX_MAX_FILES'] = 3
+    data = await rest.request('GET', '/api/files', {'filename': 'file1.i3'})
+    assert len(data['files']) == 1
+
+
 @pytest.mark.asyncio
 async def test_20_files(rest: RestClient) -> None:
     """Test POST, GET, PUT, PATCH, and DELETE."""
@@ -375,6 +555,90 @@ async def test_21_files__404(rest: RestClient) -> None:
     _assert_httperror(cm.value, 404, "File uuid not found")
 
 
+@pytest.mark.asyncio
+async def test_22_files__etag(rest: RestClient) -> None:
+    """Test conditional GET (If-None-Match) and If-Match for PATCH, PUT, & locations."""
+    metadata = {
+        u'logical_name': u'blah',
+        u'checksum': {u'sha512': hex('foo bar')},
+        u'file_size': 1,
+        u'locations': [{u'site': u'test', u'path': u'blah.dat'}]
+    }
+    data = await rest.request('POST', '/api/files', metadata)
+    url = data['file']
+
+    data = await rest.request('GET', url)
+    etag = get_etag(data)
+    assert etag
+
+    # GET -- client already has the current version
+    assert await rest.request('GET', url, headers={'If-None-Match': etag}) is None
+    assert await rest.request('GET', url, headers={'If-None-Match': '"stale"'})
+
+    # PATCH -- If-Match
+    data = await rest.request('PATCH', url, {'test': 1}, headers={'If-Match': etag})
+    assert data['test'] == 1
+    assert get_etag(data) != etag
+
+    with pytest.raises(Exception) as cm:
+        await rest.request('PATCH', url, {'test': 2}, headers={'If-Match': etag})
+    _assert_httperror(cm.value, 412, PRECONDITION_FAILED_REASON)
+
+    # PUT -- If-Match
+    with pytest.raises(Exception) as cm:
+        await rest.request('PUT', url, metadata, headers={'If-Match': etag})
+    _assert_httperror(cm.value, 412, PRECONDITION_FAILED_REASON)
+
+    etag = get_etag(data)
+    assert etag
+    data = await rest.request('PUT', url, metadata, headers={'If-Match': f'"other", {etag}'})
+    assert 'test' not in data
+
+    # locations & remove_location -- If-Match
+    new_loc = {u'site': u'test', u'path': u'blah2.dat'}
+    with pytest.raises(Exception) as cm:
+        await rest.request('POST', url + '/locations', {'locations': [new_loc]}, headers={'If-Match': etag})
+    _assert_httperror(cm.value, 412, PRECONDITION_FAILED_REASON)
+
+    etag = get_etag(data)
+    assert etag
+    data = await rest.request('POST', url + '/locations', {'locations': [new_loc]}, headers={'If-Match': etag})
+    assert new_loc in data['locations']
+
+    with pytest.raises(Exception) as cm:
+        await rest.request('POST', url + '/actions/remove_location', new_loc, headers={'If-Match': etag})
+    _assert_httperror(cm.value, 412, PRECONDITION_FAILED_REASON)
+
+    data = await rest.request('POST', url + '/actions/remove_location', new_loc, headers={'If-Match': '*'})
+    assert new_loc not in data['locations']
+
+
+@pytest.mark.asyncio
+async def test_22a_files__etag_stale_cache(rest: RestClient, mongo: Mongo) -> None:
+    """Test that writes check If-Match against the database, not a (stale) cached copy."""
+    mongo.file_cache = bytes_ttl_cache(maxbytes=1024 * 1024, ttl=60)
+    metadata = {
+        'logical_name': 'blah',
+        'checksum': {'sha512': hex('foo bar')},
+        'file_size': 1,
+        'locations': [{'site': 'test', 'path': 'blah.dat'}]
+    }
+    data = await rest.request('POST', '/api/files', metadata)
+    url = data['file']
+    uuid = url.split('/')[-1]
+    await rest.request('GET', url)  # cached
+
+    # written by another process (ex: another FC_WORKERS worker)
+    await mongo.client.files.update_one({'uuid': uuid}, {'$set': {'file_size': 2, 'meta_modify_date': '2030-01-01 00:00:00.000000'}})
+    assert (await rest.request('GET', url))['file_size'] == 1  # stale
+    etag = get_etag(await mongo.client.files.find_one({'uuid': uuid}, {'_id': False}))
+    assert etag
+
+    data = await rest.request('PATCH', url, {'test': 1}, headers={'If-Match': etag})
+    assert data['test'] == 1
+    assert data['file_size'] == 2
+
+
 @pytest.mark.asyncio
 async def test_30_files__archive(rest: RestClient) -> None:
     """Test GET w/ query arg: `locations.archive`."""
@@ -591,6 +855,191 @@ async def test_41_files__simple_query(rest: RestClient) -> None:
         _assert_httperror(cm.value, 400, 'Invalid query parameter(s)')
 
 
+@pytest.mark.asyncio
+async def test_41b_files__keyset_pagination(rest: RestClient) -> None:
+    """Test the after (continuation token) parameter."""
+    # Populate FC
+    for i in range(100):
+        metadata = {
+            'logical_name': f'/foo/bar/{i}.dat',
+            'checksum': {'sha512': hex(f'foo bar {i}')},
+            'file_size': 3 * i,
+            u'locations': [{u'site': u'WIPAC', u'path': f'/foo/bar/{i}.dat'}]
+        }
+        await rest.request('POST', '/api/files', metadata)
+
+    # Normal Usage
+    limit = 7
+    received: List[StrDict] = []
+    after = ''
+    while True:
+        res = await rest.request('GET', '/api/files', {'after': after, 'limit': limit})
+        assert not any(f in received for f in res['files'])
+        received.extend(res['files'])
+        if not res['next_after']:
+            break
+        assert len(res['files']) == limit
+        after = res['next_after']
+    assert len(received) == 100
+    assert [f['logical_name'] for f in received] == [f'/foo/bar/{i}.dat' for i in range(100)]
+
+    # an exact multiple of the limit ends with an empty page
+    res = await rest.request('GET', '/api/files', {'after': '', 'limit': 100})
+    assert len(res['files']) == 100
+    res = await rest.request('GET', '/api/files', {'after': res['next_after'], 'limit': 100})
+    assert res['files'] == []
+    assert res['next_after'] is None
+
+    # Error Cases
+    errs: List[Dict[str, Any]] = [{'after': 'not-a-token'}, {'after': '', 'start': 7}, {'after': '', 'stream': 'json'}]
+    for err in errs:
+        with pytest.raises(requests.exceptions.HTTPError) as cm:
+            await rest.request('GET', '/api/files', err)
+        _assert_httperror(cm.value, 400, 'Invalid query parameter(s)')
+
+
+@pytest.mark.asyncio
+async def test_42_files__stream(rest: RestClient) -> None:
+    """Test the streaming response formats."""
+    # Populate FC
+    for i in range(25):
+        metadata = {
+            'logical_name': f'/foo/bar/{i}.dat',
+            'checksum': {'sha512': hex(f'foo bar {i}')},
+            'file_size': 3 * i,
+            u'locations': [{u'site': u'WIPAC', u'path': f'/foo/bar/{i}.dat'}]
+        }
+        await rest.request('POST', '/api/files', metadata)
+
+    expected = await rest.request('GET', '/api/files', {'all-keys': True})
+    assert len(expected['files']) == 25
+
+    # chunked JSON -- same body as non-streamed
+    for stream in ['json', 'true']:
+        data = await rest.request('GET', '/api/files', {'all-keys': True, 'stream': stream})
+        assert data == expected
+    data = await rest.request('GET', '/api/files', {'all-keys': True, 'stream': 'json', 'limit': 5, 'start': 20})
+    assert data['files'] == expected['files'][20:]
+
+    # NDJSON -- by query parameter or by Accept header
+    http_client = AsyncHTTPClient()
+    for url, headers in [
+        (f'{rest.address}/api/files?all-keys=true&stream=ndjson', {}),
+        (f'{rest.address}/api/files?all-keys=true', {'Accept': 'application/x-ndjson'}),
+    ]:
+        resp = await http_client.fetch(url, headers=headers)
+        assert resp.headers['Content-Type'] == 'application/x-ndjson'
+        lines = resp.body.decode('utf-8').splitlines()
+        assert [json_decode(ln) for ln in lines] == expected['files']
+
+    # Error Case
+    with pytest.raises(requests.exceptions.HTTPError) as cm:
+        await rest.request('GET', '/api/files', {'stream': 'xml'})
+    _assert_httperror(cm.value, 400, 'Invalid query parameter(s)')
+
+
+@pytest.mark.asyncio
+async def test_42b_files__index_enforcement(rest: RestClient, config: Config) -> None:
+    """Test FC_INDEX_ENFORCEMENT on queries that need a collection scan."""
+    for i in range(10):
+        metadata = {
+            'logical_name': f'/blah/data/exp/IceCube/blah{i}.dat',
+            'checksum': {'sha512': hex(f'foo bar {i}')},
+            'file_size': 1,
+            'locations': [{'site': 'WIPAC', 'path': f'/blah/data/exp/IceCube/blah{i}.dat'}],
+        }
+        await _post_and_assert(rest, metadata)
+
+    unindexed = {'query': json_encode({'file_size': 1})}
+    indexed = {'query': json_encode({'logical_name': {'$in': [f'/blah/data/exp/IceCube/blah{i}.dat' for i in range(10)]}})}
+
+    # off (default)
+    data = await rest.request('GET', '/api/files', unindexed)
+    assert len(data['files']) == 10
+
+    # reject
+    config['FC_INDEX_ENFORCEMENT'] = 'reject'
+    for route in ['/api/files', '/api/files/count']:
+        with pytest.raises(requests.exceptions.HTTPError) as cm:
+            await rest.request('GET', route, unindexed)
+        _assert_httperror(cm.value, 400, 'Query needs a collection scan (no usable index)')
+    data = await rest.request('GET', '/api/files', indexed)
+    assert len(data['files']) == 10
+    data = await rest.request('GET', '/api/files')  # only the default filter
+    assert len(data['files']) == 10
+
+    # limit
+    config['FC_INDEX_ENFORCEMENT'] = 'limit'
+    config['FC_UNINDEXED_QUERY_LIMIT'] = 3
+    data = await rest.request('GET', '/api/files', unindexed)
+    assert len(data['files']) == 3
+    data = await rest.request('GET', '/api/files', indexed)
+    assert len(data['files']) == 10
+    with pytest.raises(requests.exceptions.HTTPError) as cm:
+        await rest.request('GET', '/api/files/count', unindexed)
+    _assert_httperror(cm.value, 400, 'Query needs a collection scan (no usable index)')
+
+    # flag
+    config['FC_INDEX_ENFORCEMENT'] = 'flag'
+    data = await rest.request('GET', '/api/files', unindexed)
+    assert len(data['files']) == 10
+
+
+@pytest.mark.asyncio
+async def test_43_post_files_bulk(rest: RestClient) -> None:
+    """Test POST /api/files/bulk."""
+    def _meta(name: str) -> Dict[str, Any]:
+        return {
+            'logical_name': f'/blah/data/exp/IceCube/{name}',
+            'checksum': {'sha512': hex(name)},
+            'file_size': 1,
+            'locations': [{'site': 'WIPAC', 'path': f'/blah/data/exp/IceCube/{name}'}],
+        }
+
+    # an existing file to conflict with
+    _, _, existing_uuid = await _post_and_assert(rest, _meta('existing.dat'))
+
+    metadatas = [
+        _meta('a.dat'),
+        _meta('existing.dat'),  # conflicts with db (file-version)
+        {**_meta('b.dat'), 'uuid': existing_uuid},  # conflicts with db (uuid)
+        {**_meta('c.dat'), 'checksum': {'sha512': 'abc'}},  # fails validation
+        _meta('a.dat'),  # conflicts with an earlier file in this request
+        {**_meta('d.dat'), 'locations': _meta('existing.dat')['locations']},  # conflicts with db (location)
+        _meta('e.dat'),
+    ]
+    data = await rest.request('POST', '/api/files/bulk', {'files': metadatas})
+    assert '_links' in data
+    results = data['files']
+    assert [r['status'] for r in results] == [201, 409, 409, 400, 409, 409, 201]
+
+    # created
+    for i in [0, 6]:
+        assert results[i]['file'] == f"/api/files/{results[i]['uuid']}"
+        await _assert_in_fc(rest, results[i]['uuid'])
+    # conflicts -- link to the existing file
+    assert results[1]['reason'].startswith('Conflict with existing file-version')
+    assert results[1]['file'] == f'/api/files/{existing_uuid}'
+    assert results[2]['reason'] == 'Conflict with existing file (uuid already exists)'
+    assert results[2]['file'] == f'/api/files/{existing_uuid}'
+    assert results[4]['reason'].startswith('Conflict with existing file-version')
+    assert results[4]['file'] == results[0]['file']
+    assert results[5]['reason'] == "Conflict with existing file (location already exists `/blah/data/exp/IceCube/existing.dat`)"
+    assert results[5]['file'] == f'/api/files/{existing_uuid}'
+    # validation
+    assert results[3]['reason'] == 'Validation Error: `checksum[sha512]` needs to be a SHA512 hash'
+
+    data = await rest.request('GET', '/api/files/count')
+    assert data['files'] == 3
+
+    # Error Cases
+    bodies: List[Dict[str, Any]] = [{}, {'files': 'a.dat'}]
+    for body in bodies:
+        with pytest.raises(requests.exceptions.HTTPError) as cm:
+            await rest.request('POST', '/api/files/bulk', body)
+        _assert_httperror(cm.value, 400, "POST body requires 'files' list")
+
+
 @pytest.mark.asyncio
 async def test_50a_post_files__conflicting_file_version__error(rest: RestClient) -> None:
     """Test that file-version (logical_name+checksum.sha512) is unique for creating a new file.
@@ -1617,6 +2066,120 @@ async def test_74_post_files__locations_just_one(rest: RestClient) -> None:
     assert loc1d not in rec2["locations"]
 
 
+@pytest.mark.asyncio
+async def test_75_post_files_actions_add_locations(rest: RestClient) -> None:
+    """Test POST /api/files/actions/add_locations."""
+    uuids = []
+    for name in ['a.dat', 'b.dat']:
+        _, _, uuid = await _post_and_assert(rest, {
+            'logical_name': f'/blah/data/exp/IceCube/{name}',
+            'checksum': {'sha512': hex(name)},
+            'file_size': 1,
+            'locations': [{'site': 'WIPAC', 'path': f'/blah/data/exp/IceCube/{name}'}],
+        })
+        uuids.append(uuid)
+    rec = await rest.request('GET', '/api/files/' + uuids[0])
+
+    nersc_a = {'site': 'NERSC', 'path': '/home/projects/icecube/bundle.zip:a.dat', 'archive': True}
+    nersc_b = {'site': 'NERSC', 'path': '/home/projects/icecube/bundle.zip:b.dat', 'archive': True}
+    items: List[Any] = [
+        {'uuid': uuids[0], 'locations': [nersc_a, rec['locations'][0]]},  # one new, one already there
+        {'uuid': uuids[1], 'locations': [nersc_b]},
+        {'uuid': uuids[1], 'locations': [nersc_a]},  # conflicts with an earlier item in this request
+        {'uuid': uuids[1], 'locations': rec['locations']},  # conflicts with db
+        {'uuid': 'not-a-uuid', 'locations': [{'site': 'OSG', 'path': '/osg/a.dat'}]},
+        {'uuid': uuids[1], 'locations': [{'site': 'OSG'}]},  # fails validation
+        {'uuid': uuids[1]},  # fails validation
+        'a.dat',  # fails validation
+        {'uuid': uuids[0], 'locations': [nersc_a]},  # already added by this request
+    ]
+    data = await rest.request('POST', '/api/files/actions/add_locations', {'files': items})
+    assert '_links' in data
+    results = data['files']
+    assert [r['status'] for r in results] == [200, 200, 409, 409, 404, 400, 400, 400, 200]
+    assert results[0]['file'] == f'/api/files/{uuids[0]}'
+    assert results[2]['file'] == f'/api/files/{uuids[0]}'
+    assert results[2]['location'] == nersc_a
+    assert results[3]['reason'] == "Conflict with existing file (location already exists `/blah/data/exp/IceCube/a.dat`)"
+
+    rec2 = await rest.request('GET', '/api/files/' + uuids[0])
+    assert rec2['locations'] == rec['locations'] + [nersc_a]
+    assert rec2['meta_modify_date'] != rec['meta_modify_date']
+    rec2 = await rest.request('GET', '/api/files/' + uuids[1])
+    assert nersc_b in rec2['locations']
+    assert len(rec2['locations']) == 2
+
+    # Error Cases
+    bodies: List[Dict[str, Any]] = [{}, {'files': 'a.dat'}]
+    for body in bodies:
+        with pytest.raises(requests.exceptions.HTTPError) as cm:
+            await rest.request('POST', '/api/files/actions/add_locations', body)
+        _assert_httperror(cm.value, 400, "POST body requires 'files' list")
+
+
+@pytest.mark.asyncio
+async def test_76_post_files_actions_remove_locations(rest: RestClient) -> None:
+    """Test POST /api/files/actions/remove_locations."""
+    wipac = {'site': 'WIPAC', 'path': '/blah/data/exp/IceCube/a.dat'}
+    nersc = {'site': 'NERSC', 'path': '/home/projects/icecube/bundle.zip:a.dat', 'archive': True}
+    _, _, uuid_a = await _post_and_assert(rest, {
+        'logical_name': '/blah/data/exp/IceCube/a.dat',
+        'checksum': {'sha512': hex('a.dat')},
+        'file_size': 1,
+        'locations': [wipac, nersc],
+    })
+    only = {'site': 'WIPAC', 'path': '/blah/data/exp/IceCube/b.dat'}
+    _, _, uuid_b = await _post_and_assert(rest, {
+        'logical_name': '/blah/data/exp/IceCube/b.dat',
+        'checksum': {'sha512': hex('b.dat')},
+        'file_size': 1,
+        'locations': [only],
+    })
+    only_c = {'site': 'WIPAC', 'path': '/blah/data/exp/IceCube/c.dat'}
+    _, _, uuid_c = await _post_and_assert(rest, {
+        'logical_name': '/blah/data/exp/IceCube/c.dat',
+        'checksum': {'sha512': hex('c.dat')},
+        'file_size': 1,
+        'locations': [only_c],
+    })
+    rec = await rest.request('GET', '/api/files/' + uuid_a)
+
+    items: List[Any] = [
+        {'site': 'NERSC', 'path': nersc['path']},  # by location (matches, without `archive`)
+        {'uuid': uuid_b, **only},  # last location -- deletes the record
+        only_c,  # another last location, in the same batch
+        {'uuid': uuid_b, **wipac},  # belongs to another file
+        {'site': 'OSG', 'path': '/osg/a.dat'},
+        {'site': 'WIPAC'},  # fails validation
+        {**wipac, 'archive': False},  # fails validation
+        'a.dat',  # fails validation
+    ]
+    data = await rest.request('POST', '/api/files/actions/remove_locations', {'locations': items})
+    assert '_links' in data
+    results = data['locations']
+    assert [r['status'] for r in results] == [200, 200, 200, 404, 404, 400, 400, 400]
+    assert results[0] == {'uuid': uuid_a, 'status': 200, 'file': f'/api/files/{uuid_a}', 'deleted': False}
+    assert results[1] == {'uuid': uuid_b, 'status': 200, 'file': f'/api/files/{uuid_b}', 'deleted': True}
+    assert results[2] == {'uuid': uuid_c, 'status': 200, 'file': f'/api/files/{uuid_c}', 'deleted': True}
+    assert results[4]['reason'] == "Location entry not found for site='OSG' & path='/osg/a.dat'"
+    assert results[6]['reason'] == "Validation Error: extra fields detected: ['archive']"
+
+    rec2 = await rest.request('GET', '/api/files/' + uuid_a)
+    assert rec2['locations'] == [wipac]
+    assert rec2['meta_modify_date'] != rec['meta_modify_date']
+    for uuid in [uuid_b, uuid_c]:
+        with pytest.raises(requests.exceptions.HTTPError) as cm:
+            await rest.request('GET', '/api/files/' + uuid)
+        _assert_httperror(cm.value, 404, 'File uuid not found')
+
+    # Error Cases
+    bodies: List[Dict[str, Any]] = [{}, {'locations': 'a.dat'}]
+    for body in bodies:
+        with pytest.raises(requests.exceptions.HTTPError) as cm:
+            await rest.request('POST', '/api/files/actions/remove_locations', body)
+        _assert_httperror(cm.value, 400, "POST body requires 'locations' list")
+
+
 @pytest.mark.asyncio
 async def test_80a_files_uuid_actions_remove_location__keep_record__okay(rest: RestClient) -> None:
     """Test removing a location from a record with multiple locations."""
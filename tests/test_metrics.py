@@ -0,0 +1,103 @@
+# test_metrics.py
+"""Unit tests for file_catalog/metrics.py."""
+
+# fmt:off
+
+import asyncio
+import time
+from typing import AsyncIterator, List
+
+from file_catalog import metrics
+
+
+def test_00_always_succeed() -> None:
+    """Succeed with flying colors."""
+    assert True
+
+
+def test_10_histogram() -> None:
+    """Test cumulative buckets, sums, and counts in the Prometheus text format."""
+    hist = metrics.Histogram("test_seconds", "A test", ["route"], [0.1, 1])
+    hist.observe(("/a",), 0.05)
+    hist.observe(("/a",), 0.1)  # buckets are inclusive
+    hist.observe(("/a",), 5)
+    hist.observe(('"b"',), 0.5)
+
+    lines = hist.render()
+    assert lines[:2] == ["# HELP test_seconds A test", "# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{route="/a"} 5.15' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+    assert 'test_seconds_count{route="\\"b\\""} 1' in lines  # escaped
+
+
+def test_11_gauge() -> None:
+    """Test a gauge going up & down."""
+    gauge = metrics.Gauge("test_in_flight", "A test", ["route"])
+    gauge.inc(("/a",))
+    gauge.inc(("/a",))
+    gauge.dec(("/a",))
+    assert 'test_in_flight{route="/a"} 1' in gauge.render()
+
+
+def test_20_phases() -> None:
+    """Test that nested phases count only towards the innermost phase."""
+    timer = metrics.RequestTimer("TestHandler", "GET")
+    timer.push(metrics.PHASE_VALIDATION)
+    time.sleep(0.01)
+    timer.push(metrics.PHASE_DB)
+    time.sleep(0.02)
+    timer.pop()
+    timer.pop()
+
+    assert 0.01 <= timer.phases[metrics.PHASE_VALIDATION] < 0.02
+    assert timer.phases[metrics.PHASE_DB] >= 0.02
+    assert not timer.stack
+
+    labels = ("TestHandler", "GET")
+    assert metrics.IN_FLIGHT.values[labels] == 1
+    timer.finish(200, 1234)
+    timer.finish(200, 1234)  # only recorded once
+    assert metrics.IN_FLIGHT.values[labels] == 0
+    assert metrics.REQUEST_DURATION.series[labels + ("200",)][0][-1] == 0  # none over 60s
+    assert sum(metrics.REQUEST_DURATION.series[labels + ("200",)][0]) == 1
+    assert sum(metrics.PHASE_DURATION.series[labels + (metrics.PHASE_DB,)][0]) == 1
+    assert sum(metrics.PHASE_DURATION.series[labels + (metrics.PHASE_OTHER,)][0]) == 1
+    assert metrics.RESPONSE_SIZE.series[labels][1] == [1234]
+
+    text = metrics.render()
+    assert 'file_catalog_request_duration_seconds_count{handler="TestHandler",method="GET",status="200"} 1' in text
+
+
+def test_30_timed() -> None:
+    """Test the decorators, in & out of a request."""
+    @metrics.timed(metrics.PHASE_PARSE)
+    def parse() -> int:
+        return 1
+
+    @metrics.timed_coroutines(metrics.PHASE_DB)
+    class DB:
+        async def find(self) -> int:
+            return 2
+
+        async def iterate(self) -> AsyncIterator[int]:
+            for i in range(3):
+                yield i
+
+    async def handle() -> List[int]:
+        db = DB()
+        return [parse(), await db.find()] + [i async for i in db.iterate()]
+
+    # outside a request: just a call
+    assert parse() == 1
+
+    async def request() -> metrics.RequestTimer:
+        timer = metrics.start_request("TimedHandler", "GET")
+        assert await handle() == [1, 2, 0, 1, 2]
+        return timer
+
+    timer = asyncio.run(request())
+    assert set(timer.phases) == {metrics.PHASE_PARSE, metrics.PHASE_DB}
+    assert not timer.stack
@@ -1,6 +1,8 @@
 # test_mongo.py
 """Test the File Catalog's internal MongoDB client."""
 
+import asyncio
+import datetime
 import logging
 import os
 import pytest
@@ -8,9 +10,26 @@ import re
 from typing import Any, List, Tuple
 from uuid import uuid4
 
-from file_catalog.mongo import AllKeys, Mongo
+from bson.objectid import ObjectId  # type: ignore[import]
+from bson.raw_bson import RawBSONDocument  # type: ignore[import]
+from file_catalog.cache import bytes_ttl_cache
+from file_catalog.mongo import (
+    AllKeys,
+    decode_changes_token,
+    decode_continuation_token,
+    decode_snapshot_token,
+    DUPLICATE_KEY_ERROR_CODE,
+    encode_changes_token,
+    encode_continuation_token,
+    encode_snapshot_token,
+    get_read_preference,
+    Mongo,
+    PreconditionFailedError,
+    start_request_scope,
+)
 from motor import MotorCollection  # type: ignore[import]
-from pymongo.errors import DuplicateKeyError  # type: ignore[import]
+from pymongo.errors import DuplicateKeyError, ExecutionTimeout, OperationFailure  # type: ignore[import]
+from pymongo.read_preferences import Primary, SecondaryPreferred  # type: ignore[import]
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +47,22 @@ def test_01_constructor_mongo_uri() -> None:
     assert mongo
 
 
+def test_01a_constructor_read_preference() -> None:
+    """Test that read-only queries get the read preference, and writes the primary."""
+    mongo = Mongo(host="localhost", port=27017, authSource="admin",
+                  read_preference="secondaryPreferred", max_staleness_seconds=120,
+                  max_pool_size=10, max_idle_time_ms=1000)
+    assert mongo.client.read_preference == Primary()
+    assert mongo.reader.read_preference == SecondaryPreferred(max_staleness=120)
+    assert mongo._files().read_preference == Primary()
+    assert mongo._files(secondary_ok=True).read_preference == SecondaryPreferred(max_staleness=120)
+    assert mongo._files(secondary_ok=True, raw=True).codec_options.document_class is RawBSONDocument
+
+    assert get_read_preference("primary", 120) == Primary()
+    with pytest.raises(ValueError):
+        get_read_preference("secondaryPreferredPlease")
+
+
 def test_02_pytest_mongo_fixture(mongo: Mongo) -> None:
     """Test that Mongo will be provided by a pytest fixture."""
     assert mongo
@@ -50,9 +85,12 @@ async def test_03_create_indexes(mongo: Mongo) -> None:
     db = mongo.client
     await assert_index(db.files, [('uuid', 1)])
     await assert_index(db.files, [('logical_name', 'hashed')])
+    await assert_index(db.files, [('logical_name', 1)])
     await assert_index(db.files, [('locations', 1)])
     await assert_index(db.files, [('locations.path', -1), ('locations.site', -1)])
     await assert_index(db.files, [('create_date', 1)])
+    await assert_index(db.files, [('meta_modify_date', 1), ('uuid', 1)])
+    await assert_index(db.file_tombstones, [('meta_modify_date', 1), ('uuid', 1)])
     await assert_index(db.files, [('content_status', 1)])
     await assert_index(db.files, [('processing_level', 1), ('offline_processing_metadata.season', 1), ('locations.archive', 1)])
     await assert_index(db.files, [('data_type', 1)])
@@ -66,9 +104,13 @@ async def test_03_create_indexes(mongo: Mongo) -> None:
     await assert_index(db.collections, [('uuid', 1)])
     await assert_index(db.collections, [('collection_name', 1)])
     await assert_index(db.collections, [('owner', 1)])
+    await assert_index(db.collection_files, [('collection_id', 1), ('uuid', 1)])
+    await assert_index(db.collection_files, [('collection_id', 1), ('_id', 1)])
+    await assert_index(db.collection_files, [('uuid', 1)])
     await assert_index(db.snapshots, [('uuid', 1)])
     await assert_index(db.snapshots, [('collection_id', 1)])
     await assert_index(db.snapshots, [('owner', 1)])
+    await assert_index(db.snapshot_files, [('snapshot_id', 1), ('seq', 1)])
 
 
 def test_04__get_projection() -> None:
@@ -135,6 +177,92 @@ async def test_06_find_files(mongo: Mongo) -> None:
         assert doc["file_size"] >= 10
         assert doc["file_size"] < 20
 
+    # raw BSON -- not decoded
+    res = await mongo.find_files({"data_type": "RAW"}, ["file_size"], limit=10, raw=True)
+    assert len(res) == 10
+    for doc in res:
+        assert isinstance(doc, RawBSONDocument)
+        assert dict(doc) == {"file_size": doc["file_size"]}
+
+
+@pytest.mark.asyncio
+async def test_06a_find_files_after(mongo: Mongo) -> None:
+    """Use find_files_after to page through documents from the files collection."""
+    # create some records so we have something to find
+    for file_size in range(100):
+        uuid = str(uuid4())
+        await mongo.create_file({"uuid": uuid, "file_size": file_size, "locations": [{"site": "WIPAC", "path": f"{uuid}.zip"}], "data_type": "RAW"})
+
+    res, last_id = await mongo.find_files_after({"data_type": "RAW"}, ["file_size"], limit=40)
+    assert [doc["file_size"] for doc in res] == list(range(40))
+    assert all("_id" not in doc for doc in res)
+    assert last_id
+
+    res, last_id = await mongo.find_files_after({"data_type": "RAW"}, ["file_size"], limit=40, after=last_id)
+    assert [doc["file_size"] for doc in res] == list(range(40, 80))
+
+    res, last_id = await mongo.find_files_after({"data_type": "RAW"}, ["file_size"], limit=40, after=last_id)
+    assert [doc["file_size"] for doc in res] == list(range(80, 100))
+    assert last_id is None
+
+
+def test_06c_continuation_token() -> None:
+    """Test that continuation tokens round-trip and reject garbage."""
+    oid = ObjectId()
+    assert decode_continuation_token(encode_continuation_token(oid)) == oid
+    for bad in ["", "v1", "v1abc", "12345", encode_continuation_token(oid)[2:]]:
+        with pytest.raises(ValueError):
+            decode_continuation_token(bad)
+
+
+def test_06d_changes_token() -> None:
+    """Test that changes tokens round-trip and reject garbage."""
+    position = ("2022-01-01 00:00:00.000001", str(uuid4()))
+    assert decode_changes_token(encode_changes_token(*position)) == position
+    for bad in ["", "c1", "c1abc", "12345", encode_changes_token(*position)[2:], encode_continuation_token(ObjectId())]:
+        with pytest.raises(ValueError):
+            decode_changes_token(bad)
+
+
+@pytest.mark.asyncio
+async def test_06e_find_files_changed(mongo: Mongo) -> None:
+    """Use find_files_changed to page through files in modification order."""
+    dates = ["2022-01-01 00:00:02", "2022-01-01 00:00:01", "2022-01-01 00:00:01", "2022-01-01 00:00:03"]
+    for i, date in enumerate(dates):
+        await mongo.create_file({"uuid": f"uuid-{i}", "meta_modify_date": date, "file_size": i})
+    await mongo.create_file({"uuid": "no-date", "file_size": -1})
+
+    res = await mongo.find_files_changed(until="2022-01-01 00:00:02")
+    assert [f["uuid"] for f in res] == ["uuid-1", "uuid-2", "uuid-0"]
+    assert res[0] == {"uuid": "uuid-1", "meta_modify_date": "2022-01-01 00:00:01"}
+
+    # page through, resuming from the last file (including between files with the same date)
+    pages = []
+    since = None
+    while res := await mongo.find_files_changed(until="2022-01-01 00:00:09", since=since, keys=["file_size"], limit=1):
+        pages.append(res)
+        since = (res[-1]["meta_modify_date"], res[-1]["uuid"])
+    assert [p[0]["file_size"] for p in pages] == [1, 2, 0, 3]
+
+
+@pytest.mark.asyncio
+async def test_06b_iter_files(mongo: Mongo) -> None:
+    """Use iter_files to obtain batches of documents from the files collection."""
+    # create some records so we have something to find
+    for file_size in range(100):
+        uuid = str(uuid4())
+        await mongo.create_file({"uuid": uuid, "file_size": file_size, "locations": [{"site": "WIPAC", "path": f"{uuid}.zip"}], "data_type": "RAW"})
+
+    batches = [b async for b in mongo.iter_files({"data_type": "RAW"}, ["file_size"], batch_size=30)]
+    assert [len(b) for b in batches] == [30, 30, 30, 10]
+    assert sorted(doc["file_size"] for b in batches for doc in b) == list(range(100))
+
+    batches = [b async for b in mongo.iter_files({"data_type": "RAW"}, ["file_size"], start=10, limit=50, batch_size=30)]
+    assert [len(b) for b in batches] == [30, 20]
+    for doc in (doc for b in batches for doc in b):
+        assert doc["file_size"] >= 10
+        assert doc["file_size"] < 60
+
 
 @pytest.mark.asyncio
 async def test_07_count_files(mongo: Mongo) -> None:
@@ -148,6 +276,91 @@ async def test_07_count_files(mongo: Mongo) -> None:
     assert await mongo.count_files() == 100
 
 
+@pytest.mark.asyncio
+async def test_07d_aggregate_files(mongo: Mongo) -> None:
+    """Use aggregate_files to get statistics of the files collection."""
+    for file_size in range(10):
+        uuid = str(uuid4())
+        await mongo.create_file({
+            "uuid": uuid,
+            "file_size": file_size,
+            "locations": [{"site": "WIPAC", "path": f"{uuid}.zip"}, {"site": "WIPAC", "path": f"/{uuid}"}],
+            "data_type": "real" if file_size % 2 else "simulation",
+        })
+
+    res = await mongo.aggregate_files({"data_type": "real"})
+    assert res == [{
+        "group": None,
+        "count": 5,
+        "file_size": {"sum": 25, "min": 1, "max": 9},
+        "event_count": {"sum": 0, "min": None, "max": None},
+    }]
+
+    res = await mongo.aggregate_files({}, group_by="data_type", max_time_ms=1000)
+    assert [(r["group"], r["count"], r["file_size"]["sum"]) for r in res] == [("real", 5, 25), ("simulation", 5, 20)]
+
+    # each file is counted once per site
+    res = await mongo.aggregate_files({}, group_by="locations.site")
+    assert [(r["group"], r["count"], r["file_size"]["sum"]) for r in res] == [("WIPAC", 10, 45)]
+
+    assert await mongo.aggregate_files({"data_type": "foo"}, group_by="data_type") == []
+    with pytest.raises(ValueError):
+        await mongo.aggregate_files({}, group_by="uuid")
+
+
+@pytest.mark.asyncio
+async def test_07a_count_files__cached(mongo: Mongo) -> None:
+    """Use count_files with exact=False to get (cached) approximate counts."""
+    for file_size in range(10):
+        uuid = str(uuid4())
+        await mongo.create_file({"uuid": uuid, "file_size": file_size, "locations": [{"site": "WIPAC", "path": f"{uuid}.zip"}], "data_type": "RAW"})
+
+    assert await mongo.count_files() == 10  # estimated, from collection metadata
+    assert await mongo.count_files({"data_type": "RAW"}) == 10
+
+    uuid = str(uuid4())
+    await mongo.create_file({"uuid": uuid, "file_size": 10, "locations": [{"site": "WIPAC", "path": f"{uuid}.zip"}], "data_type": "RAW"})
+
+    hits = mongo.count_cache.hits
+    assert await mongo.count_files({"data_type": "RAW"}, exact=False) == 10  # stale
+    assert mongo.count_cache.hits == hits + 1
+    assert await mongo.count_files({"data_type": "RAW"}) == 11  # refreshes cache
+    assert await mongo.count_files({"data_type": "RAW"}, exact=False) == 11
+
+    misses = mongo.count_cache.misses
+    assert await mongo.count_files({"file_size": {"$lt": 5}, "data_type": "RAW"}, exact=False) == 5
+    assert mongo.count_cache.misses == misses + 1
+    # normalized on the order of top-level fields
+    assert await mongo.count_files({"data_type": "RAW", "file_size": {"$lt": 5}}, exact=False) == 5
+    assert mongo.count_cache.misses == misses + 1
+
+
+@pytest.mark.asyncio
+async def test_07b_is_indexed_query(mongo: Mongo) -> None:
+    """Use is_indexed_query to detect queries that need a collection scan."""
+    for file_size in range(10):
+        uuid = str(uuid4())
+        await mongo.create_file({"uuid": uuid, "file_size": file_size, "locations": [{"site": "WIPAC", "path": f"{uuid}.zip"}], "data_type": "RAW"})
+
+    assert await mongo.is_indexed_query({"uuid": "abc"})
+    assert await mongo.is_indexed_query({"run.run_number": {"$in": [1, 2]}, "file_size": 5})
+    assert not await mongo.is_indexed_query({"file_size": 5})
+
+    # the plan is cached by query shape
+    misses = mongo.plan_cache.misses
+    assert not await mongo.is_indexed_query({"file_size": 6})
+    assert await mongo.is_indexed_query({"run.run_number": {"$in": [3]}, "file_size": 7})
+    assert mongo.plan_cache.misses == misses
+
+
+def test_07c__plan_has_stage() -> None:
+    """Test that _plan_has_stage finds stages nested anywhere in the plan."""
+    plan = {"stage": "FETCH", "inputStage": {"stage": "OR", "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}]}}
+    assert Mongo._plan_has_stage(plan, "COLLSCAN")
+    assert Mongo._plan_has_stage(plan, "IXSCAN")
+    assert not Mongo._plan_has_stage(plan, "SORT")
+
+
 @pytest.mark.asyncio
 async def test_08_create_file(mongo: Mongo) -> None:
     """Use create_file to create documents in the files collection."""
@@ -162,6 +375,27 @@ async def test_08_create_file(mongo: Mongo) -> None:
         await mongo.create_file({"uuid": f"{uuid1}"})
 
 
+@pytest.mark.asyncio
+async def test_08a_create_files(mongo: Mongo) -> None:
+    """Use create_files to create many documents in the files collection."""
+    uuid1 = str(uuid4())
+    uuid2 = str(uuid4())
+    uuid3 = str(uuid4())
+
+    errors = await mongo.create_files([{"uuid": uuid1}, {"uuid": uuid2}])
+    assert errors == [None, None]
+    res = await mongo.find_files({"uuid": {"$in": [uuid1, uuid2]}}, ["uuid"], max_time_ms=10)
+    assert sorted(r["uuid"] for r in res) == sorted([uuid1, uuid2])
+
+    # unordered: a duplicate does not stop the rest of the batch
+    errors = await mongo.create_files([{"uuid": uuid1}, {"uuid": uuid3}])
+    assert errors[0] and errors[0]["code"] == DUPLICATE_KEY_ERROR_CODE
+    assert errors[1] is None
+    assert await mongo.get_file({"uuid": uuid3})
+
+    assert await mongo.create_files([]) == []
+
+
 @pytest.mark.asyncio
 async def test_09_get_file(mongo: Mongo) -> None:
     """Use get_file to find a document in the files collection."""
@@ -219,6 +453,64 @@ async def test_11_update_file(mongo: Mongo) -> None:
         await mongo.update_file(f"{uuid2}", {"file_size": 1})
 
 
+@pytest.mark.asyncio
+async def test_11a_update_file__if_modify_date(mongo: Mongo) -> None:
+    """Use update_file & replace_file conditioned on `meta_modify_date`."""
+    uuid1 = str(uuid4())
+
+    await mongo.create_file({"uuid": f"{uuid1}", "file_size": 0, "meta_modify_date": "then"})
+    res = await mongo.update_file(f"{uuid1}", {"file_size": 1, "meta_modify_date": "now"}, if_modify_date="then")
+    assert res["file_size"] == 1
+
+    # the record was modified since "then"
+    with pytest.raises(PreconditionFailedError):
+        await mongo.update_file(f"{uuid1}", {"file_size": 2}, if_modify_date="then")
+    with pytest.raises(PreconditionFailedError):
+        await mongo.replace_file({"uuid": f"{uuid1}", "file_size": 2}, if_modify_date="then")
+    with pytest.raises(PreconditionFailedError):
+        await mongo.delete_file({"uuid": f"{uuid1}"}, if_modify_date="then")
+
+    file = await mongo.get_file({"uuid": f"{uuid1}"})
+    assert file and file["file_size"] == 1
+    await mongo.delete_file({"uuid": f"{uuid1}"}, if_modify_date="now")
+
+
+@pytest.mark.asyncio
+async def test_11b_get_file__cached(mongo: Mongo) -> None:
+    """Test that uuid lookups are cached & writes keep the cache current."""
+    mongo.file_cache = bytes_ttl_cache(maxbytes=1024 * 1024, ttl=60)
+    uuid1 = str(uuid4())
+
+    await mongo.create_file({"uuid": f"{uuid1}", "file_size": 0})
+    assert (await mongo.get_file({"uuid": f"{uuid1}"}))["file_size"] == 0  # type: ignore[index]
+    assert mongo.file_cache.stats()["misses"] == 1
+
+    # served from the cache -- not the database
+    await mongo.client.files.update_one({"uuid": f"{uuid1}"}, {"$set": {"file_size": 99}})
+    res = await mongo.get_file({"uuid": f"{uuid1}"})
+    assert res and res["file_size"] == 0
+    res["file_size"] = -1  # the cached copy can't be mutated
+    assert (await mongo.get_file({"uuid": f"{uuid1}"}))["file_size"] == 0  # type: ignore[index]
+    assert mongo.file_cache.stats()["hits"] == 2
+
+    # bypassing the cache (for a write) refreshes it
+    res = await mongo.get_file({"uuid": f"{uuid1}"}, use_cache=False)
+    assert res and res["file_size"] == 99
+    assert (await mongo.get_file({"uuid": f"{uuid1}"}))["file_size"] == 99  # type: ignore[index]
+
+    # write-through
+    await mongo.update_file(f"{uuid1}", {"file_size": 1})
+    assert (await mongo.get_file({"uuid": f"{uuid1}"}))["file_size"] == 1  # type: ignore[index]
+    await mongo.replace_file({"uuid": f"{uuid1}", "file_size": 2})
+    assert (await mongo.get_file({"uuid": f"{uuid1}"}))["file_size"] == 2  # type: ignore[index]
+    await mongo.append_distinct_elements_to_file(f"{uuid1}", {"locations": [{"site": "WIPAC", "path": "/a"}]})
+    res2 = await mongo.get_file({"uuid": f"{uuid1}"})
+    assert res2 and res2["locations"] == [{"site": "WIPAC", "path": "/a"}]
+
+    await mongo.delete_file({"uuid": f"{uuid1}"})
+    assert not await mongo.get_file({"uuid": f"{uuid1}"})
+
+
 @pytest.mark.asyncio
 async def test_12_replace_file(mongo: Mongo) -> None:
     """Use replace_file to update a document in the files collection."""
@@ -303,6 +595,61 @@ async def test_16_get_collection(mongo: Mongo) -> None:
     assert res["uuid"] == "ba92c24c-bbdc-44e0-adfb-6ae256da29ad"
 
 
+@pytest.mark.asyncio
+async def test_16a_lookup_collection(mongo: Mongo) -> None:
+    """Use lookup_collection to get (cached) collections by uuid or name."""
+    await mongo.create_collection({"uuid": "c0", "collection_name": "blah", "owner": "Alice", "query": '{"a": 1}'})
+
+    for uid in ["c0", "blah", "c0", "blah"]:
+        res = await mongo.lookup_collection(uid)
+        assert res
+        collection, query = res
+        assert collection["uuid"] == "c0"
+        assert query == {"a": 1}
+        collection["_links"] = {}  # the cached copy isn't changed
+        query["b"] = 2
+    assert mongo.collection_cache.hits == 2
+    assert await mongo.lookup_collection("nope") is None
+
+
+@pytest.mark.asyncio
+async def test_16b_materialized_collection(mongo: Mongo) -> None:
+    """Use materialize_collection & refresh_materialized_collections to keep a collection's files."""
+    for i in range(5):
+        await mongo.create_file({"uuid": f"uuid-{i}", "data_type": "real", "meta_modify_date": "2022-01-01 00:00:00"})  # type: ignore
+    await mongo.create_file({"uuid": "uuid-sim", "data_type": "simulation", "meta_modify_date": "2022-01-01 00:00:00"})  # type: ignore
+
+    query = {"data_type": "real"}
+    await mongo.create_collection({"uuid": "c0", "collection_name": "real", "query": '{"data_type": "real"}'})
+    assert await mongo.lookup_collection("real")  # cached, then evicted by the change
+    assert await mongo.materialize_collection("c0", query, since=("2022-01-02 00:00:00", "")) == 5
+    res = await mongo.lookup_collection("real")
+    assert res and res[0]["materialized_since"] == ["2022-01-02 00:00:00", ""]
+
+    files, last_id = await mongo.find_collection_files("c0", limit=3)
+    assert len(files) == 3 and last_id
+    files2, last_id = await mongo.find_collection_files("c0", limit=3, after=last_id)
+    assert len(files2) == 2 and last_id is None
+    assert sorted(f["uuid"] for f in files + files2) == [f"uuid-{i}" for i in range(5)]
+
+    files, _ = await mongo.find_collection_files("c0", keys=AllKeys())
+    assert all("_id" not in f and f["data_type"] == "real" for f in files)
+
+    # changes are picked up by the next refresh
+    await mongo.update_file("uuid-0", {"data_type": "simulation", "meta_modify_date": "2022-01-03 00:00:00"})  # type: ignore
+    await mongo.update_file("uuid-sim", {"data_type": "real", "meta_modify_date": "2022-01-03 00:00:00"})  # type: ignore
+    await mongo.delete_file({"uuid": "uuid-1"})
+    assert await mongo.refresh_materialized_collections() == 2
+    files, _ = await mongo.find_collection_files("c0")
+    assert sorted(f["uuid"] for f in files) == ["uuid-2", "uuid-3", "uuid-4", "uuid-sim"]
+    assert await mongo.refresh_materialized_collections() == 0
+
+    # another process's refresh is left alone
+    await mongo.update_file("uuid-2", {"data_type": "simulation", "meta_modify_date": "2022-01-04 00:00:00"})  # type: ignore
+    await mongo.client.collections.update_one({"uuid": "c0"}, {"$set": {"refresh_lease": datetime.datetime.utcnow() + datetime.timedelta(hours=1)}})
+    assert await mongo.refresh_materialized_collections() == 0
+
+
 @pytest.mark.asyncio
 async def test_17_find_snapshots(mongo: Mongo) -> None:
     """Use find_snapshots to find documents in the snapshots collection."""
@@ -338,6 +685,134 @@ async def test_19_get_snapshot(mongo: Mongo) -> None:
     assert res["uuid"] == "ba92c24c-bbdc-44e0-adfb-6ae256da29ad"
 
 
+def test_19a_snapshot_token() -> None:
+    """Test that snapshot tokens round-trip and malformed tokens are rejected."""
+    for position in [0, 1, 12345678]:
+        assert decode_snapshot_token(encode_snapshot_token(position)) == position
+
+    for token in ["", "abc", "s1!!!", encode_snapshot_token(-1), encode_continuation_token(ObjectId())]:
+        with pytest.raises(ValueError):
+            decode_snapshot_token(token)
+
+
+@pytest.mark.asyncio
+async def test_19b_snapshot_files(mongo: Mongo, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Use create_snapshot & find_snapshot_files to page through a snapshot's membership."""
+    monkeypatch.setattr("file_catalog.mongo.SNAPSHOT_CHUNK_SIZE", 3)
+    for i in range(10):
+        await mongo.create_file({"uuid": f"uuid-{i}", "logical_name": f"/data/{i}", "file_size": i, "data_type": "real"})  # type: ignore
+    await mongo.create_file({"uuid": "uuid-sim", "logical_name": "/data/sim", "data_type": "simulation"})  # type: ignore
+
+    snap = "8c0ed54a-6e9a-4bb4-a1b1-2f3ab2a6c1e5"
+    await mongo.create_snapshot({"uuid": snap, "owner": "Alice"}, query={"data_type": "real"})
+    res = await mongo.get_snapshot({"uuid": snap})
+    assert res["file_count"] == 10
+    assert "files" not in res
+    chunks = await mongo.client.snapshot_files.find({"snapshot_id": snap}).sort("seq", 1).to_list(None)
+    assert [(c["seq"], len(c["files"])) for c in chunks] == [(0, 3), (1, 3), (2, 3), (3, 1)]
+
+    # page across chunk boundaries
+    uuids = []
+    start = 0
+    while True:
+        files, read = await mongo.find_snapshot_files(snap, limit=4, start=start)
+        uuids.extend(f["uuid"] for f in files)
+        start += read
+        if read < 4:
+            break
+    assert sorted(uuids) == [f"uuid-{i}" for i in range(10)]
+    assert len(set(uuids)) == 10
+
+    files, read = await mongo.find_snapshot_files(snap, keys=["file_size"], limit=2, start=4)
+    assert read == 2
+    assert all(list(f) == ["file_size"] for f in files)
+
+    files, read = await mongo.find_snapshot_files(snap, keys=AllKeys())
+    assert read == 10
+    assert all("_id" not in f and "logical_name" in f for f in files)
+
+    # deleted files are skipped, but still counted as read
+    await mongo.delete_file({"uuid": files[0]["uuid"]})
+    files, read = await mongo.find_snapshot_files(snap)
+    assert (len(files), read) == (9, 10)
+
+    # a snapshot without a query has no files
+    await mongo.create_snapshot({"uuid": "9a7e7bd4-5a52-4b0d-8b5a-0e0c2c9f1e2d", "owner": "Alice"})
+    assert await mongo.find_snapshot_files("9a7e7bd4-5a52-4b0d-8b5a-0e0c2c9f1e2d") == ([], 0)
+
+
+@pytest.mark.asyncio
+async def test_19c_snapshot_files_fallback(mongo: Mongo, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that snapshots are stored the same, with & without building them in the database."""
+    monkeypatch.setattr("file_catalog.mongo.SNAPSHOT_CHUNK_SIZE", 3)
+    for i in range(7):
+        await mongo.create_file({"uuid": f"uuid-{i}", "data_type": "real"})  # type: ignore
+
+    layouts = []
+    for i, version in enumerate([(4, 0, 0), await mongo.server_version()]):
+        mongo._server_version = version
+        snap = f"snap-{i}"
+        await mongo.create_snapshot({"uuid": snap}, query={"data_type": "real"})
+        chunks = await mongo.client.snapshot_files.find({"snapshot_id": snap}).sort("seq", 1).to_list(None)
+        layouts.append([(c["seq"], len(c["files"])) for c in chunks])
+        assert sorted(u for c in chunks for u in c["files"]) == [f"uuid-{i}" for i in range(7)]
+        assert await mongo.count_snapshot_files(snap) == 7
+    assert layouts[0] == layouts[1] == [(0, 3), (1, 3), (2, 1)]
+
+
+@pytest.mark.asyncio
+async def test_19d_start_snapshot(mongo: Mongo) -> None:
+    """Use start_snapshot to store a snapshot's membership in the background."""
+    for i in range(5):
+        await mongo.create_file({"uuid": f"uuid-{i}", "data_type": "real"})  # type: ignore
+
+    await mongo.start_snapshot({"uuid": "snap"}, {"data_type": "real"})
+    res = await mongo.get_snapshot({"uuid": "snap"})
+    assert res["status"] in ["pending", "complete"]
+
+    await asyncio.gather(*mongo._snapshot_jobs)
+    res = await mongo.get_snapshot({"uuid": "snap"})
+    assert res["status"] == "complete"
+    assert res["file_count"] == 5
+    assert "completion_date" in res
+    assert (await mongo.find_snapshot_files("snap"))[1] == 5
+
+    # a failure is recorded, & its partial membership is removed
+    await mongo.start_snapshot({"uuid": "bad"}, {"$bad": 1})
+    await asyncio.gather(*mongo._snapshot_jobs)
+    res = await mongo.get_snapshot({"uuid": "bad"})
+    assert res["status"] == "failed"
+    assert res["error"]
+    assert await mongo.count_snapshot_files("bad") == 0
+
+
+@pytest.mark.asyncio
+async def test_19e_fail_stale_snapshots(mongo: Mongo) -> None:
+    """Use fail_stale_snapshots to fail snapshots left pending by a dead process."""
+    await mongo.create_file({"uuid": "uuid-0", "data_type": "real"})  # type: ignore
+    for uuid, age in [("old", 7200), ("new", 60)]:
+        started = str(datetime.datetime.utcnow() - datetime.timedelta(seconds=age))
+        await mongo.create_snapshot({"uuid": uuid, "status": "pending", "started_date": started})
+        await mongo.client.snapshot_files.insert_one({"snapshot_id": uuid, "seq": 0, "files": ["uuid-0"]})
+    await mongo.create_snapshot({"uuid": "done", "file_count": 0})
+
+    assert await mongo.fail_stale_snapshots(3600) == 1
+    res = await mongo.get_snapshot({"uuid": "old"})
+    assert res["status"] == "failed"
+    assert res["error"] == "interrupted"
+    assert "completion_date" in res
+    assert await mongo.count_snapshot_files("old") == 0
+    assert (await mongo.get_snapshot({"uuid": "new"}))["status"] == "pending"
+    assert await mongo.count_snapshot_files("new") == 1
+    assert "status" not in await mongo.get_snapshot({"uuid": "done"})
+    assert await mongo.fail_stale_snapshots(3600) == 0
+
+    # a job finishing after being failed keeps it failed, without membership
+    await mongo._finish_snapshot("old", {"data_type": "real"})
+    assert (await mongo.get_snapshot({"uuid": "old"}))["status"] == "failed"
+    assert await mongo.count_snapshot_files("old") == 0
+
+
 @pytest.mark.asyncio
 async def test_20_append_distinct_elements_to_file(mongo: Mongo) -> None:
     """Use append_distinct_elements_to_file to update a document in the files collection."""
@@ -361,3 +836,177 @@ async def test_20_append_distinct_elements_to_file(mongo: Mongo) -> None:
     assert res["a"] == [1, 3]  # type: ignore
     assert "b" in res  # type: ignore
     assert res["b"] == [2, 4, 5, 6]  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_20a_add_files_locations(mongo: Mongo) -> None:
+    """Use add_files_locations to add locations to many files in one bulk write."""
+    for i in range(3):
+        await mongo.create_file({"uuid": f"uuid-{i}", "locations": [{"site": "WIPAC", "path": f"/data/{i}"}]})  # type: ignore
+    assert await mongo.add_files_locations([]) == []
+
+    errors = await mongo.add_files_locations([
+        ("uuid-0", [{"site": "NERSC", "path": "/nersc/0"}, {"site": "WIPAC", "path": "/data/0"}]),
+        ("uuid-1", [{"site": "NERSC", "path": "/nersc/1"}]),
+        ("uuid-2", [{"site": "WIPAC", "path": "/data/0"}]),  # belongs to uuid-0
+    ])
+    assert errors[:2] == [None, None]
+    assert errors[2] and errors[2]["code"] == DUPLICATE_KEY_ERROR_CODE
+
+    res = await mongo.get_file({"uuid": "uuid-0"})
+    assert res["locations"] == [{"site": "WIPAC", "path": "/data/0"}, {"site": "NERSC", "path": "/nersc/0"}]
+    assert "meta_modify_date" in res
+    res = await mongo.get_file({"uuid": "uuid-2"})
+    assert res["locations"] == [{"site": "WIPAC", "path": "/data/2"}]
+
+
+@pytest.mark.asyncio
+async def test_20b_pull_files_locations(mongo: Mongo) -> None:
+    """Use find_location_owners & pull_files_locations to remove locations from many files."""
+    await mongo.create_file({"uuid": "uuid-0", "locations": [{"site": "WIPAC", "path": "/data/0"}, {"site": "NERSC", "path": "/nersc/0", "archive": True}]})  # type: ignore
+    await mongo.create_file({"uuid": "uuid-1", "locations": [{"site": "WIPAC", "path": "/data/1"}]})  # type: ignore
+    assert await mongo.find_location_owners([]) == []
+
+    owners = await mongo.find_location_owners([
+        (None, "NERSC", "/nersc/0"),
+        ("uuid-1", "WIPAC", "/data/1"),
+        ("uuid-1", "WIPAC", "/data/0"),
+        (None, "OSG", "/data/0"),
+    ])
+    assert owners == [["uuid-0"], ["uuid-1"], [], []]
+
+    errors, deleted = await mongo.pull_files_locations([("uuid-0", "NERSC", "/nersc/0"), ("uuid-1", "WIPAC", "/data/1")])
+    assert errors == [None, None]
+    assert deleted == ["uuid-1"]
+    res = await mongo.get_file({"uuid": "uuid-0"})
+    assert res["locations"] == [{"site": "WIPAC", "path": "/data/0"}]
+    assert "meta_modify_date" in res
+    assert not await mongo.get_file({"uuid": "uuid-1"})
+
+    # removing a location the file doesn't have leaves it unmodified
+    errors, deleted = await mongo.pull_files_locations([("uuid-0", "OSG", "/data/0")])
+    assert (errors, deleted) == ([None], [])
+    assert await mongo.get_file({"uuid": "uuid-0"}) == res
+
+    # empty many files at once (never as `locations: []`, which the unique index allows only once)
+    await mongo.create_file({"uuid": "uuid-2", "locations": [{"site": "WIPAC", "path": "/data/2"}]})  # type: ignore
+    await mongo.create_file({"uuid": "uuid-3", "locations": [{"site": "WIPAC", "path": "/data/3"}, {"site": "NERSC", "path": "/nersc/3"}]})  # type: ignore
+    errors, deleted = await mongo.pull_files_locations([
+        ("uuid-0", "WIPAC", "/data/0"),
+        ("uuid-2", "WIPAC", "/data/2"),
+        ("uuid-3", "WIPAC", "/data/3"),
+        ("uuid-3", "NERSC", "/nersc/3"),
+    ])
+    assert errors == [None, None, None, None]
+    assert sorted(deleted) == ["uuid-0", "uuid-2", "uuid-3"]
+    assert await mongo.count_files({"uuid": {"$in": ["uuid-0", "uuid-2", "uuid-3"]}}) == 0
+
+
+def test_21a__summarize_plan() -> None:
+    """Summarize explained plans as their stages."""
+    assert Mongo._summarize_plan({"stage": "COLLSCAN"}) == ["COLLSCAN"]
+    assert Mongo._summarize_plan({
+        "stage": "LIMIT",
+        "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "uuid_1"}},
+    }) == ["IXSCAN uuid_1", "FETCH", "LIMIT"]
+    assert Mongo._summarize_plan({
+        "queryPlan": {
+            "stage": "FETCH",
+            "inputStage": {"stage": "OR", "inputStages": [
+                {"stage": "IXSCAN", "indexName": "uuid_1"},
+                {"stage": "IXSCAN", "indexName": "logical_name_1"},
+            ]},
+        },
+    }) == ["(IXSCAN uuid_1 | IXSCAN logical_name_1)", "OR", "FETCH"]
+
+
+@pytest.mark.asyncio
+async def test_21b_slow_queries(mongo: Mongo) -> None:
+    """Record slow operations in the capped 'slow_queries' collection."""
+    await mongo.create_file({"uuid": "uuid-0", "logical_name": "/data/0", "locations": [{"site": "WIPAC", "path": "/data/0"}]})  # type: ignore
+    assert await mongo.find_slow_queries(limit=10) == []
+
+    mongo.slow_query_ms = 1e-6  # everything is slow
+    mongo.slow_query_explain_percent = 100
+    await mongo.find_files({"logical_name": {"$regex": "^/data/"}}, limit=5)
+    await mongo.count_files({"uuid": "uuid-0"})
+    await asyncio.gather(*mongo._slow_query_jobs)
+    mongo.slow_query_ms = 0
+
+    slow_queries = await mongo.find_slow_queries(limit=10)
+    assert [q["operation"] for q in slow_queries] == ["count_files", "find_files"]  # newest first
+    found = slow_queries[1]
+    assert found["query_shape"] == '{"logical_name": {"$regex": "?"}}'
+    assert found["route"] is None  # not from a request
+    assert found["limit"] == 5
+    assert found["docs_returned"] == 1
+    assert found["docs_examined"] == 1
+    assert found["examined_ratio"] == 1
+    assert found["plan"][0] == "IXSCAN logical_name_1"
+
+    assert await mongo.find_slow_queries(limit=10, operation="count_files") == slow_queries[:1]
+    assert await mongo.client.slow_queries.options() == {"capped": True, "size": mongo.slow_queries_bytes}
+    assert mongo.slow_queries_recorded == 2
+
+    # a failed query is recorded, but not explained (re-run)
+    mongo.slow_query_ms = 1e-6
+    with pytest.raises(OperationFailure):
+        await mongo.count_files({"$bad": 1})
+    await asyncio.gather(*mongo._slow_query_jobs)
+    mongo.slow_query_ms = 0
+    failed = (await mongo.find_slow_queries(limit=1))[0]
+    assert failed["error"]
+    assert failed["plan"] is None
+    assert "docs_examined" not in failed
+
+
+def test_22a__read_options() -> None:
+    """Tag reads with the request's comment, and cap them by its time budget."""
+    async def in_request(time_budget_ms: Any) -> Any:
+        scope = start_request_scope("GET TestHandler", time_budget_ms)
+        assert scope.comment.startswith("file_catalog GET TestHandler ")
+        return scope.comment, Mongo._read_options(1000), Mongo._find_options()
+
+    # outside a request
+    assert Mongo._read_options() == {}
+    assert Mongo._read_options(1000) == {"maxTimeMS": 1000}
+    assert Mongo._find_options(1000) == {"max_time_ms": 1000}
+
+    comment, options, find_options = asyncio.run(in_request(None))
+    assert options == {"maxTimeMS": 1000, "comment": comment}
+    assert find_options == {"comment": comment}
+
+    comment, options, find_options = asyncio.run(in_request(60000))
+    assert options == {"maxTimeMS": 1000, "comment": comment}  # the lesser
+    assert 59000 < find_options["max_time_ms"] <= 60000
+
+    async def spent() -> None:
+        start_request_scope("GET TestHandler", 1)
+        await asyncio.sleep(0.01)
+        Mongo._read_options(1000)
+
+    with pytest.raises(ExecutionTimeout):
+        asyncio.run(spent())
+    assert Mongo._read_options() == {}  # the scope didn't leak
+
+
+@pytest.mark.asyncio
+async def test_22b_kill_request_ops(mongo: Mongo) -> None:
+    """Kill a request's reads, and cap them by its time budget."""
+    await mongo.create_file({"uuid": "uuid-0", "logical_name": "/data/0", "locations": [{"site": "WIPAC", "path": "/data/0"}]})  # type: ignore
+    slow_query = {"$where": "sleep(5000) || true"}
+    comments: List[str] = []
+
+    async def request(time_budget_ms: Any = None) -> int:
+        comments.append(start_request_scope("GET TestHandler", time_budget_ms).comment)
+        return await mongo.count_files(slow_query)
+
+    task = asyncio.create_task(request())
+    await asyncio.sleep(1)
+    assert await mongo.kill_request_ops(comments[0]) == 1
+    with pytest.raises(OperationFailure):
+        await task
+    assert await mongo.kill_request_ops(comments[0]) == 0
+
+    with pytest.raises(ExecutionTimeout):
+        await request(time_budget_ms=500)
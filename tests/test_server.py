@@ -9,6 +9,8 @@ import requests
 from requests.exceptions import HTTPError
 from rest_tools.client import RestClient
 
+from file_catalog.server import parse_time_budgets
+
 
 def _assert_httperror(exception: Exception, code: int, reason: str) -> None:
     """Assert that this is the expected HTTPError."""
@@ -58,3 +60,42 @@ async def test_04_HATEOAS(rest: RestClient) -> None:
         with pytest.raises(HTTPError) as cm:
             await rest.request(method, "/api")
         _assert_httperror(cm.value, 405, "Method Not Allowed")
+
+
+@pytest.mark.asyncio
+async def test_10_metrics(rest: RestClient, port: int) -> None:
+    """Test that route /metrics serves request metrics, in the Prometheus text format."""
+    await rest.request("GET", "/api")
+
+    res = requests.get(f"http://localhost:{port}/metrics")
+    res.raise_for_status()
+    assert res.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert 'file_catalog_request_duration_seconds_count{handler="HATEOASHandler",method="GET",status="200"}' in res.text
+    assert 'file_catalog_request_phase_duration_seconds_count{handler="HATEOASHandler",method="GET",phase="serialize"}' in res.text
+    assert 'file_catalog_requests_in_flight{handler="MetricsHandler",method="GET"} 1' in res.text
+
+
+@pytest.mark.asyncio
+async def test_11_slow_queries(rest: RestClient) -> None:
+    """Test that route /api/slow_queries lists slow operations, with their route."""
+    res = await rest.request("GET", "/api/slow_queries")
+    assert res["slow_queries"] == []
+
+    stats = await rest.request("GET", "/api/stats")
+    assert stats["slow_queries"] == {"threshold_ms": 0, "recorded": 0, "dropped": 0}
+
+    with pytest.raises(HTTPError) as cm:
+        await rest.request("GET", "/api/slow_queries", {"limit": 0})
+    _assert_httperror(cm.value, 400, "Invalid query parameter(s)")
+
+
+def test_12_parse_time_budgets() -> None:
+    """Test parsing FC_REQUEST_TIME_BUDGETS_MS."""
+    assert parse_time_budgets("") == {}
+    assert parse_time_budgets("FilesCountHandler=30000, SingleSnapshotFilesHandler=5000,") == {
+        "FilesCountHandler": 30000,
+        "SingleSnapshotFilesHandler": 5000,
+    }
+    for bad in ["FilesCountHandler", "FilesCountHandler=-1", "FilesCountHandler=1s", "NoSuchHandler=1000"]:
+        with pytest.raises(ValueError):
+            parse_time_budgets(bad)
@@ -1,11 +1,14 @@
 # test_urlargparse.py
 """Unit tests for file_catalog/urlargparse.py."""
 
+from typing import Any, Dict
+
 import pytest
 from tornado.escape import url_unescape
 
 from file_catalog.urlargparse import encode as encode
 from file_catalog.urlargparse import parse as parse
+from file_catalog.urlargparse import parse_arg, parse_cache
 
 
 def test_00_always_succeed() -> None:
@@ -225,3 +228,31 @@ def test_16_evil_input_list_reassignment() -> None:
     assert "a[]=1&a[]=2&a[]=3&a[0]=4" == url_unescape(OBJ)
     ANS = {"a": [4, 2, 3]}
     assert ANS == parse(OBJ)
+
+
+def test_20_parse_matches_parse_arg() -> None:
+    """Test that parse (in place) matches folding parse_arg (copy per argument)."""
+    OBJ = "a%5B%5D=1&a%5B%5D=2&a%5B%5D=3&a[0]=4&b[c][]=x&b[c][]=&d[0][e]=5&d[][f]=-0.5&g=hello"
+    ans: Dict[str, Any] = {}
+    for part in OBJ.split("&"):
+        ans = parse_arg(ans, part)
+    assert ans == parse(OBJ)
+
+
+def test_21_parse_cache() -> None:
+    """Test that a cached parse can't be modified by the caller."""
+    OBJ = "keys[]=uuid&keys[]=logical_name&query[run.run_number]=12345&limit=10"
+    hits = parse_cache.hits
+
+    first = parse(OBJ)
+    first["keys"].append("locations")
+    first.pop("limit")
+
+    second = parse(OBJ)
+    assert parse_cache.hits == hits + 1
+    assert second == {"keys": ["uuid", "logical_name"], "query": {"run.run_number": 12345}, "limit": 10}
+
+    # a bad query string is never cached
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            parse("keys[]=uuid&limit")
@@ -0,0 +1,67 @@
+# test_utils.py
+"""Unit tests for file_catalog/utils.py."""
+
+import pytest
+
+from file_catalog import utils
+
+
+def test_00_always_succeed() -> None:
+    """Succeed with flying colors."""
+    assert True
+
+
+def test_10_get_val_in_dict_dotted() -> None:
+    """Test get_val_in_dict_dotted."""
+    dicto = {"logical_name": "/foo", "checksum": {"sha512": "abc"}}
+    assert utils.get_val_in_dict_dotted("logical_name", dicto) == "/foo"
+    assert utils.get_val_in_dict_dotted("checksum.sha512", dicto) == "abc"
+    for field in ["uuid", "checksum.md5", "logical_name.foo"]:
+        with pytest.raises(utils.DottedKeyError):
+            utils.get_val_in_dict_dotted(field, dicto)
+
+
+def test_20_query_shape() -> None:
+    """Test query_shape."""
+    assert utils.query_shape({}) == {}
+    assert utils.query_shape({"uuid": "abc"}) == {"uuid": "?"}
+    assert utils.query_shape({"run.run_number": {"$in": [1, 2, 3]}}) == {"run.run_number": {"$in": ["?"]}}
+
+    # same shape, regardless of values & field order
+    assert utils.query_shape({"a": 1, "b": {"$lte": 5}}) == utils.query_shape({"b": {"$lte": 9}, "a": "x"})
+    assert utils.query_shape({"a": 1}) != utils.query_shape({"a": {"$ne": 1}})
+
+    # nested logical operators
+    assert utils.query_shape({"$or": [{"a": 1}, {"a": 2}, {"b": 3}]}) == {"$or": [{"a": "?"}, {"b": "?"}]}
+
+
+def test_30_escape_regex() -> None:
+    """Test escape_regex."""
+    assert utils.escape_regex("/data/exp/IceCube/2020/") == "/data/exp/IceCube/2020/"
+    assert utils.escape_regex("my-file.i3.zst") == r"my-file\.i3\.zst"
+    assert utils.escape_regex("a(b)[c]{d}^$|?*+\\") == r"a\(b\)\[c\]\{d\}\^\$\|\?\*\+\\"
+
+
+def test_40_regex_literal_prefix() -> None:
+    """Test regex_literal_prefix."""
+    assert utils.regex_literal_prefix(r"^/data/exp/") == "/data/exp/"
+    assert utils.regex_literal_prefix(r"^/data/exp/IceCube/2020/(.*/)?f\.txt$") == "/data/exp/IceCube/2020/"
+    assert utils.regex_literal_prefix(r"^/data/exp\.v2") == "/data/exp.v2"
+    assert utils.regex_literal_prefix(r"^/data/exps?/") == "/data/exp"
+    # not anchored
+    assert utils.regex_literal_prefix(r"/data/exp/") == ""
+    assert utils.regex_literal_prefix(r"^.*/data/exp/") == ""
+    assert utils.regex_literal_prefix(r"^\d+") == ""
+    assert utils.regex_literal_prefix(r"^/data|^/mnt") == ""
+    assert utils.regex_literal_prefix(r"^/data/exp/", options="i") == ""
+
+
+def test_50_find_unanchored_regexes() -> None:
+    """Test find_unanchored_regexes."""
+    assert not utils.find_unanchored_regexes({"logical_name": "/data/exp/foo"})
+    assert not utils.find_unanchored_regexes({"logical_name": {"$regex": "^/data/exp/"}})
+    query = {
+        "logical_name": {"$regex": "^/"},
+        "$or": [{"a": {"$regex": "^/data/"}}, {"b": {"$regex": "x"}}],
+    }
+    assert utils.find_unanchored_regexes(query) == ["^/", "x"]